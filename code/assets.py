@@ -0,0 +1,183 @@
+from settings import *
+from collections.abc import Mapping
+from support import *
+
+# Danh sách tài nguyên mỗi màn chơi cần: màn chơi -> {nhóm tài nguyên: các khóa}
+# Tài nguyên chỉ được tải khi được truy cập lần đầu, manifest dùng để đếm tham chiếu và giải phóng khi đổi màn chơi
+STAGE_ASSETS = {
+    'level': {
+        'level_frames': ('flag', 'saw', 'floor_spike', 'palms', 'candle', 'window', 'big_chain', 'small_chain',
+                         'candle_light', 'player', 'saw_chain', 'helicopter', 'boat', 'spike', 'spike_chain', 'tooth',
+                         'shell', 'pearl', 'items', 'particle', 'water_top', 'water_body', 'bg_tiles', 'cloud_small',
+                         'cloud_large', 'fly'),
+    },
+    'overworld': {
+        'overworld_frames': ('palms', 'water', 'path', 'icon'),
+    },
+}
+
+
+def directional(frames):
+    """
+    Chuẩn bị khung hình của đối tượng đổi hướng: lật sẵn và tạo sẵn bóng trắng (hiệu ứng nhận sát thương)
+        cho cả khung hình gốc và khung hình đã lật
+        :param frames: Danh sách khung hình hoặc từ điển các danh sách khung hình
+        :return: Chính `frames`
+    """
+    silhouette_frames(frames)
+    silhouette_frames(flip_frames(frames))
+    return frames
+
+
+def inverted(frames):
+    """
+    Lật dọc sẵn khung hình của các đối tượng có thể treo ngược (gai trên trần)
+        :param frames: Danh sách khung hình
+        :return: Chính `frames`
+    """
+    flip_frames(frames, False, True)
+    return frames
+
+
+# nhóm tài nguyên -> {khóa: hàm tải}
+ASSET_LOADERS = {
+    'level_frames': {
+        'flag': lambda: import_folder('.', 'graphics', 'level', 'flag'),
+        'saw': lambda: import_folder('.', 'graphics', 'enemies', 'saw', 'animation'),
+        'floor_spike': lambda: inverted(import_folder('.', 'graphics', 'enemies', 'floor_spikes')),
+        'palms': lambda: import_sub_folders('.', 'graphics', 'level', 'palms'),
+        'candle': lambda: import_folder('.', 'graphics', 'level', 'candle'),
+        'window': lambda: import_folder('.', 'graphics', 'level', 'window'),
+        'big_chain': lambda: import_folder('.', 'graphics', 'level', 'big_chains'),
+        'small_chain': lambda: import_folder('.', 'graphics', 'level', 'small_chains'),
+        'candle_light': lambda: import_folder('.', 'graphics', 'level', 'candle light'),
+        'player': lambda: directional(import_sub_folders('.', 'graphics', 'player')),
+        'saw_chain': lambda: import_image('.', 'graphics', 'enemies', 'saw', 'saw_chain'),
+        'helicopter': lambda: import_folder('.', 'graphics', 'level', 'helicopter'),
+        'boat': lambda: import_folder('.', 'graphics', 'objects', 'boat'),
+        'spike': lambda: import_image('.', 'graphics', 'enemies', 'spike_ball', 'Spiked Ball'),
+        'spike_chain': lambda: import_image('.', 'graphics', 'enemies', 'spike_ball', 'spiked_chain'),
+        'tooth': lambda: directional(import_folder('.', 'graphics', 'enemies', 'tooth', 'run')),
+        'shell': lambda: directional(import_sub_folders('.', 'graphics', 'enemies', 'shell')),
+        'pearl': lambda: import_image('.', 'graphics', 'enemies', 'bullets', 'pearl'),
+        'items': lambda: import_sub_folders('.', 'graphics', 'items'),
+        'particle': lambda: import_folder('.', 'graphics', 'effects', 'particle'),
+        'water_top': lambda: import_folder('.', 'graphics', 'level', 'water', 'top'),
+        'water_body': lambda: import_image('.', 'graphics', 'level', 'water', 'body'),
+        'bg_tiles': lambda: import_folder_dict('.', 'graphics', 'level', 'bg', 'tiles'),
+        'cloud_small': lambda: import_folder('.', 'graphics', 'level', 'clouds', 'small'),
+        'cloud_large': lambda: import_image('.', 'graphics', 'level', 'clouds', 'large_cloud'),
+        'fly': lambda: directional(import_folder('.', 'graphics', 'enemies', 'fly', 'fly')),
+    },
+    'overworld_frames': {
+        'palms': lambda: import_folder('.', 'graphics', 'overworld', 'palm'),
+        'water': lambda: import_folder('.', 'graphics', 'overworld', 'water'),
+        'path': lambda: import_folder_dict('.', 'graphics', 'overworld', 'path'),
+        'icon': lambda: import_sub_folders('.', 'graphics', 'overworld', 'icon'),
+    },
+}
+
+
+class AssetManager:
+    """
+    Quản lý việc tải tài nguyên theo yêu cầu và bộ nhớ đệm có đếm tham chiếu
+    Mỗi tài nguyên (nhóm, khóa) chỉ được tải khi được truy cập lần đầu. Khi một màn chơi bắt đầu, các tài nguyên trong
+        manifest của nó được tăng số tham chiếu; khi màn chơi kết thúc, số tham chiếu giảm và tài nguyên không còn
+        được màn chơi nào dùng sẽ bị xóa khỏi bộ nhớ đệm
+    * Phương thức
+    `get(group, key)`: Lấy tài nguyên, tải nếu chưa có
+    `view(group)`: Lấy từ điển (chỉ đọc) của một nhóm tài nguyên, tải từng khóa khi được truy cập
+    `acquire(stage)`: Tăng số tham chiếu của các tài nguyên mà màn chơi cần
+    `release(stage)`: Giảm số tham chiếu và giải phóng các tài nguyên không còn được dùng
+    """
+    def __init__(self, loaders=ASSET_LOADERS, manifest=STAGE_ASSETS):
+        """
+        Hàm khởi tạo
+            :param loaders: Từ điển nhóm tài nguyên -> {khóa: hàm tải}
+            :param manifest: Từ điển màn chơi -> {nhóm tài nguyên: các khóa}
+        """
+        self.loaders = loaders
+        self.manifest = manifest
+        # (nhóm, khóa) -> tài nguyên đã tải
+        self.cache = {}
+        # (nhóm, khóa) -> số màn chơi đang dùng tài nguyên
+        self.refs = {}
+        self.views = {group: AssetView(self, group) for group in loaders}
+
+    def get(self, group, key):
+        """
+        Lấy tài nguyên, tải nếu chưa có trong bộ nhớ đệm
+            :param group: Nhóm tài nguyên (ví dụ 'level_frames')
+            :param key: Khóa của tài nguyên trong nhóm
+            :return: Tài nguyên với cùng kiểu như khi tải trực tiếp (bề mặt, danh sách hoặc từ điển)
+        """
+        asset = self.cache.get((group, key))
+        if asset is None:
+            asset = self.cache[(group, key)] = self.loaders[group][key]()
+        return asset
+
+    def view(self, group):
+        """
+        Lấy từ điển chỉ đọc của một nhóm tài nguyên
+            :param group: Nhóm tài nguyên
+            :return: Đối tượng AssetView
+        """
+        return self.views[group]
+
+    def entries(self, stage):
+        """
+        Liệt kê các tài nguyên trong manifest của màn chơi
+            :param stage: Tên màn chơi ('level' hoặc 'overworld')
+            :return: Generator các tuple (nhóm, khóa)
+        """
+        for group, keys in self.manifest[stage].items():
+            for key in keys:
+                yield group, key
+
+    def acquire(self, stage):
+        """
+        Tăng số tham chiếu của các tài nguyên mà màn chơi cần. Tài nguyên vẫn chỉ được tải khi được truy cập
+            :param stage: Tên màn chơi
+        """
+        for entry in self.entries(stage):
+            self.refs[entry] = self.refs.get(entry, 0) + 1
+
+    def release(self, stage):
+        """
+        Giảm số tham chiếu của các tài nguyên của màn chơi, tài nguyên không còn được dùng sẽ bị xóa khỏi bộ nhớ đệm
+            cùng với các bề mặt được tạo ra từ nó (khung hình đã lật, bóng trắng)
+            :param stage: Tên màn chơi
+        """
+        for entry in self.entries(stage):
+            self.refs[entry] -= 1
+            if self.refs[entry] <= 0:
+                del self.refs[entry]
+                asset = self.cache.pop(entry, None)
+                if asset is not None:
+                    forget_frames(asset)
+
+
+class AssetView(Mapping):
+    """
+    Từ điển chỉ đọc của một nhóm tài nguyên, dùng thay cho `level_frames`/`overworld_frames` được tải sẵn
+    Mỗi khóa được tải khi được truy cập lần đầu thông qua AssetManager
+    """
+    def __init__(self, manager, group):
+        """
+        Hàm khởi tạo
+            :param manager: Đối tượng AssetManager
+            :param group: Nhóm tài nguyên
+        """
+        self.manager = manager
+        self.group = group
+
+    def __getitem__(self, key):
+        if key not in self.manager.loaders[self.group]:
+            raise KeyError(key)
+        return self.manager.get(self.group, key)
+
+    def __iter__(self):
+        return iter(self.manager.loaders[self.group])
+
+    def __len__(self):
+        return len(self.manager.loaders[self.group])
@@ -0,0 +1,199 @@
+"""
+Gom (pack) ảnh của thư mục graphics/ thành các texture atlas
+Mỗi thư mục chứa ảnh được gom thành một sprite sheet, vị trí của từng ảnh và cấu trúc thư mục được lưu trong index.json
+    để các hàm import_* trong support.py có thể cắt lại ảnh (subsurface) từ sheet mà không cần đọc từng file
+Chạy từ thư mục gốc của project để tạo lại atlas mỗi khi thay đổi ảnh:
+    python code/atlas.py
+Index lưu thời gian sửa và mã băm của từng ảnh gốc, nếu ảnh bị sửa, thêm hoặc xóa mà chưa tạo lại atlas
+    thì atlas bị bỏ qua và game đọc ảnh trực tiếp từ thư mục
+"""
+import os
+import json
+from settings import *
+from support import file_hash, is_fresh
+from os import walk, makedirs
+from os.path import join, normpath, exists
+
+ATLAS_DIR = join('.', 'data', 'cache', 'atlas')
+ATLAS_VERSION = 1
+# Chiều rộng tối đa của một hàng ảnh trong sheet (trừ khi có ảnh rộng hơn)
+SHEET_WIDTH = 2048
+
+
+def folder_key(path):
+    """
+    Chuẩn hóa đường dẫn thư mục/ảnh thành khóa dùng trong index
+        :param path: Đường dẫn (ví dụ './graphics/player')
+        :return: Khóa dạng 'graphics/player'
+    """
+    return normpath(path).replace(os.sep, '/')
+
+
+def walk_folders(folders, path):
+    """
+    Duyệt thư mục giống `os.walk` (từ trên xuống, cùng thứ tự) dựa trên thông tin thư mục của một index
+        :param folders: Từ điển khóa thư mục -> {'sub_folders': [...], 'images': {...}}
+        :param path: Đường dẫn thư mục gốc
+        :return: Generator các tuple (đường dẫn thư mục, danh sách thư mục con, danh sách tên ảnh)
+    """
+    key = folder_key(path)
+    folder = folders.get(key)
+    if folder is None:
+        return
+    yield key, folder['sub_folders'], list(folder['images'])
+    for sub_folder in folder['sub_folders']:
+        yield from walk_folders(folders, f'{key}/{sub_folder}')
+
+
+def fingerprint(source):
+    """
+    Ghi lại trạng thái các ảnh gốc để phát hiện ảnh bị sửa sau khi tạo atlas/bundle
+        :param source: Thư mục ảnh gốc
+        :return: Từ điển khóa ảnh -> [thời gian sửa, mã băm]
+    """
+    sources = {}
+    for folder_path, _, file_names in walk(source):
+        for name in file_names:
+            if name.endswith('.png'):
+                key = folder_key(join(folder_path, name))
+                sources[key] = [os.stat(key).st_mtime_ns, file_hash(key)]
+    return sources
+
+
+def sources_fresh(sources, source):
+    """
+    Kiểm tra các ảnh gốc còn khớp với lúc tạo atlas/bundle hay không (không ảnh nào bị sửa, thêm hoặc xóa)
+        :param sources: Trạng thái ảnh gốc lưu trong index (kết quả của `fingerprint`), None với index cũ
+        :param source: Thư mục ảnh gốc
+        :return: True nếu có thể dùng atlas/bundle
+    """
+    if sources is None:
+        return False
+    names = {folder_key(join(folder_path, name))
+             for folder_path, _, file_names in walk(source) for name in file_names if name.endswith('.png')}
+    return names == sources.keys() and is_fresh(sources)
+
+
+def pack(sizes, max_width=SHEET_WIDTH):
+    """
+    Sắp xếp các ảnh vào sheet theo từng hàng (shelf packing), ảnh cao hơn được xếp trước
+        :param sizes: Danh sách kích thước (rộng, cao) của các ảnh
+        :param max_width: Chiều rộng tối đa của một hàng
+        :return: Tuple (danh sách vị trí (x, y) theo thứ tự của `sizes`, kích thước sheet)
+    """
+    max_width = max([max_width] + [width for width, _ in sizes])
+    positions = [None] * len(sizes)
+    x = y = shelf_height = sheet_width = 0
+    for index in sorted(range(len(sizes)), key=lambda index: -sizes[index][1]):
+        width, height = sizes[index]
+        if x + width > max_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions[index] = (x, y)
+        x += width
+        shelf_height = max(shelf_height, height)
+        sheet_width = max(sheet_width, x)
+    return positions, (sheet_width, y + shelf_height)
+
+
+def build(source=join('.', 'graphics'), target=ATLAS_DIR):
+    """
+    Tạo các sprite sheet và file index cho tất cả thư mục ảnh trong `source`
+    Thứ tự thư mục con và ảnh được giữ đúng như `os.walk` để các hàm import_* trả về kết quả giống hệt khi đọc từng file
+        :param source: Thư mục ảnh gốc
+        :param target: Thư mục lưu atlas
+        :return: Tuple (số thư mục, số ảnh đã gom)
+    """
+    makedirs(target, exist_ok=True)
+    folders = {}
+    image_count = 0
+    for folder_path, sub_folders, file_names in walk(source):
+        key = folder_key(folder_path)
+        image_names = [name for name in file_names if name.endswith('.png')]
+        folder = {'sub_folders': sub_folders, 'sheet': None, 'images': {}}
+        folders[key] = folder
+        if not image_names:
+            continue
+
+        surfs = [pygame.image.load(join(folder_path, name)) for name in image_names]
+        positions, size = pack([surf.get_size() for surf in surfs])
+        sheet = pygame.Surface(size, pygame.SRCALPHA)
+        for name, surf, pos in zip(image_names, surfs, positions):
+            sheet.blit(surf, pos)
+            folder['images'][name] = [*pos, *surf.get_size()]
+        folder['sheet'] = key.replace('/', '__') + '.png'
+        pygame.image.save(sheet, join(target, folder['sheet']))
+        image_count += len(image_names)
+
+    with open(join(target, 'index.json'), 'w') as file:
+        json.dump({'version': ATLAS_VERSION, 'folders': folders, 'sources': fingerprint(source)}, file)
+    return len(folders), image_count
+
+
+class Atlas:
+    """
+    Đọc các sprite sheet được tạo bởi `build` và cắt lại ảnh gốc dưới dạng subsurface
+    Mỗi sheet chỉ được đọc một lần khi có ảnh đầu tiên trong thư mục đó được yêu cầu
+    * Phương thức
+    `load(directory, source)`: Đọc index của atlas, trả về None nếu chưa tạo atlas hoặc ảnh gốc đã thay đổi
+    `walk(path)`: Duyệt thư mục giống `os.walk` nhưng dựa trên index
+    `image(path)`: Lấy ảnh theo đường dẫn file gốc
+    """
+    def __init__(self, directory, folders):
+        """
+        Hàm khởi tạo
+            :param directory: Thư mục chứa atlas
+            :param folders: Thông tin các thư mục đọc từ index
+        """
+        self.directory = directory
+        self.folders = folders
+        # khóa thư mục -> sprite sheet đã đọc
+        self.sheets = {}
+
+    @classmethod
+    def load(cls, directory=ATLAS_DIR, source=join('.', 'graphics')):
+        """
+        Đọc index của atlas
+            :param directory: Thư mục chứa atlas
+            :param source: Thư mục ảnh gốc dùng để kiểm tra atlas còn mới hay không
+            :return: Đối tượng Atlas, hoặc None nếu chưa có atlas, atlas được tạo bởi phiên bản khác
+                hoặc ảnh gốc đã thay đổi sau khi tạo atlas
+        """
+        index_path = join(directory, 'index.json')
+        if not exists(index_path):
+            return None
+        with open(index_path) as file:
+            index = json.load(file)
+        if index.get('version') != ATLAS_VERSION or not sources_fresh(index.get('sources'), source):
+            return None
+        return cls(directory, index['folders'])
+
+    def __contains__(self, path):
+        return folder_key(path) in self.folders
+
+    def walk(self, path):
+        """
+        Duyệt thư mục giống `os.walk` (từ trên xuống, cùng thứ tự) nhưng không đọc ổ đĩa
+            :param path: Đường dẫn thư mục gốc
+            :return: Generator các tuple (đường dẫn thư mục, danh sách thư mục con, danh sách tên ảnh)
+        """
+        return walk_folders(self.folders, path)
+
+    def image(self, path):
+        """
+        Lấy ảnh theo đường dẫn file gốc
+            :param path: Đường dẫn file ảnh (ví dụ './graphics/player/idle/0.png')
+            :return: Subsurface của sheet, hoặc None nếu ảnh không có trong atlas
+        """
+        key, _, name = folder_key(path).rpartition('/')
+        folder = self.folders.get(key)
+        if folder is None or name not in folder['images']:
+            return None
+        sheet = self.sheets.get(key)
+        if sheet is None:
+            sheet = self.sheets[key] = pygame.image.load(join(self.directory, folder['sheet'])).convert_alpha()
+        return sheet.subsurface(folder['images'][name])
+
+
+if __name__ == '__main__':
+    folder_count, image_count = build()
+    print(f'packed {image_count} images from {folder_count} folders into {ATLAS_DIR}')
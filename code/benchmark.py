@@ -0,0 +1,636 @@
+"""
+Các bài đo hiệu năng của Jump Pirate
+Chạy từ thư mục gốc của project (để các đường dẫn './graphics', './data' hoạt động):
+    python code/benchmark.py            # chạy tất cả bài đo
+    python code/benchmark.py draw       # chỉ chạy bài đo 'draw'
+Mặc định dùng driver hình ảnh/âm thanh 'dummy' nên có thể chạy mà không cần cửa sổ
+"""
+import os
+import sys
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from time import perf_counter
+from settings import *
+
+
+def create_game():
+    """
+    Tạo đối tượng Game (khởi tạo pygame, cửa sổ và toàn bộ tài nguyên)
+        :return: Đối tượng Game
+    """
+    from main import Game
+    return Game()
+
+
+def timed(func, frames):
+    """
+    Đo thời gian trung bình của một hàm
+        :param func: Hàm cần đo, không nhận tham số
+        :param frames: Số lần gọi
+        :return: Thời gian trung bình mỗi lần gọi (ms)
+    """
+    start = perf_counter()
+    for _ in range(frames):
+        func()
+    return (perf_counter() - start) / frames * 1000
+
+
+def bench_draw(frames=300):
+    """
+    Đo thời gian vẽ một frame của từng level và số sprite được vẽ / bị bỏ qua nhờ culling theo camera
+        :param frames: Số frame đo cho mỗi level
+    """
+    game = create_game()
+    dt = 1 / 60
+    for level_index in sorted(game.tmx_maps):
+        game.data.current_level = level_index
+        game.switch_stage('level')
+        level = game.current_stage
+        draw_time = timed(lambda: level.all_sprites.draw(level.player.hitbox_rect.center, dt), frames)
+        print(f'level {level_index}: {len(level.all_sprites)} sprites, '
+              f'drawn {level.all_sprites.drawn_count}, culled {level.all_sprites.culled_count}, '
+              f'draw {draw_time:.3f} ms/frame')
+
+
+def bench_chunks(repeat=20):
+    """
+    Đo chi phí vẽ sẵn (bake) các chunk nền tĩnh lúc load level: số tile, số chunk được tạo và thời gian bake
+        :param repeat: Số lần bake để lấy thời gian trung bình
+    """
+    from level import Level
+    from support import bake_chunks
+    game = create_game()
+    for level_index, tmx_map in sorted(game.tmx_maps.items()):
+        layers = {Z_LAYERS['bg tiles']: [], Z_LAYERS['main']: []}
+        for layer in ['BG', 'Terrain', 'FG', 'Platforms']:
+            z = Z_LAYERS['bg tiles'] if layer in ('BG', 'FG') else Z_LAYERS['main']
+            layers[z].extend(tmx_map.get_layer_by_name(layer).tiles())
+        tiles = sum(len(tiles) for tiles in layers.values())
+        chunks = sum(len(bake_chunks(tiles)) for tiles in layers.values())
+        bake_time = timed(lambda: [bake_chunks(tiles) for tiles in layers.values()], repeat)
+        setup_time = timed(lambda: Level(tmx_map, game.level_frames, game.audio_files, game.data, game.switch_stage),
+                           repeat)
+        print(f'level {level_index}: {tiles} tiles -> {chunks} chunks, '
+              f'bake {bake_time:.2f} ms, Level() {setup_time:.2f} ms')
+
+
+def bench_layers(sizes=(1000, 10000, 50000), frames=20):
+    """
+    So sánh cách tạo thứ tự vẽ cũ (`sorted(group, key=z)` cả nhóm mỗi frame) với `LayeredGroup.draw_order`, chỉ sắp
+        xếp các sprite trong vùng camera
+    Mỗi kích thước tạo một nhóm sprite với z ngẫu nhiên trong Z_LAYERS, xếp thành lưới rộng 200 ô (khoảng 200 sprite
+        trong camera), chỉ đo phần tạo thứ tự vẽ (không blit)
+        :param sizes: Các số lượng sprite cần đo
+        :param frames: Số frame đo cho mỗi kích thước
+    """
+    from random import choice
+    from groups import LayeredGroup
+    from sprites import Sprite
+    pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE))
+    camera_rect = pygame.FRect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+    for size in sizes:
+        group = LayeredGroup()
+        for index in range(size):
+            Sprite(((index % 200) * TILE_SIZE, (index // 200) * TILE_SIZE), surf, group, choice(list(Z_LAYERS.values())))
+        group.refresh()
+
+        def sorted_order():
+            for sprite in sorted(group, key=lambda sprite: sprite.z):
+                pass
+
+        def camera_order():
+            for sprite in group.draw_order(camera_rect):
+                pass
+
+        print(f'{size} sprites ({len(group.draw_order(camera_rect))} near camera): '
+              f'sorted {timed(sorted_order, frames):.3f} ms, draw_order {timed(camera_order, frames):.3f} ms')
+
+
+def bench_blits(frames=300):
+    """
+    So sánh hai cách vẽ của AllSprites trên từng level: blit từng sprite và vẽ theo lô bằng `fblits`
+        :param frames: Số frame đo cho mỗi cách vẽ
+    """
+    game = create_game()
+    dt = 1 / 60
+    for level_index in sorted(game.tmx_maps):
+        game.data.current_level = level_index
+        game.switch_stage('level')
+        level = game.current_stage
+        results = {}
+        for batched in (False, True):
+            level.all_sprites.batched = batched
+            results[batched] = timed(lambda: level.all_sprites.draw(level.player.hitbox_rect.center, dt), frames)
+        print(f'level {level_index}: {level.all_sprites.drawn_count} drawn, '
+              f'blit {results[False]:.3f} ms, fblits {results[True]:.3f} ms')
+
+
+def bench_dirty(frames=600):
+    """
+    Đo chế độ dirty rect của overworld khi người chơi đứng yên: tỉ lệ số frame phải cập nhật toàn màn hình,
+        diện tích trung bình được cập nhật và thời gian `pygame.display.update` so với cập nhật toàn màn hình
+        :param frames: Số frame đo
+    """
+    game = create_game()
+    dt = 1 / 60
+    game.switch_stage('overworld')
+    overworld = game.current_stage
+    overworld.all_sprites.track_dirty = True
+    screen_area = WINDOW_WIDTH * WINDOW_HEIGHT
+    full_frames, area, update_time = 0, 0, 0
+    for _ in range(frames):
+        overworld.run(dt)
+        game.ui.update(dt)
+        rects = overworld.dirty_rects + [game.ui.rect]
+        if overworld.dirty_rects and overworld.dirty_rects[0].size == (WINDOW_WIDTH, WINDOW_HEIGHT):
+            full_frames += 1
+        area += sum(rect.w * rect.h for rect in rects)
+        start = perf_counter()
+        pygame.display.update(rects)
+        update_time += perf_counter() - start
+    full_time = timed(pygame.display.update, frames)
+    print(f'{full_frames}/{frames} full frames, avg area {area / frames / screen_area:.1%} of screen, '
+          f'update(rects) {update_time / frames * 1000:.3f} ms, update() {full_time:.3f} ms')
+
+
+def bench_water(frames=300):
+    """
+    So sánh overworld khi nước được vẽ bằng một lớp `TiledWater` và khi mỗi ô nước là một AnimatedSprite (cách cũ):
+        số sprite, thời gian cập nhật và thời gian vẽ mỗi frame
+        :param frames: Số frame đo cho mỗi cách
+    """
+    from sprites import AnimatedSprite
+    game = create_game()
+    dt = 1 / 60
+    game.switch_stage('overworld')
+    overworld = game.current_stage
+    all_sprites = overworld.all_sprites
+    tmx_map = game.tmx_overworld
+
+    def measure(name):
+        update_time = timed(lambda: all_sprites.update(dt), frames)
+        draw_time = timed(lambda: all_sprites.draw(overworld.icon.rect.center), frames)
+        print(f'{name}: {len(all_sprites)} sprites, update {update_time:.3f} ms, draw {draw_time:.3f} ms')
+
+    measure('tiled water')
+    water, all_sprites.water = all_sprites.water, None
+    tiles = [AnimatedSprite((col * TILE_SIZE, row * TILE_SIZE), game.overworld_frames['water'], all_sprites,
+                            Z_LAYERS['bg']) for col in range(tmx_map.width) for row in range(tmx_map.height)]
+    measure('sprite per tile')
+    for sprite in tiles:
+        sprite.kill()
+    all_sprites.water = water
+
+
+def bench_flicker(frames=300):
+    """
+    So sánh thời gian cập nhật người chơi khi bình thường và khi đang nhấp nháy sau khi nhận sát thương
+        (bóng trắng lấy từ bộ nhớ đệm), cùng chi phí tạo mask mỗi frame như cách cũ
+        :param frames: Số frame đo cho mỗi trường hợp
+    """
+    game = create_game()
+    dt = 1 / 60
+    game.switch_stage('level')
+    player = game.current_stage.player
+    normal_time = timed(lambda: player.update(dt), frames)
+    player.timers['hit'].duration = 10 ** 9
+    player.timers['hit'].activate()
+    flicker_time = timed(lambda: player.update(dt), frames)
+
+    def mask_flicker():
+        white_surf = pygame.mask.from_surface(player.image).to_surface()
+        white_surf.set_colorkey('black')
+
+    mask_time = timed(mask_flicker, frames)
+    print(f'player update: normal {normal_time:.3f} ms, hit {flicker_time:.3f} ms, '
+          f'mask per frame (old) +{mask_time:.3f} ms')
+
+
+def bench_images(repeat=5):
+    """
+    So sánh các nguồn ảnh khi khởi động: đọc từng file PNG, cắt từ texture atlas và tạo từ bundle đã giải mã sẵn
+    Mỗi lần đo gọi `Game.import_assets` rồi tải toàn bộ level_frames và overworld_frames, chỉ tính thời gian tải ảnh
+        (không tính âm thanh). Atlas và bundle cần được tạo trước bằng `python code/atlas.py`, `python code/bundle.py`
+        :param repeat: Số lần đo cho mỗi nguồn ảnh
+    """
+    import main
+    import support
+    game = create_game()
+    image_load = pygame.image.load
+    loads = 0
+
+    def counted_load(*args, **kwargs):
+        nonlocal loads
+        loads += 1
+        return image_load(*args, **kwargs)
+
+    pygame.image.load = counted_load
+    try:
+        for name, use_atlas, use_bundle in (('png files', False, False), ('atlas', True, False), ('bundle', False, True)):
+            main.USE_ATLAS, main.USE_BUNDLE = use_atlas, use_bundle
+            game.import_assets()
+            if (use_atlas or use_bundle) and support.image_source is None:
+                print(f'{name}: not built, run python code/{name}.py')
+                continue
+            loads, load_time = 0, 0
+            for _ in range(repeat):
+                game.import_assets()
+                start = perf_counter()
+                for frames in (game.level_frames, game.overworld_frames):
+                    for key in frames:
+                        frames[key]
+                load_time += perf_counter() - start
+            print(f'{name}: {loads // repeat} image files, load all frames {load_time / repeat * 1000:.1f} ms')
+    finally:
+        pygame.image.load = image_load
+        main.USE_ATLAS, main.USE_BUNDLE = USE_ATLAS, USE_BUNDLE
+
+
+def bench_startup(repeat=5):
+    """
+    Đo thời gian từ lúc tạo Game đến khi vẽ xong frame đầu tiên, và số tài nguyên đã được tải
+        so với tổng số tài nguyên trong manifest
+        :param repeat: Số lần đo
+    """
+    def first_frame():
+        game = create_game()
+        game.current_stage.run(1 / 60)
+        game.ui.update(1 / 60)
+        return game
+
+    game = first_frame()
+    start_time = timed(first_frame, repeat)
+    total = sum(len(loaders) for loaders in game.assets.loaders.values())
+    print(f'first frame {start_time:.1f} ms, {len(game.assets.cache)}/{total} assets loaded')
+
+
+def bench_maps(repeat=5):
+    """
+    So sánh thời gian tải bản đồ: phân tích TMX bằng `load_pygame` và tải bản đã biên dịch bằng `load_map`
+    Lần biên dịch đầu tiên (cold) được đo riêng bằng một thư mục cache tạm
+        :param repeat: Số lần đo
+    """
+    from tempfile import TemporaryDirectory
+    from pytmx.util_pygame import load_pygame
+    from tilemap import load_map, map_files
+    create_game()
+    paths = map_files()
+    with TemporaryDirectory() as cache_dir:
+        cold_time = timed(lambda: [load_map(path, cache_dir) for path in paths], 1)
+        warm_time = timed(lambda: [load_map(path, cache_dir) for path in paths], repeat)
+    tmx_time = timed(lambda: [load_pygame(path) for path in paths], repeat)
+    print(f'{len(paths)} maps: load_pygame {tmx_time:.1f} ms, '
+          f'load_map cold {cold_time:.1f} ms, warm {warm_time:.1f} ms')
+
+
+def bench_tilesets():
+    """
+    Đo bộ nhớ bề mặt tile của tất cả bản đồ (các màn chơi và overworld): mỗi bản đồ tải tileset riêng bằng
+        `load_pygame` so với `load_map` dùng chung bề mặt tile giữa các bản đồ
+    """
+    from pytmx.util_pygame import load_pygame
+    from tilemap import load_map, map_files
+
+    def surface_bytes(surfs):
+        return sum(surf.get_pitch() * surf.get_height() for surf in {id(surf): surf for surf in surfs}.values())
+
+    def tile_surfaces(tile_map):
+        return [image for image in tile_map.images if image]
+
+    create_game()
+    paths = map_files()
+    pytmx_bytes = sum(surface_bytes(tile_surfaces(load_pygame(path))) for path in paths)
+    maps = [load_map(path) for path in paths]
+    separate_bytes = sum(surface_bytes(tile_surfaces(tile_map)) for tile_map in maps)
+    shared_bytes = surface_bytes([surf for tile_map in maps for surf in tile_surfaces(tile_map)])
+    print(f'{len(paths)} maps: load_pygame {pytmx_bytes / 1024:.0f} KB, '
+          f'load_map {separate_bytes / 1024:.0f} KB without sharing, {shared_bytes / 1024:.0f} KB shared '
+          f'(saved {(separate_bytes - shared_bytes) / 1024:.0f} KB)')
+
+
+def bench_registry(level_count=30, switches=200):
+    """
+    Đo bộ nhớ đệm bản đồ của LevelRegistry với nhiều màn chơi: các file TMX hiện có được sao chép thành
+        `level_count` màn chơi trong một thư mục tạm cạnh data/levels (để đường dẫn tileset vẫn đúng),
+        sau đó chuyển ngẫu nhiên giữa các màn chơi, ưu tiên các màn chơi gần nhau như khi chơi thật
+        :param level_count: Số màn chơi
+        :param switches: Số lần chuyển màn chơi
+    """
+    import random
+    from shutil import copyfile
+    from tempfile import TemporaryDirectory
+    from registry import LevelRegistry
+    from tilemap import read_map, level_files
+    create_game()
+    random.seed(0)
+    sources = level_files()
+    with TemporaryDirectory(dir=os.path.join('.', 'data')) as level_dir, TemporaryDirectory() as cache_dir:
+        for index in range(level_count):
+            copyfile(sources[index % len(sources)], os.path.join(level_dir, f'{index + 1}.tmx'))
+        registry = LevelRegistry(level_dir, reader=lambda path: read_map(path, cache_dir))
+        level, peak = 0, 0
+        start = perf_counter()
+        for _ in range(switches):
+            level = min(max(level + random.choice((-1, 0, 0, 1, 1)), 0), level_count - 1)
+            registry[level]
+            peak = max(peak, registry.memory())
+        switch_time = (perf_counter() - start) / switches * 1000
+    stats = registry.stats()
+    print(f'{level_count} levels, {switches} switches: {stats["hits"]} hits, {stats["misses"]} misses, '
+          f'{stats["evictions"]} evictions, {stats["loaded"]} maps loaded, peak {peak / 1024:.0f} KB, '
+          f'{switch_time:.2f} ms per lookup')
+
+
+def bench_overworld(repeat=20):
+    """
+    So sánh thời gian quay lại overworld: tạo lại Overworld từ bản đồ và tiếp tục overworld đã có (`resume`)
+        :param repeat: Số lần đo
+    """
+    from overworld import Overworld
+    game = create_game()
+    game.switch_stage('overworld', 1)
+    rebuild_time = timed(lambda: Overworld(game.tmx_overworld, game.data, game.overworld_frames, game.switch_stage),
+                         repeat)
+    resume_time = timed(lambda: game.overworld.resume(game.data), repeat * 100)
+    print(f'return to overworld: rebuild {rebuild_time:.2f} ms, resume {resume_time * 1000:.1f} us')
+
+
+def bench_respawn(repeat=10):
+    """
+    So sánh thời gian chơi lại một màn chơi: tạo lại Level từ bản đồ và khôi phục trạng thái ban đầu (`load_state`)
+    Trước mỗi lần khôi phục, màn chơi được chạy 120 frame để các đối tượng động rời khỏi vị trí ban đầu
+        :param repeat: Số lần đo
+    """
+    game = create_game()
+    for level_index in range(len(game.tmx_maps)):
+        level = game.create_level(level_index)
+        create_time = timed(lambda: game.create_level(level_index), repeat)
+        save_time = timed(level.save_state, repeat)
+        load_time = 0
+        for _ in range(repeat):
+            for _ in range(120):
+                level.run(1 / 60)
+            load_time += timed(lambda: level.load_state(level.initial_state), 1)
+        print(f'level {level_index}: create {create_time:.1f} ms, save_state {save_time:.2f} ms, '
+              f'load_state {load_time / repeat:.2f} ms ({len(level.initial_state)} entities)')
+
+
+def bench_checkpoint(frames=300, repeat=20):
+    """
+    Đo chi phí lưu trạng thái tại checkpoint (phần khác so với trạng thái ban đầu) của từng màn chơi sau khi chạy
+        `frames` frame, so với một frame bình thường của màn chơi
+        :param frames: Số frame chạy trước khi lưu
+        :param repeat: Số lần đo
+    """
+    from snapshot import save_delta
+    game = create_game()
+    for level_index in range(len(game.tmx_maps)):
+        level = game.create_level(level_index)
+        for _ in range(frames):
+            level.run(1 / 60)
+        frame_time = timed(lambda: level.run(1 / 60), repeat)
+        delta_time = timed(lambda: save_delta(level.initial_state), repeat)
+        changed, removed = save_delta(level.initial_state)
+        total = sum(len(values) for _, _, values in level.initial_state)
+        print(f'level {level_index}: save_delta {delta_time:.2f} ms (frame {frame_time:.2f} ms), '
+              f'{sum(len(changes) for _, changes in changed)}/{total} values, {len(removed)} removed')
+
+
+def bench_preload(frames=120):
+    """
+    Đo thời gian của frame chuyển từ overworld sang màn chơi, khi tạo cả màn chơi ngay lúc chuyển và khi màn chơi đã
+        được chuẩn bị trước (bản đồ đọc trong luồng nền, các bước thiết lập chạy dần trong các frame của overworld)
+    Overworld chạy `frames` frame ở 60 FPS trước khi chuyển, frame dài nhất của overworld cũng được ghi lại
+        (gồm cả phần thiết lập màn chơi, tối đa PRELOAD_FRAME_BUDGET giây mỗi frame)
+        :param frames: Số frame overworld trước khi chuyển sang màn chơi
+    """
+    from time import sleep
+    from preload import LevelPreloader
+    from registry import LevelRegistry
+    game = create_game()
+    level_count = len(game.tmx_maps)
+    for preload in (False, True):
+        game.preloader = LevelPreloader(game.tmx_maps.read, game.create_level, game.assets) if preload else None
+        if game.overworld:
+            game.overworld.preload_level = game.preloader and game.preload_level
+        switch_times, frame_times = [], []
+        for level in range(level_count):
+            # màn chơi gần nhất được khôi phục thay vì tạo lại, bỏ qua để đo việc tạo màn chơi
+            game.last_level = None
+            # bỏ bộ nhớ đệm bản đồ để đo cả việc đọc bản đồ
+            game.tmx_maps = LevelRegistry()
+            game.data.current_level = level
+            game.switch_stage('overworld', level_count - 1)
+            for _ in range(frames):
+                start = perf_counter()
+                game.current_stage.run(1 / 60)
+                frame_time = perf_counter() - start
+                frame_times.append(frame_time)
+                sleep(max(0, 1 / 60 - frame_time))
+            start = perf_counter()
+            game.switch_stage('level')
+            switch_times.append(perf_counter() - start)
+        print(f'{"preloaded" if preload else "synchronous"}: switch frame '
+              f'{sum(switch_times) / level_count * 1000:.1f} ms (max {max(switch_times) * 1000:.1f} ms), '
+              f'longest overworld frame {max(frame_times) * 1000:.1f} ms')
+
+
+def bench_collision(sizes=(50, 200, 500), frames=300):
+    """
+    Đo chi phí va chạm của nhân vật mỗi frame (check_contact, collision theo hai trục, semi_collision) trên các bản
+        đồ tổng hợp kích thước `size` x `size` tile, so với việc duyệt toàn bộ nhóm `collision_sprites` như trước
+    Riêng `check_contact` (dùng bản đồ chiếm chỗ `OccupancyGrid`) được so với 3 lần `collidelist` trên cả nhóm
+    Khoảng 1/4 số ô là tile tĩnh (một hàng nền sau mỗi 6 hàng và các khối rải rác), nhân vật đứng trên nền ở giữa
+        bản đồ
+        :param sizes: Các kích thước bản đồ (số tile mỗi chiều)
+        :param frames: Số frame đo cho mỗi kích thước
+    """
+    from player import Player
+    from sprites import Sprite
+    from groups import SpatialGroup
+    from spatial import OccupancyGrid
+    from kinematic import KinematicBodies
+    game = create_game()
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE))
+    for size in sizes:
+        center = size // 2
+        collision_sprites, semi_collision_sprites = SpatialGroup(), SpatialGroup()
+        occupancy = OccupancyGrid(size, size)
+        for col in range(size):
+            for row in range(size):
+                if abs(col - center) < 2 and center - 2 <= row <= center:
+                    continue
+                if row % 6 == 5 or row == center + 1 or (col * 7 + row * 13) % 11 == 0:
+                    Sprite((col * TILE_SIZE, row * TILE_SIZE), surf, collision_sprites).tile = True
+                    occupancy.add(col, row, OccupancyGrid.SOLID)
+        player = Player(pos=(center * TILE_SIZE, center * TILE_SIZE), groups=(),
+                        collision_sprites=collision_sprites, semi_collision_sprites=semi_collision_sprites,
+                        occupancy=occupancy, kinematic_bodies=KinematicBodies(),
+                        frames=game.level_frames['player'], data=game.data,
+                        attack_sound=game.audio_files['attack'], jump_sound=game.audio_files['jump'])
+        start = perf_counter()
+        collision_sprites.refresh()
+        index_time = (perf_counter() - start) * 1000
+
+        def broadphase():
+            player.check_contact()
+            player.collision('horizontal')
+            player.collision('vertical')
+            player.semi_collision()
+
+        def linear():
+            # cách làm trước đây: dựng lại danh sách rect và duyệt cả nhóm ở mỗi lần kiểm tra
+            rects = [sprite.rect for sprite in collision_sprites]
+            player.hitbox_rect.collidelist(rects)
+            for _ in range(2):
+                for sprite in collision_sprites:
+                    sprite.rect.colliderect(player.hitbox_rect)
+
+        def contact_linear():
+            # kiểm tra tiếp xúc trước đây: 3 lần collidelist trên rect của toàn bộ nhóm
+            rects = [sprite.rect for sprite in collision_sprites]
+            for _ in range(3):
+                player.hitbox_rect.collidelist(rects)
+
+        broadphase_time = timed(broadphase, frames)
+        linear_time = timed(linear, frames)
+        contact_time = timed(player.check_contact, frames)
+        contact_linear_time = timed(contact_linear, frames)
+        candidates = len(player.nearby(collision_sprites))
+        print(f'{size}x{size}: {len(collision_sprites)} tiles (index {index_time:.0f} ms), '
+              f'broadphase {broadphase_time * 1000:.1f} us/frame ({candidates} candidates), '
+              f'linear {linear_time:.2f} ms/frame, '
+              f'check_contact {contact_time * 1000:.1f} us (linear {contact_linear_time:.2f} ms), '
+              f'occupancy {len(occupancy.cells) // 1024} KB')
+
+
+def bench_platforms(frames=300):
+    """
+    So sánh thời gian tìm nền di chuyển dưới chân người chơi ở từng level: nối và lọc toàn bộ nhóm va chạm như trước,
+        và tìm trong danh sách vật di chuyển `KinematicBodies`
+        :param frames: Số lần đo cho mỗi level
+    """
+    game = create_game()
+    for level_index in range(len(game.tmx_maps)):
+        level = game.create_level(level_index)
+        player = level.player
+        floor_rect = pygame.Rect(player.hitbox_rect.bottomleft, (player.hitbox_rect.width, 2))
+
+        def scan():
+            sprites = level.collision_sprites.sprites() + level.semi_collision_sprites.sprites()
+            for sprite in [sprite for sprite in sprites if hasattr(sprite, 'moving')]:
+                sprite.rect.colliderect(floor_rect)
+
+        scan_time = timed(scan, frames)
+        support_time = timed(lambda: level.kinematic_bodies.support(floor_rect), frames)
+        print(f'level {level_index}: {len(level.collision_sprites) + len(level.semi_collision_sprites)} collision '
+              f'sprites, {len(level.kinematic_bodies)} platforms, scan {scan_time * 1000:.1f} us, '
+              f'support {support_time * 1000:.2f} us')
+
+
+def bench_pearls(counts=(0, 100, 500), frames=100):
+    """
+    Đo chi phí kiểm tra va chạm pearl - vật cản mỗi frame (`Level.pearl_collision`) của level lớn nhất với số pearl
+        tăng dần, so với việc duyệt toàn bộ `collision_sprites` và gọi `spritecollide` với nhóm pearl như trước
+    Pearl được đặt ngẫu nhiên trong level, các pearl chạm vật cản bị xóa ở lần gọi đầu tiên nên các lần đo sau chỉ
+        còn các pearl đang bay
+        :param counts: Các số lượng pearl
+        :param frames: Số lần đo cho mỗi số lượng
+    """
+    from random import seed, uniform, choice
+    from enemies import Pearl
+    game = create_game()
+    level_index = max(range(len(game.tmx_maps)), key=lambda index: game.tmx_maps[index].height)
+    level = game.create_level(level_index)
+    width, height = level.level_width, level.level_bottom
+    seed(0)
+    for count in counts:
+        level.pearl_sprites.empty()
+        for _ in range(count):
+            Pearl((uniform(0, width), uniform(0, height)), (level.all_sprites, level.damage_sprites, level.pearl_sprites),
+                  level.pearl_surf, choice((-1, 1)), 150)
+        level.pearl_collision()
+
+        def scan():
+            for sprite in level.collision_sprites:
+                pygame.sprite.spritecollide(sprite, level.pearl_sprites, False)
+
+        collision_time = timed(level.pearl_collision, frames)
+        scan_time = timed(scan, frames)
+        print(f'level {level_index}, {count} pearls ({len(level.pearl_sprites)} flying): '
+              f'pearl_collision {collision_time:.3f} ms, full scan {scan_time:.2f} ms')
+
+
+def bench_entities(counts=(0, 100, 200, 500, 2000), frames=300):
+    """
+    Đo chi phí ba lượt kiểm tra va chạm của người chơi mỗi frame (`hit_collision`, `item_collision`,
+        `attack_collision`) của level lớn nhất khi thêm `count` vật gây sát thương rải rác khắp level, khi dùng lưới
+        `entity_sprites` (gồm cả việc cập nhật lưới mỗi frame) và khi duyệt toàn bộ các nhóm, dùng để chọn
+        ENTITY_GRID_THRESHOLD
+    Người chơi được đặt ở trạng thái tấn công để lượt kiểm tra tấn công luôn chạy
+        :param counts: Các số lượng vật gây sát thương được thêm vào
+        :param frames: Số lần đo cho mỗi số lượng
+    """
+    from random import seed, uniform
+    from sprites import Sprite
+    game = create_game()
+    level_index = max(range(len(game.tmx_maps)), key=lambda index: game.tmx_maps[index].height)
+    level = game.create_level(level_index)
+    player = level.player
+    surf = pygame.Surface((TILE_SIZE, TILE_SIZE))
+    seed(0)
+    added = 0
+    for count in counts:
+        while added < count:
+            pos = (uniform(0, level.level_width), uniform(0, level.level_bottom))
+            # không đặt vật gây sát thương quanh người chơi để các lần đo không làm người chơi mất máu
+            if vector(pos).distance_to(player.hitbox_rect.center) > 4 * TILE_SIZE:
+                Sprite(pos, surf, (level.damage_sprites, level.entity_sprites))
+                added += 1
+        player.attacking = True
+
+        def passes(grid):
+            level.entity_grid = grid
+            if grid:
+                level.entity_sprites.refresh()
+            level.hit_collision()
+            level.item_collision()
+            level.attack_collision()
+
+        grid_time = timed(lambda: passes(True), frames)
+        scan_time = timed(lambda: passes(False), frames)
+        print(f'level {level_index}, {len(level.entity_sprites)} entities: grid {grid_time * 1000:.1f} us/frame, '
+              f'full scan {scan_time * 1000:.1f} us/frame')
+
+
+BENCHMARKS = {
+    'draw': bench_draw,
+    'chunks': bench_chunks,
+    'layers': bench_layers,
+    'blits': bench_blits,
+    'dirty': bench_dirty,
+    'water': bench_water,
+    'flicker': bench_flicker,
+    'images': bench_images,
+    'startup': bench_startup,
+    'maps': bench_maps,
+    'tilesets': bench_tilesets,
+    'registry': bench_registry,
+    'preload': bench_preload,
+    'overworld': bench_overworld,
+    'respawn': bench_respawn,
+    'checkpoint': bench_checkpoint,
+    'collision': bench_collision,
+    'platforms': bench_platforms,
+    'pearls': bench_pearls,
+    'entities': bench_entities,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f'== {name}')
+        BENCHMARKS[name]()
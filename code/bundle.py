@@ -0,0 +1,162 @@
+"""
+Gói (bundle) toàn bộ ảnh của thư mục graphics/ thành một file nhị phân chứa dữ liệu điểm ảnh RGBA đã giải mã
+Khi chạy game, file được ánh xạ vào bộ nhớ (mmap) và mỗi ảnh được tạo bằng `pygame.image.frombuffer`,
+    không cần giải mã PNG
+Cấu trúc file: MAGIC, độ dài index (4 byte, little endian), index JSON, dữ liệu điểm ảnh
+Chạy từ thư mục gốc của project để tạo lại bundle mỗi khi thay đổi ảnh:
+    python code/bundle.py
+Giống atlas, index lưu trạng thái các ảnh gốc và bundle bị bỏ qua nếu ảnh đã thay đổi sau khi tạo bundle
+"""
+import json
+import mmap
+import struct
+from settings import *
+from os import walk, makedirs
+from os.path import join, exists, dirname
+from atlas import folder_key, walk_folders, fingerprint, sources_fresh
+
+BUNDLE_PATH = join('.', 'data', 'cache', 'graphics.bundle')
+BUNDLE_VERSION = 1
+MAGIC = b'JPBUNDLE'
+HEADER = struct.Struct('<I')
+
+
+def build(source=join('.', 'graphics'), target=BUNDLE_PATH):
+    """
+    Giải mã tất cả ảnh PNG trong `source` và ghi dữ liệu RGBA của chúng vào một file bundle
+    Thứ tự thư mục con và ảnh được giữ đúng như `os.walk` để các hàm import_* trả về kết quả giống hệt khi đọc từng file
+        :param source: Thư mục ảnh gốc
+        :param target: Đường dẫn file bundle
+        :return: Tuple (số ảnh, kích thước dữ liệu điểm ảnh theo byte)
+    """
+    folders = {}
+    pixels = []
+    offset = 0
+    for folder_path, sub_folders, file_names in walk(source):
+        folder = {'sub_folders': sub_folders, 'images': {}}
+        folders[folder_key(folder_path)] = folder
+        for name in file_names:
+            if not name.endswith('.png'):
+                continue
+            surf = pygame.image.load(join(folder_path, name))
+            data = pygame.image.tobytes(surf, 'RGBA')
+            folder['images'][name] = [offset, *surf.get_size()]
+            pixels.append(data)
+            offset += len(data)
+
+    index = json.dumps({'version': BUNDLE_VERSION, 'folders': folders, 'sources': fingerprint(source)}).encode()
+    makedirs(dirname(target), exist_ok=True)
+    with open(target, 'wb') as file:
+        file.write(MAGIC)
+        file.write(HEADER.pack(len(index)))
+        file.write(index)
+        for data in pixels:
+            file.write(data)
+    return len(pixels), offset
+
+
+def read_index(buffer):
+    """
+    Đọc và kiểm tra index của file bundle
+        :param buffer: Nội dung file bundle
+        :return: Tuple (index, vị trí bắt đầu của dữ liệu điểm ảnh)
+        :raise ValueError: Nếu file không phải bundle, bị cắt cụt hoặc index không đọc được
+    """
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a bundle file')
+    index_start = len(MAGIC) + HEADER.size
+    if len(buffer) < index_start:
+        raise ValueError('truncated header')
+    index_size, = HEADER.unpack_from(buffer, len(MAGIC))
+    data_start = index_start + index_size
+    if len(buffer) < data_start:
+        raise ValueError('truncated index')
+    index = json.loads(buffer[index_start:data_start])
+    try:
+        data_size = max((offset + width * height * 4 for folder in index['folders'].values()
+                         for offset, width, height in folder['images'].values()), default=0)
+    except (KeyError, TypeError, AttributeError) as error:
+        raise ValueError('malformed index') from error
+    if len(buffer) < data_start + data_size:
+        raise ValueError('truncated pixel data')
+    return index, data_start
+
+
+class Bundle:
+    """
+    Đọc ảnh từ file bundle được tạo bởi `build`
+    File được ánh xạ vào bộ nhớ một lần, mỗi ảnh là một vùng dữ liệu RGBA được tạo thành Surface bằng `frombuffer`
+        rồi chuyển sang định dạng của màn hình
+    Có cùng giao diện với `Atlas` (`walk`, `image`) để dùng được với các hàm import_* trong support.py
+    * Phương thức
+    `load(path, source)`: Mở file bundle, trả về None nếu chưa tạo bundle, file bị hỏng hoặc ảnh gốc đã thay đổi
+    `walk(path)`: Duyệt thư mục giống `os.walk` nhưng dựa trên index
+    `image(path)`: Lấy ảnh theo đường dẫn file gốc
+    """
+    def __init__(self, buffer, folders, data_start):
+        """
+        Hàm khởi tạo
+            :param buffer: Vùng nhớ (mmap) của file bundle
+            :param folders: Thông tin các thư mục đọc từ index
+            :param data_start: Vị trí bắt đầu của dữ liệu điểm ảnh trong file
+        """
+        self.buffer = buffer
+        self.folders = folders
+        self.data_start = data_start
+
+    @classmethod
+    def load(cls, path=BUNDLE_PATH, source=join('.', 'graphics')):
+        """
+        Mở file bundle và đọc index
+            :param path: Đường dẫn file bundle
+            :param source: Thư mục ảnh gốc dùng để kiểm tra bundle còn mới hay không
+            :return: Đối tượng Bundle, hoặc None nếu chưa có bundle, file rỗng, bị cắt cụt hoặc không đọc được,
+                bundle được tạo bởi phiên bản khác hoặc ảnh gốc đã thay đổi sau khi tạo bundle
+        """
+        if not exists(path):
+            return None
+        with open(path, 'rb') as file:
+            try:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # file rỗng không ánh xạ được
+                return None
+        try:
+            index, data_start = read_index(buffer)
+        except ValueError:
+            index = None
+        if index is None or index.get('version') != BUNDLE_VERSION or not sources_fresh(index.get('sources'), source):
+            buffer.close()
+            return None
+        return cls(buffer, index['folders'], data_start)
+
+    def __contains__(self, path):
+        return folder_key(path) in self.folders
+
+    def walk(self, path):
+        """
+        Duyệt thư mục giống `os.walk` (từ trên xuống, cùng thứ tự) nhưng không đọc ổ đĩa
+            :param path: Đường dẫn thư mục gốc
+            :return: Generator các tuple (đường dẫn thư mục, danh sách thư mục con, danh sách tên ảnh)
+        """
+        return walk_folders(self.folders, path)
+
+    def image(self, path):
+        """
+        Lấy ảnh theo đường dẫn file gốc
+            :param path: Đường dẫn file ảnh (ví dụ './graphics/player/idle/0.png')
+            :return: Bề mặt ảnh đã chuyển sang định dạng màn hình, hoặc None nếu ảnh không có trong bundle
+        """
+        key, _, name = folder_key(path).rpartition('/')
+        folder = self.folders.get(key)
+        if folder is None or name not in folder['images']:
+            return None
+        offset, width, height = folder['images'][name]
+        start = self.data_start + offset
+        data = memoryview(self.buffer)[start:start + width * height * 4]
+        return pygame.image.frombuffer(data, (width, height), 'RGBA').convert_alpha()
+
+
+if __name__ == '__main__':
+    image_count, size = build()
+    print(f'bundled {image_count} images ({size / 1024 / 1024:.1f} MB of pixels) into {BUNDLE_PATH}')
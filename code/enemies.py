@@ -1,6 +1,8 @@
 from settings import *
 from random import choice
+from math import sin
 from timer import Timer
+from support import flip_frames, silhouette
 
 
 class Tooth(pygame.sprite.Sprite):
@@ -12,22 +14,28 @@ class Tooth(pygame.sprite.Sprite):
 	reverse(self): Đảo ngược hướng di chuyển của Tooth (nếu bộ đếm hit_timer cho phép)
 	update(self, dt): Cập nhật trạng thái của Tooth (animation, di chuyển, đổi hướng)
 	"""
-	def __init__(self, pos, frames, groups, collision_sprites):
+	def __init__(self, pos, frames, groups, collision_sprites, occupancy):
 		"""
 		Hàm khởi tạo
 			:param pos: Vị trí ban đầu của Tooth trên màn hình (x, y)
 			:param frames: Danh sách các khung hình animation (hoạt ảnh) của Tooth
 			:param groups: Nhóm sprite (đối tượng) mà Tooth sẽ được thêm vào (dùng cho việc quản lý hiển thị và cập nhật)
 			:param collision_sprites: Danh sách các sprite (đối tượng) dùng để kiểm tra va chạm của Tooth
+			:param occupancy: Bản đồ chiếm chỗ của các tile (`OccupancyGrid`), tile được kiểm tra trên bản đồ này
+				thay vì trong danh sách rect
 		"""
 		super().__init__(groups)
 		self.frames, self.frame_index = frames, 0
+		self.flipped_frames = flip_frames(frames)
 		self.image = self.frames[self.frame_index]
 		self.rect = self.image.get_frect(topleft=pos)
 		self.z = Z_LAYERS['main']
 
 		self.direction = choice((-1, 1))
-		self.collision_rects = [sprite.rect for sprite in collision_sprites]
+		self.dynamic = True
+		# chỉ giữ rect của các vật cản không phải tile (thùng, cửa, shell...), tile được kiểm tra qua `occupancy`
+		self.collision_rects = [sprite.rect for sprite in collision_sprites if not hasattr(sprite, 'tile')]
+		self.occupancy = occupancy
 		self.speed = 200
 
 		self.hit_timer = Timer(250)
@@ -46,15 +54,19 @@ class Tooth(pygame.sprite.Sprite):
 		"""
 		Cập nhật trạng thái của Tooth - một loại kẻ thù trong game
 		Phương thức này cập nhật vị trí, animation (hoạt ảnh) và hướng di chuyển của Tooth
+		Khi bị đánh (`hit_timer` đang chạy) Tooth nhấp nháy trắng giống người chơi
 			:param dt: Khoảng thời gian trôi qua kể từ lần cập nhật trước (delta time)
 		"""
 		self.hit_timer.update()
 
 		# animate
 		self.frame_index += ANIMATION_SPEED * dt
-		self.image = self.frames[int(self.frame_index % len(self.frames))]
-		# Flip animation khi đổi hướng
-		self.image = pygame.transform.flip(self.image, True, False) if self.direction < 0 else self.image
+		# Flip animation khi đổi hướng, dùng bộ khung hình đã lật sẵn
+		frames = self.flipped_frames if self.direction < 0 else self.frames
+		self.image = frames[int(self.frame_index % len(frames))]
+		# Nhấp nháy trắng khi bị người chơi đánh
+		if self.hit_timer.active and sin(pygame.time.get_ticks() * 100) >= 0:
+			self.image = silhouette(self.image)
 
 		# move
 		self.rect.x += self.direction * self.speed * dt
@@ -69,9 +81,10 @@ class Tooth(pygame.sprite.Sprite):
 
 		# Nếu FRect ở dưới chân không va chạm gì hết có nghĩa là kẻ thù đã đến rìa mặt đất và sẽ quay đầu
 		# Nều FRect ở trên đầu va chạm với tường thì sẽ làm cho kẻ thù quay đầu
-		if floor_rect_right.collidelist(self.collision_rects) < 0 and self.direction > 0 or\
-			floor_rect_left.collidelist(self.collision_rects) < 0 and self.direction < 0 or\
-			wall_rect.collidelist(self.collision_rects) != -1:
+		solid_in_rect = self.occupancy.solid_in_rect
+		if not solid_in_rect(floor_rect_right) and floor_rect_right.collidelist(self.collision_rects) < 0 and self.direction > 0 or\
+			not solid_in_rect(floor_rect_left) and floor_rect_left.collidelist(self.collision_rects) < 0 and self.direction < 0 or\
+			solid_in_rect(wall_rect) or wall_rect.collidelist(self.collision_rects) != -1:
 			self.direction *= -1
 
 
@@ -81,22 +94,28 @@ class Fly(pygame.sprite.Sprite):
 	Lớp này kế thừa từ `pygame.sprite.Sprite` để tạo ra một đối tượng enemy (kẻ thù) đại diện cho Fly.
 		Fly bay qua lại trên màn hình và đổi hướng khi chạm vào tường hoặc các vật thể va chạm được cung cấp
 	"""
-	def __init__(self, pos, frames, groups, collision_sprites):
+	def __init__(self, pos, frames, groups, collision_sprites, occupancy):
 		"""
 		Hàm khởi tạo
 			:param pos: Vị trí ban đầu của Fly trên màn hình (x, y)
 			:param frames: Danh sách các khung hình animation (hoạt ảnh) của Fly
 			:param groups: Nhóm sprite (đối tượng) mà Fly sẽ được thêm vào (dùng cho việc quản lý hiển thị và cập nhật)
 			:param collision_sprites: Danh sách các sprite (đối tượng) dùng để kiểm tra va chạm của Fly
+			:param occupancy: Bản đồ chiếm chỗ của các tile (`OccupancyGrid`), tile được kiểm tra trên bản đồ này
+				thay vì trong danh sách rect
 		"""
 		super().__init__(groups)
 		self.frames, self.frame_index = frames, 0
+		self.flipped_frames = flip_frames(frames)
 		self.image = self.frames[self.frame_index]
 		self.rect = self.image.get_frect(topleft=pos)
 		self.z = Z_LAYERS['main']
 
 		self.direction = choice((-1, 1))
-		self.collision_rects = [sprite.rect for sprite in collision_sprites]
+		self.dynamic = True
+		# chỉ giữ rect của các vật cản không phải tile (thùng, cửa, shell...), tile được kiểm tra qua `occupancy`
+		self.collision_rects = [sprite.rect for sprite in collision_sprites if not hasattr(sprite, 'tile')]
+		self.occupancy = occupancy
 		self.speed = 300
 
 		self.hit_timer = Timer(250)
@@ -115,14 +134,18 @@ class Fly(pygame.sprite.Sprite):
 		"""
 		Cập nhật trạng thái của Fly - một loại kẻ thù trong game
 		Phương thức này cập nhật vị trí, animation (hoạt ảnh) và hướng di chuyển của Fly
+		Khi bị đánh (`hit_timer` đang chạy) Fly nhấp nháy trắng giống người chơi
 			:param dt: Khoảng thời gian trôi qua kể từ lần cập nhật trước (delta time)
 		"""
 		self.hit_timer.update()
 
 		# animate
 		self.frame_index += ANIMATION_SPEED * dt
-		self.image = self.frames[int(self.frame_index % len(self.frames))]
-		self.image = pygame.transform.flip(self.image, True, False) if self.direction > 0 else self.image
+		frames = self.flipped_frames if self.direction > 0 else self.frames
+		self.image = frames[int(self.frame_index % len(frames))]
+		# Nhấp nháy trắng khi bị người chơi đánh
+		if self.hit_timer.active and sin(pygame.time.get_ticks() * 100) >= 0:
+			self.image = silhouette(self.image)
 
 		# move
 		self.rect.x += self.direction * self.speed * dt
@@ -133,8 +156,9 @@ class Fly(pygame.sprite.Sprite):
 		wall_rect_left = pygame.FRect(self.rect.midleft, (-1,1))
 		# wall_rect = pygame.FRect(self.rect.topleft + vector(-1,0), (self.rect.width + 2, 1))
 		# Nếu là FRect va chạm gì đó có nghĩa là kẻ thù đã chạm tường và sẽ quay đầu
-		if wall_rect_right.collidelist(self.collision_rects) > 0 and self.direction > 0 or\
-			wall_rect_left.collidelist(self.collision_rects) > 0 and self.direction < 0:
+		solid_in_rect = self.occupancy.solid_in_rect
+		if (solid_in_rect(wall_rect_right) or wall_rect_right.collidelist(self.collision_rects) >= 0) and self.direction > 0 or\
+			(solid_in_rect(wall_rect_left) or wall_rect_left.collidelist(self.collision_rects) >= 0) and self.direction < 0:
 		#    wall_rect.collidelist(self.collision_rects) != -1:
 			self.direction *= -1
 
@@ -162,9 +186,7 @@ class Shell(pygame.sprite.Sprite):
 		super().__init__(groups)
 		# Nếu mà Shell có reverse thì sẽ quay shell theo hướng ngược lại và đặt hướng đạn theo hướng quay
 		if reverse:
-			self.frames = {}
-			for key, surfs in frames.items():
-				self.frames[key] = [pygame.transform.flip(surf, True, False) for surf in surfs]
+			self.frames = flip_frames(frames)
 			self.bullet_direction = -1
 		else:
 			self.frames = frames
@@ -176,6 +198,8 @@ class Shell(pygame.sprite.Sprite):
 		self.rect = self.image.get_frect(topleft=pos)
 		self.old_rect = self.rect.copy()
 		self.z = Z_LAYERS["main"]
+		# vật cản của nhân vật có thể được đặt lại vị trí (snapshot), nên được cập nhật lại ô lưới như sprite động
+		self.dynamic = True
 		self.player = player
 		self.shoot_timer = Timer(3000)
 		self.has_fired = False
@@ -258,6 +282,7 @@ class Pearl(pygame.sprite.Sprite):
 		self.image = surf
 		self.rect = self.image.get_frect(center=pos + vector(50 * direction, 0))
 		self.direction = direction
+		self.dynamic = True
 		self.speed = speed
 		self.z = Z_LAYERS['main']
 		self.timers = {
@@ -1,17 +1,127 @@
 import pygame.draw
 
 from settings import *
-from sprites import Sprite, Cloud
+from sprites import Cloud
+from support import tile_surface
+from spatial import SpatialHash
 from timer import Timer
 from random import randint, choice
+from itertools import islice, count
 
-class AllSprites(pygame.sprite.Group):
+
+class SpatialGroup(pygame.sprite.Group):
+    """
+    Nhóm sprite có chỉ mục không gian (`SpatialHash`) đi kèm
+    Sprite được đưa vào lưới khi vừa được thêm vào nhóm, và bị xóa khỏi lưới khi rời nhóm (kill, remove)
+    Vì các lớp sprite gọi `super().__init__(groups)` trước khi tạo `rect`, sprite mới được giữ trong `pending` và chỉ
+        được đưa vào lưới ở lần truy vấn hoặc `refresh()` kế tiếp
+    Sprite có thuộc tính `dynamic` (Cloud, MovingSprite, Spike, Tooth, Fly, Shell, Pearl, Player, Icon) được cập nhật lại ô
+        mỗi khi gọi `refresh()`, các sprite tĩnh chỉ được đưa vào lưới một lần
+    * Phương thức
+    `index_sprite(sprite)`: Đưa một sprite vào lưới
+    `refresh()`: Đưa các sprite đang chờ vào lưới và cập nhật ô của các sprite động
+    `nearby(rect, ordered)`: Lấy các sprite nằm trong các ô mà `rect` chạm tới
+    """
+    def __init__(self, cell_size=TILE_SIZE):
+        """
+        Hàm khởi tạo
+            :param cell_size: Kích thước một ô của lưới, mặc định là TILE_SIZE
+        """
+        super().__init__()
+        self.grid = SpatialHash(cell_size)
+        self.pending = {}
+        self.dynamic_sprites = set()
+        # sprite -> số thứ tự được thêm vào nhóm, dùng để trả về ứng viên theo đúng thứ tự duyệt nhóm
+        # Sprite được thêm lại (ví dụ khi khôi phục snapshot) nhận số thứ tự mới, giống vị trí mới của nó trong nhóm
+        self.order = {}
+        self.counter = count()
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.pending[sprite] = None
+        self.order[sprite] = next(self.counter)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.pending.pop(sprite, None)
+        self.order.pop(sprite, None)
+        self.dynamic_sprites.discard(sprite)
+        self.grid.remove(sprite)
+
+    def index_sprite(self, sprite):
+        """
+        Đưa một sprite vào lưới, ghi nhận sprite động để cập nhật ở các lần `refresh()` sau
+            :param sprite: Sprite cần đưa vào lưới (đã có `rect`)
+        """
+        self.grid.insert(sprite, sprite.rect)
+        if hasattr(sprite, 'dynamic'):
+            self.dynamic_sprites.add(sprite)
+
+    def index_pending(self):
+        """
+        Đưa tất cả sprite đang chờ vào lưới theo đúng thứ tự được thêm vào nhóm
+        """
+        for sprite in self.pending:
+            self.index_sprite(sprite)
+        self.pending.clear()
+
+    def refresh(self):
+        """
+        Cập nhật lưới sau khi các sprite đã di chuyển
+        Chỉ các sprite động được kiểm tra lại, và lưới chỉ thay đổi khi sprite đã sang ô khác
+        """
+        if self.pending:
+            self.index_pending()
+        grid = self.grid
+        for sprite in self.dynamic_sprites:
+            grid.move(sprite, sprite.rect)
+
+    def nearby(self, rect, ordered=False):
+        """
+        Lấy các sprite nằm gần một vùng
+            :param rect: Vùng cần truy vấn
+            :param ordered: True để trả về danh sách theo thứ tự sprite được thêm vào nhóm (giống khi duyệt cả nhóm),
+                dùng cho các xử lý mà kết quả phụ thuộc vào thứ tự: khi nhân vật chạm hai vật cản cùng lúc, vật được
+                xử lý trước quyết định nhân vật bị đẩy ra theo hướng nào. Thứ tự duyệt tập hợp phụ thuộc vào địa chỉ
+                bộ nhớ của sprite nên không cố định giữa các lần chạy
+            :return: Tập hợp (hoặc danh sách nếu `ordered` và có từ hai sprite trở lên) các sprite nằm trong các ô mà
+                `rect` chạm tới
+        """
+        if self.pending:
+            self.index_pending()
+        sprites = self.grid.query(rect)
+        if not ordered or len(sprites) < 2:
+            return sprites
+        return sorted(sprites, key=self.order.__getitem__)
+
+
+class LayeredGroup(SpatialGroup):
+    """
+    Nhóm sprite có chỉ mục không gian, được vẽ theo lớp z (Z_LAYERS)
+    Thứ tự vẽ của một frame chỉ được tạo cho các sprite lấy từ lưới trong vùng camera, sắp xếp theo
+        (z, thứ tự được thêm vào nhóm), nên chi phí vẽ phụ thuộc vào số sprite gần camera, không phụ thuộc vào tổng số
+        sprite của nhóm
+    * Phương thức
+    `draw_order(rect)`: Các sprite nằm trong các ô mà `rect` chạm tới, theo thứ tự vẽ
+    """
+    def draw_order(self, rect):
+        """
+        Lấy các sprite gần một vùng theo thứ tự vẽ
+            :param rect: Vùng cần vẽ (thường là vùng camera)
+            :return: Danh sách sprite theo z tăng dần (từ xa đến gần), cùng z thì sprite được thêm trước đứng trước
+        """
+        order = self.order
+        return sorted(self.nearby(rect), key=lambda sprite: (sprite.z, order[sprite]))
+
+
+class AllSprites(LayeredGroup):
     """
     Nhóm chứa tất cả các sprite trong level
-    Lớp này kế thừa từ `pygame.sprite.Group` và quản lý việc cập nhật, hiển thị các sprite có trên màn hình
+    Lớp này kế thừa từ `LayeredGroup` và quản lý việc cập nhật, hiển thị các sprite có trên màn hình
     * Phương thức
     `camera_constraint()`: Giới hạn camera trong biên level
     `draw_sky()`: Vẽ nền trời
+    `draw_bg_tiles()`: Vẽ nền gạch bằng một bề mặt đã lặp sẵn
     `draw_large_cloud(self, dt)`: Vẽ mây lớn
     `create_cloud(self)`: Tạo một mây nhỏ ngẫu nhiên
     `draw(self, target_pos, dt)`: Vẽ tất cả sprite trong nhóm
@@ -20,8 +130,16 @@ class AllSprites(pygame.sprite.Group):
         Nếu là nền trời:
             Cập nhật bộ hẹn giờ tạo mây
             Vẽ nền trời và di chuyển mây lớn
-        Sắp xếp các sprite theo thứ tự z (từ xa đến gần) trước khi vẽ
-        Vẽ từng sprite lên bề mặt hiển thị với sự dịch chuyển của camera (`offset`)
+        Nếu là nền gạch: vẽ nền gạch bằng một lần blit
+        Lấy các sprite nằm trong vùng camera từ lưới `SpatialHash`, sắp xếp theo thứ tự z (`draw_order`)
+        Vẽ từng sprite lên bề mặt hiển thị theo thứ tự đó (từ xa đến gần) với sự dịch chuyển của camera (`offset`)
+    `draw_batched(camera_rect, visible)`: Vẽ các sprite trong camera bằng một lần gọi `fblits`
+    `camera_rect()`: Vùng của level đang hiển thị trên màn hình
+    `update(dt)`: Cập nhật tất cả sprite rồi cập nhật lại ô lưới của các sprite động
+    * Thống kê
+    `drawn_count`, `culled_count`: Số sprite được vẽ và số sprite bị bỏ qua (nằm ngoài camera) ở frame gần nhất
+    * Tùy chọn
+    `batched`: True để vẽ theo lô (`draw_batched`), False để blit từng sprite. Mặc định là BATCHED_BLITS
     """
 
     def __init__(self, width, height, clouds, horizon_line, bg_tile=None, top_limit=0):
@@ -36,6 +154,13 @@ class AllSprites(pygame.sprite.Group):
         super().__init__()
         self.display_surface = pygame.display.get_surface()
         self.offset = vector()
+        self.drawn_count = 0
+        self.culled_count = 0
+        # Vẽ theo lô bằng fblits, có thể bật/tắt lúc chạy để so sánh hai cách vẽ
+        self.batched = BATCHED_BLITS
+        # sprite -> (image, [x, y]) được tái sử dụng giữa các frame, chỉ tạo lại khi image của sprite thay đổi
+        self.blit_entries = {}
+        self.blit_buffer = []
         self.width, self.height = width * TILE_SIZE, height * TILE_SIZE
         self.borders = {
             'left': 0,
@@ -48,11 +173,16 @@ class AllSprites(pygame.sprite.Group):
         self.horizon_line = horizon_line
 
         # Tạo bg ứng với màu bg trong object Data
+        # Nền gạch được lặp sẵn thành một bề mặt lớn hơn cửa sổ một ô mỗi chiều và được vẽ bằng một lần blit
+        #   (dịch theo offset chia lấy dư cho kích thước ô) thay vì một sprite cho mỗi ô của level
         if bg_tile:
-            for col in range(width):
-                for row in range(-int(top_limit / TILE_SIZE) - 1, height):
-                    x, y = col * TILE_SIZE, row * TILE_SIZE
-                    Sprite((x, y), bg_tile, self, -1)
+            self.bg_tile_size = bg_tile.get_size()
+            cols = WINDOW_WIDTH // self.bg_tile_size[0] + 2
+            rows = WINDOW_HEIGHT // self.bg_tile_size[1] + 2
+            self.bg_pattern = tile_surface(bg_tile, cols, rows)
+            # Vùng có nền gạch (theo tọa độ level): cả level và các hàng phía trên đến `top_limit`
+            bg_top = (-int(top_limit / TILE_SIZE) - 1) * TILE_SIZE
+            self.bg_rect = pygame.Rect(0, bg_top, self.width, self.height - bg_top)
         # sky
         else:
             self.large_cloud = clouds['large']
@@ -76,6 +206,18 @@ class AllSprites(pygame.sprite.Group):
                 surf = choice(self.small_clouds)
                 Cloud(pos, surf, self)
 
+    def draw_bg_tiles(self):
+        """
+        Vẽ nền gạch bằng một lần blit bề mặt đã lặp sẵn
+        Các ô nền nằm ở bội số của kích thước ô nên chỉ cần dịch bề mặt theo phần dư của offset,
+            vùng vẽ được giới hạn trong `bg_rect` để giống hệt khi vẽ từng ô
+        """
+        tile_width, tile_height = self.bg_tile_size
+        pos = (self.offset.x % tile_width - tile_width, self.offset.y % tile_height - tile_height)
+        self.display_surface.set_clip(self.bg_rect.move(self.offset))
+        self.display_surface.blit(self.bg_pattern, pos)
+        self.display_surface.set_clip(None)
+
     def camera_constraint(self):
         """
         Giới hạn camera trong biên level.
@@ -133,6 +275,27 @@ class AllSprites(pygame.sprite.Group):
         surf = choice(self.small_clouds)
         Cloud(pos, surf, self)
 
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.blit_entries.pop(sprite, None)
+
+    def update(self, dt):
+        """
+        Hàm cập nhật
+        Cập nhật tất cả sprite trong nhóm, sau đó cập nhật lại ô lưới của các sprite động đã di chuyển
+            :param dt: Thời gian trôi qua
+        """
+        super().update(dt)
+        self.refresh()
+
+    def camera_rect(self):
+        """
+        Vùng của level đang hiển thị trên màn hình
+        `offset` luôn ngược dấu với vị trí camera nên góc trên trái của camera là `-offset`
+            :return: FRect kích thước bằng màn hình, theo tọa độ của level
+        """
+        return pygame.FRect(-self.offset.x, -self.offset.y, WINDOW_WIDTH, WINDOW_HEIGHT)
+
     def draw(self, target_pos, dt):
         """
         Vẽ tất cả sprite trong nhóm lên bề mặt hiển thị
@@ -146,66 +309,190 @@ class AllSprites(pygame.sprite.Group):
         self.offset.x = -(target_pos[0] - WINDOW_WIDTH / 2)
         self.offset.y = -(target_pos[1] - WINDOW_HEIGHT / 2)
         self.camera_constraint()
+        # Làm tròn offset để chunk nền (vẽ sẵn nhiều tile) và sprite riêng lẻ luôn khớp nhau từng pixel
+        self.offset.x, self.offset.y = round(self.offset.x), round(self.offset.y)
 
         if self.sky:
             self.cloud_timer.update()
             self.draw_sky()
             self.draw_large_cloud(dt)
+        else:
+            self.draw_bg_tiles()
+
+        # Chỉ vẽ các sprite nằm trong camera, các sprite ngoài màn hình bị bỏ qua
+        # Thứ tự z giúp cho điều kiển phần tử nào được vẽ trước, phần tử nào được vẽ sau
+        camera_rect = self.camera_rect()
+        visible = self.draw_order(camera_rect)
+        if self.batched:
+            self.draw_batched(camera_rect, visible)
+            return
+        drawn = 0
+
+        for sprite in visible:
+            if sprite.rect.colliderect(camera_rect):
+                offset_pos = sprite.rect.topleft + self.offset
+                self.display_surface.blit(sprite.image, offset_pos)
+                drawn += 1
+        self.drawn_count = drawn
+        self.culled_count = len(self) - drawn
 
-        # Sắp xếp theo z, từ đó giúp cho điều kiển phần tử nào được vẽ trước, phần tử nào được vẽ sau
-        for sprite in sorted(self, key=lambda sprite: sprite.z):
-            offset_pos = sprite.rect.topleft + self.offset
-            self.display_surface.blit(sprite.image, offset_pos)
+    def draw_batched(self, camera_rect, visible):
+        """
+        Vẽ các sprite trong camera theo lô
+        Thay vì gọi `blit` cho từng sprite và tạo một Vector2 mới cho mỗi vị trí, phương thức này điền các cặp
+            (surface, vị trí) vào `blit_buffer` theo đúng thứ tự z rồi gửi cả lô cho `fblits` một lần.
+            Vị trí là list [x, y] của từng sprite được giữ lại và sửa trực tiếp mỗi frame nên không cấp phát thêm
+            :param camera_rect: Vùng camera theo tọa độ level
+            :param visible: Các sprite nằm trong các ô lưới của camera, theo thứ tự vẽ
+        """
+        entries, buffer = self.blit_entries, self.blit_buffer
+        buffer_size = len(buffer)
+        offset_x, offset_y = self.offset
+        drawn = 0
+        for sprite in visible:
+            if sprite.rect.colliderect(camera_rect):
+                entry = entries.get(sprite)
+                if entry is None or entry[0] is not sprite.image:
+                    entry = entries[sprite] = (sprite.image, [0, 0])
+                pos = entry[1]
+                pos[0] = sprite.rect.x + offset_x
+                pos[1] = sprite.rect.y + offset_y
+                if drawn < buffer_size:
+                    buffer[drawn] = entry
+                else:
+                    buffer.append(entry)
+                drawn += 1
+        self.display_surface.fblits(islice(buffer, drawn))
+        self.drawn_count = drawn
+        self.culled_count = len(self) - drawn
 
 
-class WorldSprites(pygame.sprite.Group):
+class WorldSprites(LayeredGroup):
     """
     Nhóm chứa tất cả các sprite trong thế giới game (overworld)
-    Lớp này kế thừa từ `pygame.sprite.Group` và quản lý việc vẽ các sprite lên màn hình
+    Lớp này kế thừa từ `LayeredGroup` và quản lý việc vẽ các sprite lên màn hình
     Các sprite được phân loại theo thứ tự hiển thị (`z`) và được sắp xếp để tạo hiệu ứng phối cản
+    Riêng lớp 'main' được sắp xếp lại theo y, các lớp khác vẽ theo thứ tự z (`draw_order`)
     * Phương thức
+    `update(dt)`: Cập nhật lớp nước và tất cả sprite rồi cập nhật lại ô lưới của các sprite động
     `draw(target_pos)`: Vẽ tất cả sprite trong nhóm lên bề mặt hiển thị
+    `find_dirty_rects(drawn)`: Tìm các vùng màn hình đã thay đổi so với frame trước
+    * Tùy chọn
+    `water`: Lớp nước (`TiledWater`) được vẽ dưới tất cả các sprite, None nếu không có
+    `track_dirty`: True để theo dõi các vùng thay đổi, kết quả được lưu trong `dirty_rects` sau mỗi lần vẽ
+        (None khi tắt, nghĩa là cần cập nhật toàn màn hình)
     """
-    def __init__(self, data):
+    def __init__(self, data, track_dirty=False):
         """
         Hàm khởi tạo
             :param data: Dữ liệu trò chơi được dùng để thiết lập các sprite ban đầu
+            :param track_dirty: Có theo dõi các vùng màn hình thay đổi giữa các frame hay không
         """
         super().__init__()
         self.display_surface = pygame.display.get_surface()
         self.data = data
         self.offset = vector()
+        self.water = None
+
+        # dirty rect
+        self.track_dirty = track_dirty
+        self.dirty_rects = None
+        # sprite -> (image, vị trí trên màn hình) ở frame trước
+        self.last_drawn = {}
+        self.last_offset = None
+
+    def update(self, dt):
+        """
+        Hàm cập nhật
+        Cập nhật lớp nước và tất cả sprite trong nhóm, sau đó cập nhật lại ô lưới của các sprite động đã di chuyển
+            :param dt: Thời gian trôi qua
+        """
+        if self.water:
+            self.water.update(dt)
+        super().update(dt)
+        self.refresh()
 
     def draw(self, target_pos):
         """
         Vẽ tất cả sprite trong nhóm lên bề mặt hiển thị, phân loại theo lớp nền (background) và lớp chính (main)
         Phương thức này chịu trách nhiệm vẽ toàn bộ các sprite có trong nhóm `WorldSprites` lên bề mặt hiển thị chính
             (`self.display_surface`), đồng thời gắn camera và vị trú người chơi di chuyển
-        Các sprite được phân loại và sắp xếp theo thứ tự hiển thị (`z`) để tạo hiệu ứng lớp (layering effect)
+        Nước được vẽ đầu tiên, các lớp nền được vẽ theo thứ tự z, lớp chính được sắp xếp theo y để tạo hiệu ứng lớp (layering effect)
+        Chỉ các sprite nằm trong camera mới được vẽ
+        Nếu `track_dirty` được bật, các vùng thay đổi so với frame trước được lưu vào `dirty_rects`
             :param target_pos: Vị trí mục tiêu (tuple of x, y). Vị trí này thường là vị trí của người chơi,
                 dựa vào đó camera sẽ điều chỉnh để giữ người chơi ở trung tâm màn hình
         """
         # Camera
         self.offset.x = -(target_pos[0] - WINDOW_WIDTH / 2)
         self.offset.y = -(target_pos[1] - WINDOW_HEIGHT / 2)
+        camera_rect = pygame.FRect(-self.offset.x, -self.offset.y, WINDOW_WIDTH, WINDOW_HEIGHT)
+        visible = self.draw_order(camera_rect)
+        # sprite -> (image, vị trí) đã vẽ ở frame này, chỉ dùng khi theo dõi dirty rect
+        drawn = {}
+
+        # nước nằm dưới tất cả các lớp, vẽ bằng một lần blit
+        if self.water:
+            water = self.water.draw(self.display_surface, self.offset)
+            if self.track_dirty and water:
+                drawn[self.water] = water
 
         # chia thành 2 phần background và main
 
         # background
         # Mỗi khi unlock được một stage mới thì node tượng trương so stage đó sẽ hiện lên
-        for sprite in sorted(self, key=lambda sprite: sprite.z):
-            if sprite.z < Z_LAYERS['main']:
-                if sprite.z == Z_LAYERS['path']:
-                    if sprite.level <= self.data.unlocked_level:
-                        self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
-                else:
-                    self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
+        main_sprites = []
+        for sprite in visible:
+            if sprite.z >= Z_LAYERS['main']:
+                if sprite.z == Z_LAYERS['main']:
+                    main_sprites.append(sprite)
+                continue
+            if sprite.z == Z_LAYERS['path'] and sprite.level > self.data.unlocked_level:
+                continue
+            pos = sprite.rect.topleft + self.offset
+            self.display_surface.blit(sprite.image, pos)
+            if self.track_dirty:
+                drawn[sprite] = (sprite.image, (int(pos.x), int(pos.y)))
         # main
-        # Sắp xếp theo y để tạo được hiệu ứng trước sau
-        for sprite in sorted(self, key=lambda sprite: sprite.rect.centery):
-            if sprite.z == Z_LAYERS['main']:
-                if hasattr(sprite, 'icon'):
-                    self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset + vector(0, -28))
-                else:
-                    self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
+        # Sắp xếp theo y để tạo được hiệu ứng trước sau, cùng y thì giữ thứ tự được thêm vào nhóm
+        main_sprites.sort(key=lambda sprite: sprite.rect.centery)
+        for sprite in main_sprites:
+            if hasattr(sprite, 'icon'):
+                pos = sprite.rect.topleft + self.offset + vector(0, -28)
+            else:
+                pos = sprite.rect.topleft + self.offset
+            self.display_surface.blit(sprite.image, pos)
+            if self.track_dirty:
+                drawn[sprite] = (sprite.image, (int(pos.x), int(pos.y)))
+
+        if self.track_dirty:
+            self.dirty_rects = self.find_dirty_rects(drawn)
 
+    def find_dirty_rects(self, drawn):
+        """
+        Tìm các vùng màn hình đã thay đổi so với frame trước
+        Nếu camera di chuyển thì toàn bộ màn hình thay đổi. Nếu không, một sprite tạo ra vùng thay đổi khi nó đổi
+            hình ảnh (hoạt ảnh nước, cọ, icon), đổi vị trí, vừa xuất hiện (ví dụ PathSprite mới mở khóa) hoặc biến mất.
+            Khi có quá nhiều vùng nhỏ thì chúng được gộp thành một vùng bao quanh tất cả
+            :param drawn: Từ điển sprite -> (image, vị trí trên màn hình) của các sprite được vẽ ở frame này
+            :return: Danh sách các Rect cần cập nhật lên màn hình
+        """
+        screen_rect = self.display_surface.get_rect()
+        if self.offset != self.last_offset:
+            rects = [screen_rect]
+        else:
+            rects = []
+            for sprite, (image, pos) in drawn.items():
+                last = self.last_drawn.get(sprite)
+                if last != (image, pos):
+                    rects.append(pygame.Rect(pos, image.get_size()))
+                    if last:
+                        rects.append(pygame.Rect(last[1], last[0].get_size()))
+            for sprite, (image, pos) in self.last_drawn.items():
+                if sprite not in drawn:
+                    rects.append(pygame.Rect(pos, image.get_size()))
+            if len(rects) > DIRTY_RECT_LIMIT:
+                rects = [rects[0].unionall(rects)]
+        self.last_drawn = drawn
+        self.last_offset = self.offset.copy()
+        return [rect.clip(screen_rect) for rect in rects]
@@ -0,0 +1,83 @@
+from settings import *
+
+
+class KinematicBodies:
+    """
+    Danh sách các vật di chuyển có thể chở nhân vật (nền di chuyển `MovingSprite`, sau này có thể là thang máy...)
+    Vật di chuyển vẫn được cập nhật cùng `all_sprites`, sau đó `update()` dời tất cả nhân vật đang đứng trên vật
+        di chuyển theo đúng quãng đường vật đã đi trong frame, trong một lần duyệt
+    Nhân vật được cập nhật (và xử lý va chạm) trước vật di chuyển, nên sau khi dời, va chạm của nhân vật với vật cản
+        được xử lý lại để vật di chuyển không đẩy nhân vật vào trong tường
+    Việc tìm vật đang đỡ nhân vật chỉ duyệt các vật di chuyển, không phụ thuộc vào số tile của level
+    * Phương thức
+    `add(body)`: Thêm một vật di chuyển
+    `add_actor(actor)`: Thêm một nhân vật có thể được chở
+    `support(rect)`: Tìm vật di chuyển đang đỡ một vùng (thường là vùng dưới chân nhân vật)
+    `carried()`: Từ điển vật di chuyển -> các nhân vật đang được chở
+    `update()`: Dời các nhân vật theo vật đang chở chúng
+    """
+    def __init__(self):
+        """
+        Hàm khởi tạo
+        """
+        self.bodies = []
+        # Nhân vật có thuộc tính `platform` (vật đang chở, hoặc None), `hitbox_rect` và phương thức `collision(axis)`
+        self.actors = []
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def add(self, body):
+        """
+        Thêm một vật di chuyển
+            :param body: Sprite có `rect` và `old_rect` (vị trí trước khi cập nhật trong frame)
+        """
+        self.bodies.append(body)
+
+    def add_actor(self, actor):
+        """
+        Thêm một nhân vật có thể được chở
+            :param actor: Sprite có `hitbox_rect`, `rect`, `platform` và `collision(axis)`
+        """
+        self.actors.append(actor)
+
+    def support(self, rect):
+        """
+        Tìm vật di chuyển chạm vào một vùng, nếu có nhiều vật thì lấy vật được thêm sau cùng
+            :param rect: Vùng cần kiểm tra
+            :return: Vật di chuyển hoặc None
+        """
+        support = None
+        for body in self.bodies:
+            if body.rect.colliderect(rect):
+                support = body
+        return support
+
+    def carried(self):
+        """
+        Các nhân vật đang được chở
+            :return: Từ điển vật di chuyển -> danh sách nhân vật đang đứng trên vật đó
+        """
+        result = {}
+        for actor in self.actors:
+            if actor.platform:
+                result.setdefault(actor.platform, []).append(actor)
+        return result
+
+    def update(self):
+        """
+        Dời các nhân vật đang được chở theo quãng đường vật di chuyển đã đi trong frame (`rect` so với `old_rect`),
+            gọi sau khi các vật di chuyển đã được cập nhật
+        Mỗi trục được dời rồi xử lý va chạm riêng, giống thứ tự trong `Player.move`
+        """
+        for actor in self.actors:
+            body = actor.platform
+            if body and body.alive():
+                dx, dy = body.rect.x - body.old_rect.x, body.rect.y - body.old_rect.y
+                if dx:
+                    actor.hitbox_rect.x += dx
+                    actor.collision('horizontal')
+                if dy:
+                    actor.hitbox_rect.y += dy
+                    actor.collision('vertical')
+                actor.rect.center = actor.hitbox_rect.center
@@ -1,26 +1,39 @@
 from settings import *
 from sprites import Sprite, MovingSprite, AnimatedSprite, Spike, Item, ParticleEffectSprite
 from player import Player
-from groups import AllSprites
+from groups import AllSprites, SpatialGroup
+from spatial import OccupancyGrid
+from kinematic import KinematicBodies
 from enemies import Tooth, Fly, Shell, Pearl
+from support import iter_chunks, tile_surface, flip_frames
+from snapshot import state_attributes, save_sprite, load_sprite, save_delta, load_delta
 
 from random import uniform
+from time import perf_counter
 class Level:
     """
     Đại diện cho một màn chơi trong game Jump Pirate.
     Lớp này chịu trách nhiệm quản lý các thành phần, đối tượng, logic va chạm và cập nhật của một màn chơi
     * Phương thức
-    setup(tmx_map, level_frames, audio_files):Thiết lập level dựa trên dữ liệu từ TMX map, hình ảnh và âm thanh
+    setup_steps(tmx_map, level_frames, audio_files): Thiết lập level dựa trên dữ liệu từ TMX map, hình ảnh và âm thanh,
+        từng bước một (generator)
+    build(deadline): Chạy các bước thiết lập còn lại, có thể dừng ở một thời điểm để chạy tiếp ở frame sau
     create_pearl(pos, direction): Tạo một sprite 'pearl' mới
     pearl_collision(): Xử lý va chạm giữa 'pearl' với các sprite khác (xóa 'pearl' khi va chạm)
     hit_collision(): Xử lý va chạm giữa người chơi với các sprite gây sát thương
     item_collision(): Xử lý va chạm giữa người chơi với các sprite item (kích hoạt item và xóa).
     attack_collision(): Xử lý va chạm giữa đòn tấn công của người chơi với các enemy 'fly', 'tooth' và 'pearl'
         (đảo ngược hướng di chuyển của enemy hoặc xóa 'pearl').
+    nearby_entities(group, rect): Lấy các sprite của một nhóm có thể chạm vào một vùng (qua lưới `entity_sprites` nếu bật)
     check_constraint(): Kiểm tra các ràng buộc của người chơi trong màn chơi (giới hạn trái phải, rơi xuống hoặc chạm đích).
+    save_state(): Lưu trạng thái của các đối tượng động trong màn chơi
+    load_state(state): Khôi phục trạng thái đã lưu mà không tạo lại các sprite
+    restart(): Chơi lại màn chơi từ đầu
+    checkpoint_collision(): Lưu trạng thái khi người chơi chạm vào một checkpoint mới
+    respawn(): Hồi sinh người chơi tại checkpoint gần nhất
     run(dt): Cập nhật và hiển thị màn chơi.
     """
-    def __init__(self, tmx_map, level_frames, audio_files, data, switch_stage):
+    def __init__(self, tmx_map, level_frames, audio_files, data, switch_stage, build=True):
         """
         Hàm khởi tạo
         Khởi tạo một đối tượng Level mới, đại diện cho một màn chơi trong game Jump Pirate
@@ -30,13 +43,14 @@ class Level:
             Xử lý dữ liệu level từ TMX map
             Khởi tạo các nhóm sprite
             Khởi tạo các thuộc tính khác
-            Gọi phương thức setup để thiết lập chi tiết level dựa trên TMX map, hình ảnh và âm thanh
             Khởi tạo các âm thanh
+            Chạy các bước của setup_steps để thiết lập chi tiết level dựa trên TMX map, hình ảnh và âm thanh (nếu `build`)
             :param tmx_map: Đối tượng TMX map chứa dữ liệu cấu trúc của màn chơi
             :param level_frames: Từ điển chứa các frame ảnh đại diện cho các sprite trong màn chơi
             :param audio_files: Từ điển chứa các file âm thanh được sử dụng trong màn chơi
             :param data: Từ điển chứa các file âm thanh được sử dụng trong màn chơi
             :param switch_stage: Hàm để chuyển đổi giữa các màn chơi (overworld, level)
+            :param build: False để chỉ khởi tạo, các bước thiết lập được chạy sau đó bằng `build` (có thể qua nhiều frame)
         """
         self.display_surface = pygame.display.get_surface()
         self.data = data
@@ -49,24 +63,16 @@ class Level:
         tmx_level_properties = tmx_map.get_layer_by_name('Data')[0].properties
         self.level_unlock = tmx_level_properties['level_unlock']
 
-        if tmx_level_properties['bg']:
-            bg_tile = level_frames['bg_tiles'][tmx_level_properties['bg']]
-        else:
-            bg_tile = None
-
         # groups
-        self.all_sprites = AllSprites(
-            width=tmx_map.width,
-            height=tmx_map.height,
-            bg_tile=bg_tile,
-            top_limit=tmx_level_properties['top_limit'],
-            clouds={'large': level_frames['cloud_large'], 'small': level_frames['cloud_small']},
-            horizon_line=tmx_level_properties['horizon_line']
-        )
+        # `all_sprites` được tạo ở bước đầu tiên của setup_steps (vẽ sẵn nền gạch, tạo mây)
         # Nhóm sprite kiểm tra đụng độ
-        self.collision_sprites = pygame.sprite.Group()
+        # Có lưới không gian đi kèm: tile tĩnh được đưa vào lưới một lần khi setup, nền di chuyển và Shell được cập
+        # nhật lại ô mỗi frame, nhân vật chỉ kiểm tra các sprite quanh vùng di chuyển của mình
+        self.collision_sprites = SpatialGroup()
         # Semi collision
-        self.semi_collision_sprites = pygame.sprite.Group()
+        self.semi_collision_sprites = SpatialGroup()
+        # Nền di chuyển có thể chở nhân vật
+        self.kinematic_bodies = KinematicBodies()
 
         self.damage_sprites = pygame.sprite.Group()
 
@@ -75,13 +81,15 @@ class Level:
         self.fly_sprites = pygame.sprite.Group()
         self.pearl_sprites = pygame.sprite.Group()
         self.item_sprites = pygame.sprite.Group()
+        # Lưới không gian chung của các sprite gây sát thương, enemy và item, được cập nhật một lần mỗi frame sau khi
+        # cập nhật `all_sprites`, chỉ khi level có từ ENTITY_GRID_THRESHOLD sprite trở lên (`entity_grid`)
+        self.entity_sprites = SpatialGroup()
+        self.entity_grid = False
 
         # frames
         self.pearl_surf = level_frames['pearl']
         self.particle_frames = level_frames['particle']
 
-        self.setup(tmx_map, level_frames, audio_files)
-
         # audio
         self.coin_sound = audio_files['coin']
         self.coin_sound.set_volume(0.2)
@@ -90,13 +98,46 @@ class Level:
         self.pearl_sound = audio_files['pearl']
         self.pearl_sound.set_volume(1.5)
 
-    def setup(self, tmx_map, level_frames, audio_files):
+        # Checkpoint gần nhất: (vùng checkpoint, trạng thái khác với ban đầu, số xu lúc chạm)
+        self.checkpoint = None
+
+        # Các bước thiết lập chưa chạy, màn chơi được tạo trước trên overworld chạy chúng qua nhiều frame
+        self.setup = self.setup_steps(tmx_map, level_frames, audio_files)
+        self.built = False
+        if build:
+            self.build()
+
+    def build(self, deadline=None):
+        """
+        Chạy các bước thiết lập còn lại của level, dừng lại khi đã qua `deadline` để chạy tiếp ở lần gọi sau
+        Mỗi lần gọi chạy ít nhất một bước. Sau bước cuối cùng, trạng thái ban đầu của level được lưu lại
+            :param deadline: Thời điểm (theo `perf_counter`) phải dừng, None để chạy hết các bước
+            :return: True nếu level đã được thiết lập xong
+        """
+        if self.built:
+            return True
+        for _ in self.setup:
+            if deadline is not None and perf_counter() >= deadline:
+                return False
+        self.setup = None
+        self.built = True
+        # Trạng thái ban đầu, dùng để chơi lại màn chơi mà không phải tạo lại từ bản đồ
+        self.initial_state = self.save_state()
+        return True
+
+    def setup_steps(self, tmx_map, level_frames, audio_files):
         """
         Thiết lập chi tiết cho level dựa trên dữ liệu từ TMX map, hình ảnh và âm thanh
         Phương thức này được gọi sau khi khởi tạo level để sắp xếp các thành phần (sprite, nhóm sprite) theo đúng
             cấu trúc của màn chơi
+        Là một generator: dừng (yield) sau mỗi bước ngắn (một layer tile, một chunk, một layer object, một khung hình nước)
+            để `build` có thể chia việc thiết lập ra nhiều frame
         Các bước thực hiện:
+            Tạo nhóm `all_sprites` với nền gạch hoặc mây theo thuộc tính của layer 'Data'
             Xử lý tile: Duyệt qua các layer 'BG', 'Terrain', 'FG', và 'Platforms' trong TMX map.
+                Các tile được vẽ sẵn vào các chunk (`iter_chunks`) theo lớp z, mỗi chunk là một `Sprite` để hiển thị
+                Tile của 'Terrain' và 'Platforms' vẫn là `Sprite` riêng trong nhóm va chạm nhưng không được vẽ
+                Tile của 'Terrain' (SOLID) và 'Platforms' (ONE_WAY) được ghi vào bản đồ chiếm chỗ `occupancy`
             Xử lý chi tiết nền: Duyệt qua các object trong layer 'BG details' của TMX map.
             Xử lý nhân vật và object: Duyệt qua các object trong layer 'Objects' của TMX map.
                 Nếu object có tên là "player":
@@ -122,17 +163,39 @@ class Level:
                     Tính toán điểm bắt đầu và kết thúc của đường di chuyển
                     Xác định hướng di chuyển và tốc độ
                     Khởi tạo đối tượng `MovingSprite` để điều khiển chuyển động của object
+                    Nền di chuyển (thuộc tính 'platform') được thêm vào `kinematic_bodies` để chở người chơi
                     Vẽ đường di chuyển của object (nếu cần thiết, ví dụ: 'saw')
             Xử lý enemy: Duyệt qua các object trong layer 'Enemies' của TMX map.
             Xử lý item: Duyệt qua các object trong layer 'Items' của TMX map.
+            Xử lý checkpoint: Lưu vùng của các object trong layer 'Checkpoints' (nếu có) của TMX map.
             :param tmx_map: Đối tượng TMX map chứa dữ liệu cấu trúc của màn chơi
             :param level_frames: Từ điển chứa các frame ảnh đại diện cho các sprite trong màn chơi
             :param audio_files: Từ điển chứa các file âm thanh được sử dụng trong màn chơi
         """
+        tmx_level_properties = tmx_map.get_layer_by_name('Data')[0].properties
+        if tmx_level_properties['bg']:
+            bg_tile = level_frames['bg_tiles'][tmx_level_properties['bg']]
+        else:
+            bg_tile = None
+        self.all_sprites = AllSprites(
+            width=tmx_map.width,
+            height=tmx_map.height,
+            bg_tile=bg_tile,
+            top_limit=tmx_level_properties['top_limit'],
+            clouds={'large': level_frames['cloud_large'], 'small': level_frames['cloud_small']},
+            horizon_line=tmx_level_properties['horizon_line']
+        )
+        yield
+
         # Load tiles
+        # Tile tĩnh được vẽ sẵn vào các chunk theo từng lớp z, mỗi frame chỉ cần blit vài chunk thay vì từng tile
+        # Terrain và Platforms vẫn tạo sprite riêng (không vẽ) để giữ nguyên việc kiểm tra va chạm
+        # và được ghi vào bản đồ chiếm chỗ `occupancy` cho các phép kiểm tra tiếp xúc (chân nhân vật, mép của enemy)
+        chunk_tiles = {Z_LAYERS['bg tiles']: [], Z_LAYERS['main']: []}
+        self.occupancy = OccupancyGrid(tmx_map.width, tmx_map.height)
         for layer in ['BG', 'Terrain', 'FG', 'Platforms']:
             for x, y, surf in tmx_map.get_layer_by_name(layer).tiles():
-                groups = [self.all_sprites]
+                groups = []
                 if layer == 'Terrain':
                     groups.append(self.collision_sprites)
                 if layer == 'Platforms':
@@ -144,7 +207,17 @@ class Level:
                         z = Z_LAYERS['bg tiles']
                     case _:
                         z = Z_LAYERS['main']
-                Sprite((x * TILE_SIZE, y * TILE_SIZE), surf, groups, z)
+                chunk_tiles[z].append((x, y, surf))
+                if groups:
+                    tile = Sprite((x * TILE_SIZE, y * TILE_SIZE), surf, groups, z)
+                    # tile đã có trong `occupancy`, các phép kiểm tra tiếp xúc chỉ cần duyệt các vật cản khác
+                    tile.tile = True
+                    self.occupancy.add(x, y, OccupancyGrid.SOLID if layer == 'Terrain' else OccupancyGrid.ONE_WAY)
+            yield
+        for z, tiles in chunk_tiles.items():
+            for pos, surf in iter_chunks(tiles):
+                Sprite(pos, surf, self.all_sprites, z)
+                yield
 
         # Load bg details
         for obj in tmx_map.get_layer_by_name('BG details'):
@@ -157,6 +230,7 @@ class Level:
                 if obj.name == 'candle':
                     AnimatedSprite((obj.x, obj.y) + vector(-20, -20), level_frames['candle_light'], self.all_sprites,
                                    Z_LAYERS['bg tiles'])
+        yield
 
         # Load player/object
         for obj in tmx_map.get_layer_by_name('Objects'):
@@ -166,6 +240,8 @@ class Level:
                     groups=self.all_sprites,
                     collision_sprites=self.collision_sprites,
                     semi_collision_sprites=self.semi_collision_sprites,
+                    occupancy=self.occupancy,
+                    kinematic_bodies=self.kinematic_bodies,
                     frames=level_frames['player'],
                     data=self.data,
                     attack_sound=audio_files['attack'],
@@ -182,13 +258,13 @@ class Level:
                     # Kiểm tra xem spike có ở trên trần hay không
                     if obj.name == 'floor_spike' and obj.properties['inverted']:
                         # flip spike
-                        frames = [pygame.transform.flip(frame, False, True) for frame in frames]
+                        frames = flip_frames(frames, False, True)
 
                     # groups
                     groups = [self.all_sprites]
                     # Nếu palm không phải bg thì cho có thể nhảy lên được
                     if obj.name in ('palm_small', 'palm_large'): groups.append(self.semi_collision_sprites)
-                    if obj.name in ('saw', 'floor_spike'): groups.append(self.damage_sprites)
+                    if obj.name in ('saw', 'floor_spike'): groups.extend((self.damage_sprites, self.entity_sprites))
 
                     # z index
                     z = Z_LAYERS['main'] if not 'bg' in obj.name else Z_LAYERS['bg details']
@@ -198,6 +274,7 @@ class Level:
                     AnimatedSprite((obj.x, obj.y), frames, groups, z, animation_speed)
             if obj.name == 'flag':
                 self.level_finish_rect = pygame.FRect((obj.x, obj.y), (obj.width, obj.height))
+        yield
 
         # Load moving object
         for obj in tmx_map.get_layer_by_name('Moving Objects'):
@@ -209,7 +286,7 @@ class Level:
                     speed=obj.properties['speed'],
                     start_angle=obj.properties['start_angle'],
                     end_angle=obj.properties['end_angle'],
-                    groups=(self.all_sprites, self.damage_sprites))
+                    groups=(self.all_sprites, self.damage_sprites, self.entity_sprites))
                 # vẽ chấm từ tâm đến spike để giúp người chơi nhìn đễ hơn
                 for radius in range(0, obj.properties['radius'], 20):
                     Spike(
@@ -224,7 +301,7 @@ class Level:
             else:
                 frames = level_frames[obj.name]
                 groups = (self.all_sprites, self.semi_collision_sprites) if obj.properties['platform'] else (
-                self.all_sprites, self.damage_sprites)
+                self.all_sprites, self.damage_sprites, self.entity_sprites)
                 # Lấy điểm giữa (đầu và cuối) của vật di chuyển
                 if obj.width > obj.height:  # horizontal
                     move_dir = 'x'
@@ -235,7 +312,9 @@ class Level:
                     start_pos = (obj.x + obj.width / 2, obj.y)
                     end_pos = (obj.x + obj.width / 2, obj.y + obj.height)
                 speed = obj.properties['speed']
-                MovingSprite(frames, groups, start_pos, end_pos, move_dir, speed, obj.properties['flip'])
+                moving_sprite = MovingSprite(frames, groups, start_pos, end_pos, move_dir, speed, obj.properties['flip'])
+                if obj.properties['platform']:
+                    self.kinematic_bodies.add(moving_sprite)
                 if obj.name == 'saw':
                     # Kiểm tra hướng đi của saw để flip animation khi đi ngược lại
                     # Vẽ đường di chuyển của saw để người chơi biết cận trái phải hoặc trên dưới của vậy cản
@@ -251,12 +330,15 @@ class Level:
                         top, bottom = int(start_pos[1]), int(end_pos[1])
                         for y in range(top, bottom, 20):
                             Sprite((x, y), level_frames['saw_chain'], self.all_sprites, Z_LAYERS['bg details'])
+        yield
 
         # Load enemies
         for obj in tmx_map.get_layer_by_name('Enemies'):
             if obj.name == 'tooth':
                 Tooth((obj.x, obj.y), level_frames['tooth'],
-                      (self.all_sprites, self.damage_sprites, self.tooth_sprites), self.collision_sprites)
+                      (self.all_sprites, self.damage_sprites, self.tooth_sprites, self.entity_sprites),
+                      self.collision_sprites,
+                      self.occupancy)
             if obj.name == 'shell':
                 Shell(
                     pos=(obj.x, obj.y),
@@ -270,27 +352,46 @@ class Level:
                     )
             if obj.name == 'fly':
                 Fly((obj.x, obj.y), level_frames['fly'],
-                      (self.all_sprites, self.damage_sprites, self.fly_sprites), self.collision_sprites)
+                      (self.all_sprites, self.damage_sprites, self.fly_sprites, self.entity_sprites),
+                      self.collision_sprites,
+                      self.occupancy)
+        yield
 
         # Load items
         for obj in tmx_map.get_layer_by_name('Items'):
             # Lấy vị trí nằm ở chính giữa 1 tile
             Item(obj.name, (obj.x + TILE_SIZE / 2, obj.y + TILE_SIZE / 2), level_frames['items'][obj.name],
-                 (self.all_sprites, self.item_sprites), self.data)
+                 (self.all_sprites, self.item_sprites, self.entity_sprites), self.data)
+        yield
 
         # Load water
+        # Mỗi vùng nước là một sprite duy nhất, các khung hình được ghép sẵn từ các ô nước
         for obj in tmx_map.get_layer_by_name('Water'):
             rows = int(obj.height / TILE_SIZE)
             cols = int(obj.width / TILE_SIZE)
-            for row in range(rows):
-                for col in range(cols):
-                    x = obj.x + col * TILE_SIZE
-                    y = obj.y + row * TILE_SIZE
-                    # Nếu là hàng đầu thì sẽ thêm animation, các hàng khác không cần
-                    if row == 0:
-                        AnimatedSprite((x, y), level_frames['water_top'], self.all_sprites, Z_LAYERS['water'])
-                    else:
-                        Sprite((x, y), level_frames['water_body'], self.all_sprites, Z_LAYERS['water'])
+            # Hàng đầu có animation, các hàng khác là phần thân tĩnh
+            body = tile_surface(level_frames['water_body'], cols, rows - 1)
+            yield
+            frames = []
+            for top in level_frames['water_top']:
+                frame = pygame.Surface((cols * TILE_SIZE, rows * TILE_SIZE), pygame.SRCALPHA)
+                frame.blit(tile_surface(top, cols, 1), (0, 0))
+                frame.blit(body, (0, TILE_SIZE))
+                frames.append(frame.convert_alpha())
+                yield
+            AnimatedSprite((obj.x, obj.y), frames, self.all_sprites, Z_LAYERS['water'])
+
+        # Load checkpoints
+        # Layer không bắt buộc, màn chơi không có checkpoint thì rơi khỏi bản đồ sẽ quay về overworld
+        self.checkpoints = []
+        if 'Checkpoints' in tmx_map.layernames:
+            for obj in tmx_map.get_layer_by_name('Checkpoints'):
+                self.checkpoints.append(pygame.FRect((obj.x, obj.y), (obj.width, obj.height)))
+
+        # Dựng lưới va chạm ngay khi tạo màn chơi thay vì ở frame đầu tiên
+        self.collision_sprites.refresh()
+        yield
+        self.semi_collision_sprites.refresh()
 
     def create_pearl(self, pos, direction):
         """
@@ -299,30 +400,39 @@ class Level:
             :param pos:
             :param direction:
         """
-        Pearl(pos, (self.all_sprites, self.damage_sprites, self.pearl_sprites), self.pearl_surf, direction, 150)
+        Pearl(pos, (self.all_sprites, self.damage_sprites, self.pearl_sprites, self.entity_sprites), self.pearl_surf,
+              direction, 150)
         self.pearl_sound.play()
 
     def pearl_collision(self):
         """
         Xử lý va chạm giữa 'pearl' với các sprite khác trong level
-        Phương thức này kiểm tra va chạm giữa tất cả các sprite trong nhóm `collision_sprites` với nhóm
-            `pearl_sprites`. Khi va chạm xảy ra, 'pearl' sẽ bị xóa và tạo hiệu ứng hạt
+        Phương thức này kiểm tra từng 'pearl' với các vật cản quanh nó: tile được kiểm tra trên bản đồ chiếm chỗ
+            `occupancy`, các vật cản khác (thùng, cửa, shell) được lấy từ lưới của nhóm `collision_sprites`.
+            Khi va chạm xảy ra, 'pearl' sẽ bị xóa và tạo hiệu ứng hạt
+        Chi phí tỉ lệ với số pearl, không phụ thuộc vào số tile của level
         """
         # khi pearl gặp vật cản không phải người thì sẽ bị xóa
-        for sprite in self.collision_sprites:
-            sprite = pygame.sprite.spritecollide(sprite, self.pearl_sprites, True)
-            if sprite:
-                ParticleEffectSprite((sprite[0].rect.center), self.particle_frames, self.all_sprites)
+        if not self.pearl_sprites:
+            return
+        solid_in_rect = self.occupancy.solid_in_rect
+        for pearl in self.pearl_sprites.sprites():
+            rect = pearl.rect
+            if solid_in_rect(rect) or any(sprite.rect.colliderect(rect) for sprite in self.collision_sprites.nearby(rect)
+                                          if not hasattr(sprite, 'tile')):
+                pearl.kill()
+                ParticleEffectSprite(rect.center, self.particle_frames, self.all_sprites)
 
     def hit_collision(self):
         """
         Xử lý va chạm giữa người chơi và các sprite gây sát thương trong level.
-        Phương thức này kiểm tra va chạm giữa `hitbox_rect` của người chơi với các sprite trong nhóm `damage_sprites`.
+        Phương thức này kiểm tra va chạm giữa `hitbox_rect` của người chơi với các sprite trong nhóm `damage_sprites`
+            nằm gần người chơi (lấy từ `nearby_entities`).
         Khi va chạm xảy ra, người chơi sẽ nhận sát thương, âm thanh va chạm được phát và sprite gây sát thương có thể bị
             xóa (nếu là 'pearl' dính vào người chơi)
         """
         # Hàm kiểm tra khi người chơi bị gây sát thương
-        for sprite in self.damage_sprites:
+        for sprite in self.nearby_entities(self.damage_sprites, self.player.hitbox_rect):
             if sprite.rect.colliderect(self.player.hitbox_rect):
                 self.player.get_damage()
                 self.damage_sound.play()
@@ -334,34 +444,44 @@ class Level:
     def item_collision(self):
         """
         Xử lý va chạm giữa người chơi và các sprite item trong level.
-        Phương thức này kiểm tra va chạm giữa `hitbox_rect` của người chơi với các sprite trong nhóm `item_sprites`.
+        Phương thức này kiểm tra va chạm giữa `rect` của người chơi với các sprite trong nhóm `item_sprites` nằm gần
+            người chơi (lấy từ `nearby_entities`).
         Khi va chạm xảy ra:
             Item va chạm sẽ được kích hoạt (thực hiện chức năng của nó).
-            Item va chạm sẽ bị xóa khỏi level.
             Hiệu ứng hạt được tạo ra tại vị trí của item.
             Âm thanh thu thập coin được phát.
+            Item va chạm sẽ bị xóa khỏi level.
         :return:
         """
         # Kiểm ra xem người chơi có chạm vào items hay không, nếu có thì sẽ thực hiện điều ứng với items ố và làm nó biến mất
         if self.item_sprites:
-            item_sprites = pygame.sprite.spritecollide(self.player, self.item_sprites, True)
+            item_sprites = [sprite for sprite in self.nearby_entities(self.item_sprites, self.player.rect)
+                            if sprite.rect.colliderect(self.player.rect)]
             if item_sprites:
                 item_sprites[0].activate()
                 ParticleEffectSprite((item_sprites[0].rect.center), self.particle_frames, self.all_sprites)
                 self.coin_sound.play()
+            for sprite in item_sprites:
+                sprite.kill()
 
     def attack_collision(self):
         """
         Xử lý va chạm tấn công giữa người chơi và các sprite enemy trong level
         Phương thức này kiểm tra va chạm giữa `hitbox_rect` của người chơi với các sprite trong nhóm `pearl_sprites`,
-            `tooth_sprites` và `fly_sprites`. Khi va chạm xảy ra và đáp ứng các điều kiện sau:
+            `tooth_sprites` và `fly_sprites` nằm gần người chơi (lấy từ `nearby_entities`).
+            Khi va chạm xảy ra và đáp ứng các điều kiện sau:
             Người chơi đang tấn công
             Người chơi đang đối mặt với mục tiêu (được xác định dựa trên hướng di chuyển của người chơi và vị trí của mục tiêu).
         Phương thức sẽ thực hiện các hành động sau:
             Đảo ngược hướng di chuyển của mục tiêu enemy (khiến nó đi ngược lại)
         """
         # Có khả năng đánh fly và tooth để đi ngược lại, đánh pearl thì pearl sẽ mất
-        for target in self.pearl_sprites.sprites() + self.tooth_sprites.sprites() + self.fly_sprites.sprites():
+        if not self.player.attacking:
+            return
+        targets = (self.nearby_entities(self.pearl_sprites, self.player.rect) +
+                   self.nearby_entities(self.tooth_sprites, self.player.rect) +
+                   self.nearby_entities(self.fly_sprites, self.player.rect))
+        for target in targets:
             # Chỉ thực hiện khi người chơi va chạm với vật, đang đánh và đối mặt với mục tiêu
             # Nếu vị trí của người chơi < vị trí vật và người chơi quay phải thì người chơi đang đối mặtvowisi mục tiêu và ngược lại
             facing_target = self.player.rect.centerx < target.rect.centerx and self.player.facing_right or \
@@ -369,6 +489,19 @@ class Level:
             if target.rect.colliderect(self.player.rect) and self.player.attacking and facing_target:
                 target.reverse()
 
+    def nearby_entities(self, group, rect):
+        """
+        Lấy các sprite của một nhóm (damage_sprites, item_sprites, ...) có thể chạm vào một vùng
+        Khi `entity_grid` bật, chỉ lấy các sprite của nhóm nằm trong các ô của lưới `entity_sprites` mà vùng chạm tới,
+            nếu không thì trả về cả nhóm
+            :param group: Nhóm sprite, mọi sprite của nhóm đều nằm trong `entity_sprites`
+            :param rect: Vùng cần kiểm tra
+            :return: Danh sách sprite theo thứ tự được thêm vào level (giống khi duyệt cả nhóm)
+        """
+        if not self.entity_grid:
+            return group.sprites()
+        return [sprite for sprite in self.entity_sprites.nearby(rect, ordered=True) if sprite in group]
+
     def check_constraint(self):
         """
         Kiểm tra các ràng buộc di chuyển của người chơi trong level
@@ -381,24 +514,86 @@ class Level:
             self.player.hitbox_rect.right = self.level_width
 
         # bottom border
+        # Đã chạm checkpoint thì hồi sinh tại đó (vẫn mất một máu), nếu không thì quay về overworld
         if self.player.hitbox_rect.bottom > self.level_bottom:
-            self.switch_stage('overworld', -1)
+            if self.checkpoint:
+                self.data.health -= 1
+                self.respawn()
+            else:
+                self.switch_stage('overworld', -1)
 
         # success
         if self.player.hitbox_rect.colliderect(self.level_finish_rect):
             print("success")
             self.switch_stage('overworld', self.level_unlock)
 
+    def save_state(self):
+        """
+        Lưu trạng thái của các đối tượng động (nhân vật, enemy, vật di chuyển, gai, item) đang có trong màn chơi
+            :return: Danh sách trạng thái của từng sprite (xem snapshot.py)
+        """
+        return [save_sprite(sprite) for sprite in self.all_sprites if state_attributes(sprite)]
+
+    def load_state(self, state):
+        """
+        Khôi phục trạng thái đã lưu bởi `save_state` mà không tạo lại các sprite
+        Các pearl và hiệu ứng hạt được tạo sau khi lưu bị xóa, item đã được nhặt sau khi lưu xuất hiện lại
+            :param state: Trạng thái được trả về bởi `save_state`
+        """
+        for sprite in self.all_sprites.sprites():
+            if sprite in self.pearl_sprites or isinstance(sprite, ParticleEffectSprite):
+                sprite.kill()
+        for entry in state:
+            load_sprite(entry)
+
+    def restart(self):
+        """
+        Chơi lại màn chơi từ đầu: khôi phục trạng thái ban đầu và bỏ checkpoint đã chạm
+        """
+        self.checkpoint = None
+        self.load_state(self.initial_state)
+
+    def checkpoint_collision(self):
+        """
+        Kiểm tra người chơi chạm vào checkpoint
+        Khi chạm vào một checkpoint khác với checkpoint gần nhất, trạng thái hiện tại được lưu dưới dạng phần khác
+            so với trạng thái ban đầu (chỉ các thuộc tính đã thay đổi, item đã được nhặt) cùng với số xu
+        """
+        for rect in self.checkpoints:
+            if rect.colliderect(self.player.hitbox_rect) and not (self.checkpoint and self.checkpoint[0] is rect):
+                self.checkpoint = (rect, save_delta(self.initial_state), self.data.coins)
+
+    def respawn(self):
+        """
+        Hồi sinh người chơi tại checkpoint gần nhất
+        Trạng thái ban đầu được khôi phục rồi áp dụng phần đã thay đổi lúc chạm checkpoint, số xu trở về giá trị lúc
+            chạm checkpoint (các item nhặt sau đó xuất hiện lại). Người chơi đứng yên tại đáy của vùng checkpoint
+        """
+        rect, delta, coins = self.checkpoint
+        self.load_state(self.initial_state)
+        load_delta(delta)
+        self.data.coins = coins
+
+        self.player.hitbox_rect.midbottom = rect.midbottom
+        self.player.old_rect = self.player.hitbox_rect.copy()
+        self.player.rect.center = self.player.hitbox_rect.center
+        self.player.direction = vector()
+        self.player.platform = None
+
     def run(self, dt):
         """
         Cập nhật và hiển thị level
         Phương thức này thực hiện các hành động chính để chạy level, bao gồm:
             Tô nền cho màn hình hiển thị ("gray").
+            Cập nhật ô lưới của các vật cản di chuyển trong nhóm `collision_sprites` và `semi_collision_sprites`.
             Cập nhật tất cả sprite trong nhóm `all_sprites` dựa trên `dt` (delta time).
-            Kiểm tra va chạm giữa "pearl" và các sprite khác, xử lý va chạm.
+            Dời người chơi theo nền di chuyển đang đỡ người chơi (`kinematic_bodies`), xử lý lại va chạm với vật cản.
+            Cập nhật lưới `entity_sprites` của các sprite gây sát thương, enemy và item nếu level có nhiều sprite này.
+            Kiểm tra va chạm giữa "pearl" và các vật cản quanh nó, xử lý va chạm.
             Kiểm tra va chạm giữa người chơi và các sprite gây sát thương, xử lý sát thương.
             Kiểm tra va chạm giữa người chơi và các sprite item, xử lý item và hiệu ứng.
             Kiểm tra va chạm tấn công giữa người chơi và các enemy, xử lý hướng di chuyển của enemy.
+            Kiểm tra người chơi chạm vào checkpoint.
             Kiểm tra các ràng buộc di chuyển của người chơi trong level.
             Vẽ tất cả sprite trong nhóm `all_sprites` với tâm là `hitbox_rect.center` của người chơi và
                 theo `dt` (delta time) để tạo hiệu ứng mượt mà.
@@ -406,11 +601,18 @@ class Level:
         """
         self.display_surface.fill("gray")
 
+        self.collision_sprites.refresh()
+        self.semi_collision_sprites.refresh()
         self.all_sprites.update(dt)
+        self.kinematic_bodies.update()
+        self.entity_grid = len(self.entity_sprites) >= ENTITY_GRID_THRESHOLD
+        if self.entity_grid:
+            self.entity_sprites.refresh()
         self.pearl_collision()
         self.hit_collision()
         self.item_collision()
         self.attack_collision()
+        self.checkpoint_collision()
         self.check_constraint()
 
         self.all_sprites.draw(self.player.hitbox_rect.center, dt)
@@ -4,9 +4,14 @@ import pygame
 
 from settings import *
 from level import Level
-from pytmx.util_pygame import load_pygame
+from tilemap import load_map, OVERWORLD_MAP
+from registry import LevelRegistry
+from preload import LevelPreloader
 from os.path import join
 from support import *
+from atlas import Atlas
+from bundle import Bundle
+from assets import AssetManager
 from data import *
 from debug import debug
 from ui import UI
@@ -23,6 +28,8 @@ class Game:
         Âm nhạc nền (bg_music)
     * Phương thức
     switch_stage(target, unlock=0): Chuyển đổi giữa các giai đoạn chơi khác nhau (màn chơi, overworld)
+    preload_level(level): Chuẩn bị trước màn chơi (đọc bản đồ trong luồng nền, tạo màn chơi dần qua các frame)
+    create_level(level, compiled=None, build=True): Tạo màn chơi theo chỉ số
     import_assets(self): Nhập các tài nguyên (hình ảnh, âm thanh) cần thiết cho trò chơi
     run(self): Vòng lặp chính của trò chơi, xử lý các sự kiện, cập nhật và hiển thị trò chơi mỗi khung hình
     check_game_over(self): Kiểm tra điều kiện kết thúc trò chơi (mất hết máu)
@@ -42,7 +49,9 @@ class Game:
             Khởi tạo các thành phần chính:
                 `ui`: Tạo đối tượng `UI` để quản lý giao diện người dùng (UI)
                 `data`: Tạo đối tượng `Data` để lưu trữ các dữ liệu trò chơi
-                `tmx_maps`: Tạo một từ điển lưu trữ các bản đồ Tiled Map Editor (TMX) của các màn chơi.
+                `tmx_maps`: Danh sách các bản đồ Tiled Map Editor (TMX) của các màn chơi trong data/levels, mỗi bản đồ
+                    chỉ được tải khi cần và chỉ các bản đồ dùng gần đây được giữ trong bộ nhớ (xem registry.py).
+                    Bản đồ được tải từ bản đã biên dịch (xem tilemap.py), chỉ phân tích lại file TMX khi file thay đổi
                 `tmx_overworld`: Tải bản đồ TMX của màn hình overworld.
                 `current_stage`: Khởi tạo màn chơi đầu tiên (`Level`) bằng cách truyền bản đồ TMX, hình ảnh, âm thanh,
                     dữ liệu trò chơi và phương thức
@@ -60,13 +69,22 @@ class Game:
         self.text_font = pygame.font.Font('./font/Pixeltype.ttf', 60)
         self.ui = UI(self.font, self.ui_frames)
         self.data = Data(self.ui)
-        self.tmx_maps = {
-            0: load_pygame(join('.', 'data', 'levels', '1.tmx')),
-            1: load_pygame(join('.', 'data', 'levels', '2.tmx')),
-            2: load_pygame(join('.', 'data', 'levels', '3.tmx')),
-        }
-        self.tmx_overworld = load_pygame(join('.', 'data', 'overworld', 'overworld.tmx'))
-        self.current_stage = Level(self.tmx_maps[0], self.level_frames, self.audio_files, self.data, self.switch_stage)
+        self.tmx_maps = LevelRegistry()
+        self.tmx_overworld = load_map(OVERWORLD_MAP)
+        # Màn chơi được chọn trên overworld được chuẩn bị trước: bản đồ được đọc trong luồng nền, màn chơi được tạo dần
+        # trong các frame của overworld
+        self.preloader = LevelPreloader(self.tmx_maps.read, self.create_level, self.assets) if PRELOAD_LEVELS else None
+        # Overworld được tạo ở lần đầu tiên chuyển đến và được dùng lại cho các lần sau
+        self.overworld = None
+        # (chỉ số, Level) của màn chơi gần nhất, được khôi phục về trạng thái ban đầu khi chơi lại màn chơi đó
+        # Màn chơi (và overworld) được giữ lại vẫn tham chiếu đến khung hình của nó sau khi tài nguyên được giải phóng,
+        # giải phóng chỉ xóa tài nguyên khỏi bộ nhớ đệm để màn chơi mới không dùng lại
+        self.last_level = None
+        # Mỗi giai đoạn giữ tài nguyên của nó đúng một lần khi bắt đầu và giải phóng một lần khi kết thúc
+        self.stage_name = 'level'
+        self.assets.acquire(self.stage_name)
+        self.current_stage = self.create_level(0)
+        self.last_level = (0, self.current_stage)
 
         # BG music
         # Đặt -1 đề loop
@@ -77,74 +95,88 @@ class Game:
         """
         Chuyển đổi giữa các giai đoạn chơi khác nhau trong trò chơi Jump Pirate
         Phương thức này được gọi để chuyển đổi giữa màn chơi (level) và màn hình overworld
+        Tài nguyên của giai đoạn mới được giữ lại trước khi tạo, tài nguyên của giai đoạn cũ được giải phóng sau đó
+        Màn chơi đã được chuẩn bị trước (khi người chơi đứng ở nút trên overworld) được dùng nếu có
+        Overworld chỉ được tạo ở lần đầu, các lần sau chỉ tiếp tục (`Overworld.resume`)
+        Chơi lại màn chơi gần nhất (ví dụ sau khi rơi khỏi bản đồ) chỉ khôi phục trạng thái ban đầu của nó
             :param target: Xác định giai đoạn chơi
             :param unlock: Màn chơi được mở khóa khi chuyển đến overworld (chỉ áp dụng khi target là "overworld")
         """
+        self.assets.acquire(target)
         if target == 'level':
-            self.current_stage = Level(self.tmx_maps[self.data.current_level], self.level_frames, self.audio_files,
-                                       self.data, self.switch_stage)
+            index = self.data.current_level
+            if self.last_level and self.last_level[0] == index:
+                level = self.last_level[1]
+                level.restart()
+            else:
+                level = self.preloader and self.preloader.take(index) or self.create_level(index)
+                self.last_level = (index, level)
+            self.current_stage = level
         # overworld
         else:
             if unlock > 0:
                 self.data.unlocked_level = unlock
             else:
                 self.data.health -= 1
-            self.current_stage = Overworld(self.tmx_overworld, self.data, self.overworld_frames, self.switch_stage)
+            if self.overworld is None:
+                self.overworld = Overworld(self.tmx_overworld, self.data, self.overworld_frames, self.switch_stage,
+                                           self.preloader and self.preload_level)
+            else:
+                self.overworld.resume(self.data)
+            self.current_stage = self.overworld
+        self.assets.release(self.stage_name)
+        self.stage_name = target
+
+    def preload_level(self, level):
+        """
+        Chuẩn bị trước màn chơi, trừ khi đó là màn chơi gần nhất (được khôi phục thay vì tạo lại)
+        Được gọi mỗi frame khi người chơi đứng ở một nút: bản đồ được đọc trong luồng nền, sau đó màn chơi được tạo
+            dần trong luồng chính, mỗi frame không quá PRELOAD_FRAME_BUDGET giây
+            :param level: Chỉ số màn chơi
+        """
+        if not (self.last_level and self.last_level[0] == level):
+            self.preloader.request(level)
+            self.preloader.update()
+
+    def create_level(self, level, compiled=None, build=True):
+        """
+        Tạo màn chơi
+            :param level: Chỉ số màn chơi
+            :param compiled: Dữ liệu bản đồ đã được đọc trước trong luồng nền (LevelPreloader), hoặc None
+            :param build: False để chỉ khởi tạo màn chơi, các bước thiết lập được chạy sau bằng `Level.build`
+            :return: Đối tượng Level
+        """
+        if compiled is not None:
+            self.tmx_maps.add(level, compiled)
+        return Level(self.tmx_maps[level], self.level_frames, self.audio_files, self.data, self.switch_stage, build)
 
     def import_assets(self):
         """
         Nhập các tài nguyên (hình ảnh, âm thanh) cần thiết cho trò chơi Jump Pirate
         Phương thức này thực hiện các tác vụ sau để chuẩn bị tài nguyên cho trò chơi:
-            Nhập hình ảnh các đối tượng
+            Chọn nguồn ảnh: bundle (`python code/bundle.py`, USE_BUNDLE) hoặc texture atlas (`python code/atlas.py`,
+                USE_ATLAS) nếu đã được tạo
+            Tạo bộ quản lý tài nguyên, hình ảnh các đối tượng và màn hình overworld chỉ được tải khi cần
             Nhập font chữ
             Nhập hình ảnh giao diện (UI)
-            Nhập hình ảnh màn hình overworld
             Nhập âm thanh
             Nhập nhạc nền
 
         """
-        # Load ảnh của các object cần thiết và lưu vào level_frames
-        self.level_frames = {
-            'flag': import_folder('.', 'graphics', 'level', 'flag'),
-            'saw': import_folder('.', 'graphics', 'enemies', 'saw', 'animation'),
-            'floor_spike': import_folder('.', 'graphics', 'enemies', 'floor_spikes'),
-            'palms': import_sub_folders('.', 'graphics', 'level', 'palms'),
-            'candle': import_folder('.', 'graphics', 'level', 'candle'),
-            'window': import_folder('.', 'graphics', 'level', 'window'),
-            'big_chain': import_folder('.', 'graphics', 'level', 'big_chains'),
-            'small_chain': import_folder('.', 'graphics', 'level', 'small_chains'),
-            'candle_light': import_folder('.', 'graphics', 'level', 'candle light'),
-            'player': import_sub_folders('.', 'graphics', 'player'),
-            'saw': import_folder('.', 'graphics', 'enemies', 'saw', 'animation'),
-            'saw_chain': import_image('.', 'graphics', 'enemies', 'saw', 'saw_chain'),
-            'helicopter': import_folder('.', 'graphics', 'level', 'helicopter'),
-            'boat': import_folder('.', 'graphics', 'objects', 'boat'),
-            'spike': import_image('.', 'graphics', 'enemies', 'spike_ball', 'Spiked Ball'),
-            'spike_chain': import_image('.', 'graphics', 'enemies', 'spike_ball', 'spiked_chain'),
-            'tooth': import_folder('.', 'graphics', 'enemies', 'tooth', 'run'),
-            'shell': import_sub_folders('.', 'graphics', 'enemies', 'shell'),
-            'pearl': import_image('.', 'graphics', 'enemies', 'bullets', 'pearl'),
-            'items': import_sub_folders('.', 'graphics', 'items'),
-            'particle': import_folder('.', 'graphics', 'effects', 'particle'),
-            'water_top': import_folder('.', 'graphics', 'level', 'water', 'top'),
-            'water_body': import_image('.', 'graphics', 'level', 'water', 'body'),
-            'bg_tiles': import_folder_dict('.', 'graphics', 'level', 'bg', 'tiles'),
-            'cloud_small': import_folder('.', 'graphics', 'level', 'clouds', 'small'),
-            'cloud_large': import_image('.', 'graphics', 'level', 'clouds', 'large_cloud'),
-            'fly': import_folder('.', 'graphics', 'enemies', 'fly', 'fly'),
-        }
+        # Ảnh được lấy từ bundle hoặc cắt từ atlas nếu có, nếu không thì đọc từng file
+        use_image_source(USE_BUNDLE and Bundle.load() or USE_ATLAS and Atlas.load() or None)
+
+        # Ảnh của level và overworld được tải khi được truy cập lần đầu và được giải phóng khi không còn màn chơi nào
+        # dùng đến (xem assets.py), level_frames và overworld_frames vẫn được dùng như từ điển
+        self.assets = AssetManager()
+        self.level_frames = self.assets.view('level_frames')
 
         self.font = pygame.font.Font(join('.', 'graphics', 'ui', 'runescape_uf.ttf'), 40)
         self.ui_frames = {
             'heart': import_folder('.', 'graphics', 'ui', 'heart'),
             'coin': import_image('.', 'graphics', 'ui', 'coin')
         }
-        self.overworld_frames = {
-            'palms': import_folder('.', 'graphics', 'overworld', 'palm'),
-            'water': import_folder('.', 'graphics', 'overworld', 'water'),
-            'path': import_folder_dict('.', 'graphics', 'overworld', 'path'),
-            'icon': import_sub_folders('.', 'graphics', 'overworld', 'icon'),
-        }
+        self.overworld_frames = self.assets.view('overworld_frames')
 
         self.audio_files = {
             'coin': pygame.mixer.Sound(join('.', 'audio', 'coin.wav')),
@@ -165,7 +197,7 @@ class Game:
                 Kiểm tra điều kiện kết thúc trò chơi
                 Cập nhật màn chơi hiện tại:
                 Cập nhật giao diện người dùng (UI):
-                Hiển thị khung hình:
+                Hiển thị khung hình: toàn màn hình, hoặc chỉ các vùng thay đổi nếu màn chơi cung cấp `dirty_rects`
         """
         while True:
             # Đặt frame rate để máy yếu chạy mượt và máy mạnh chạy tối đa
@@ -175,7 +207,7 @@ class Game:
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
-                if self.data.health <= 0 or self.data.unlocked_level == 3:
+                if self.data.health <= 0 or self.data.unlocked_level == len(self.tmx_maps):
                     if event.type == pygame.KEYDOWN:
                         pygame.quit()
                         sys.exit()
@@ -185,7 +217,13 @@ class Game:
             self.ui.update(dt)
             self.check_game_over()
 
-            pygame.display.update()
+            # Overworld ở chế độ dirty rect chỉ cần cập nhật các vùng thay đổi và vùng UI
+            # Màn hình kết thúc được vẽ đè lên toàn bộ cửa sổ nên luôn cập nhật toàn màn hình
+            dirty_rects = getattr(self.current_stage, 'dirty_rects', None)
+            if dirty_rects is None or self.data.health <= 0 or self.data.unlocked_level == len(self.tmx_maps):
+                pygame.display.update()
+            else:
+                pygame.display.update(dirty_rects + [self.ui.rect])
 
     def check_game_over(self):
         """
@@ -208,7 +246,7 @@ class Game:
             self.display_surface.blit(self.gameover_message, self.gameover_message_rect)
             self.display_surface.blit(self.over_message, self.over_message_rect)
 
-        if self.data.unlocked_level == 3:
+        if self.data.unlocked_level == len(self.tmx_maps):
             self.display_surface.fill((94, 129, 162))
 
             self.score_message = self.text_font.render(f"Your score: {self.data.coins}", False, (111, 196, 169))
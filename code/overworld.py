@@ -1,5 +1,5 @@
 from settings import *
-from sprites import Sprite, AnimatedSprite, Node, Icon, PathSprite
+from sprites import Sprite, AnimatedSprite, Node, Icon, PathSprite, TiledWater
 from groups import WorldSprites
 from random import randint
 
@@ -9,25 +9,32 @@ class Overworld:
     *Phương thức:
         setup(tmx_map, overworld_frames): Thiết lập overworld
         create_path_sprites(self): Tạo các sprite đường đi
+        resume(data): Tiếp tục overworld đã được tạo khi quay lại từ một màn chơi
         input(self): Xử lý input từ người chơi để di chuyển nhân vật giữa các nút
         move(self, direction): Di chuyển nhân vật đến nút được chọn
         get_current_node(self):Lấy nút hiện tại mà nhân vật đang đứng trên
         run(self, dt): Cập nhật và hiển thị overworld
     """
-    def __init__(self, tmx_map, data, overworld_frames, switch_stage):
+    def __init__(self, tmx_map, data, overworld_frames, switch_stage, preload_level=None):
         """
         Hàm khởi tạo
             :param tmx_map: Bản đồ Tiled của overworld
             :param data: Dữ liệu trò chơi liên quan đến overworld (chẳng hạn như level hiện tại)
             :param overworld_frames: Từ điển chứa các khung hình hoạt ảnh của overworld
             :param switch_stage: Hàm dùng để chuyển đổi giữa các màn chơi (overworld và màn chơi chính)
+            :param preload_level: Hàm chuẩn bị trước màn chơi của nút mà nhân vật đang đứng, được gọi mỗi frame
+                (có thể bỏ qua)
         """
         self.display_surface = pygame.display.get_surface()
         self.data = data
         self.switch_stage = switch_stage
+        self.preload_level = preload_level
+
+        # Vùng màn hình thay đổi ở frame gần nhất (None: cần cập nhật toàn màn hình)
+        self.dirty_rects = None
 
         # groups
-        self.all_sprites = WorldSprites(data)
+        self.all_sprites = WorldSprites(data, OVERWORLD_DIRTY_RECTS)
         self.node_sprites = pygame.sprite.Group()
 
         self.setup(tmx_map, overworld_frames)
@@ -44,6 +51,7 @@ class Overworld:
             TMX map và các khung hình hoạt ảnh được cung cấp
         Duyệt qua các lớp nền ('main' và 'top') trong TMX map để tạo các sprite nền
             bằng lớp `Sprite`
+        Tạo lớp nước `TiledWater` phủ kín bản đồ
         Duyệt qua tất cả ô trong lớp 'Objects' để tạo các sprite tương ứng:
             Nếu đối tượng là 'palm' (cây cọ), sử dụng lớp `AnimatedSprite` để tạo hoạt ảnh
             Nếu đối tượng là 'grass' (cỏ), sử dụng lớp `Sprite` với lớp nền 'bg details'
@@ -66,10 +74,9 @@ class Overworld:
                 Sprite((x * TILE_SIZE, y * TILE_SIZE), surf, self.all_sprites, Z_LAYERS['bg tiles'])
 
         # water
-        for col in range(tmx_map.width):
-            for row in range(tmx_map.height):
-                AnimatedSprite((col * TILE_SIZE, row * TILE_SIZE), overworld_frames['water'], self.all_sprites,
-                               Z_LAYERS['bg'])
+        # Nước phủ kín bản đồ, được vẽ bằng một lớp nước duy nhất thay vì một sprite cho mỗi ô
+        self.all_sprites.water = TiledWater((0, 0, tmx_map.width * TILE_SIZE, tmx_map.height * TILE_SIZE),
+                                            overworld_frames['water'])
 
         # objects
         for obj in tmx_map.get_layer_by_name('Objects'):
@@ -198,6 +205,27 @@ class Overworld:
                         groups=self.all_sprites,
                         level=key)
 
+    def resume(self, data):
+        """
+        Tiếp tục overworld đã được tạo khi quay lại từ một màn chơi, thay vì tạo lại toàn bộ từ bản đồ
+        Biểu tượng người chơi được đặt lại tại nút của màn chơi hiện tại. Đường đi của các màn chơi mới mở khóa tự
+            hiện ra vì WorldSprites chỉ vẽ các PathSprite có level không lớn hơn `data.unlocked_level`
+            :param data: Dữ liệu trò chơi
+        """
+        self.data = data
+        self.all_sprites.data = data
+        for node in self.node_sprites:
+            node.data = data
+
+        self.current_node = [node for node in self.node_sprites if node.level == data.current_level][0]
+        self.icon.rect.center = self.current_node.rect.center
+        self.icon.path = None
+        self.icon.direction = vector()
+
+        # Màn hình đang hiển thị màn chơi nên cần vẽ lại và cập nhật toàn màn hình ở frame đầu tiên
+        self.all_sprites.last_offset = None
+        self.dirty_rects = None
+
     def input(self):
         """
         Xử lý đầu vào từ người chơi trên màn hình overworld.
@@ -246,9 +274,15 @@ class Overworld:
         """
         Cập nhật và hiển thị màn hình overworld
         Phương thức này thực hiện các hành động cần thiết để cập nhật và hiển thị màn hình overworld mỗi khung hình
+        Nếu OVERWORLD_DIRTY_RECTS được bật, các vùng thay đổi được lưu vào `dirty_rects` để chỉ cập nhật các vùng đó
             :param dt: Thời gian trôi qua
         """
+        # Nhân vật đã dừng ở một nút: tạo trước màn chơi của nút đó, mỗi frame một phần
+        # (trước input, để không tạo lại màn chơi sau khi đã chuyển sang nó trong frame này)
+        if self.preload_level and self.current_node and not self.icon.path:
+            self.preload_level(self.current_node.level)
         self.input()
         self.get_current_node()
         self.all_sprites.update(dt)
         self.all_sprites.draw(self.icon.rect.center)
+        self.dirty_rects = self.all_sprites.dirty_rects
@@ -2,6 +2,7 @@ import pygame
 
 from settings import *
 from timer import *
+from support import flip_frames, silhouette
 from os.path import join
 from math import sin
 
@@ -14,8 +15,8 @@ class Player(pygame.sprite.Sprite):
     input(): Kiểm tra input từ người chơi (bấm phím) để điều khiển hướng di chuyển và tấn công
     attack(): Thực hiện hành động tấn công của nhân vật
     move(dt): Cập nhật vị trí của nhân vật theo hướng di chuyển, trọng lực, nhảy và va chạm
-    platform_move(dt): Di chuyển nhân vật cùng với nền di chuyển nếu đang đứng trên đó
     check_contact(): Kiểm tra xem nhân vật đang tiếp xúc với mặt phẳng nào
+    nearby(group, rect): Lấy các sprite của một nhóm va chạm nằm gần vùng di chuyển của nhân vật
     collision(axis): Xử lý va chạm của nhân vật với các sprite khác theo trục được chỉ định
     def semi_collision(): Xử lý va chạm đặc biệt của nhân vật với các sprite trong nhóm `semi_collision_sprites`
     update_timers(): Cập nhật trạng thái của các bộ hẹn giờ cho các hành động của nhân vật.
@@ -25,13 +26,17 @@ class Player(pygame.sprite.Sprite):
     flicker(): Tạo hiệu ứng nhận sát thương cho nhân vật
     update(dt): Cập nhật trạng thái của nhân vật mỗi frame
     """
-    def __init__(self, pos, groups, collision_sprites, semi_collision_sprites, frames, data, attack_sound, jump_sound):
+    def __init__(self, pos, groups, collision_sprites, semi_collision_sprites, occupancy, kinematic_bodies, frames, data,
+                 attack_sound, jump_sound):
         """
         Hàm khởi tạo
             :param pos: Vị trí ban đầu của nhân vật (x, y)
             :param groups: Danh sách các nhóm sprite để thêm nhân vật vào
-            :param collision_sprites: Nhóm các sprite dùng để kiểm tra va chạm với nhân vật
-            :param semi_collision_sprites: Nhóm các sprite dùng để kiểm tra va chạm đặc biệt với nhân vật (chẳng hạn như nền di chuyển)
+            :param collision_sprites: Nhóm các sprite dùng để kiểm tra va chạm với nhân vật (`SpatialGroup`)
+            :param semi_collision_sprites: Nhóm các sprite dùng để kiểm tra va chạm đặc biệt với nhân vật (chẳng hạn như nền di chuyển) (`SpatialGroup`)
+            :param occupancy: Bản đồ chiếm chỗ của các tile (`OccupancyGrid`), dùng cho các phép kiểm tra tiếp xúc
+            :param kinematic_bodies: Danh sách các vật di chuyển có thể chở nhân vật (`KinematicBodies`), nhân vật được
+                thêm vào danh sách này và được dời theo nền đang đứng bởi `Level`
             :param frames: Từ điển lưu trữ các khung hình hoạt ảnh theo trạng thái
             :param data: Dữ liệu trò chơi liên quan đến nhân vật (chẳng hạn như máu)
             :param attack_sound: Âm thanh phát ra khi nhân vật tấn công
@@ -44,6 +49,8 @@ class Player(pygame.sprite.Sprite):
 
         # image
         self.frames, self.frame_index = frames, 0
+        # khung hình đã lật sẵn khi nhân vật quay sang trái
+        self.flipped_frames = flip_frames(frames)
         self.state, self.facing_right = "idle", True
         self.image = self.frames[self.state][self.frame_index]
 
@@ -56,6 +63,7 @@ class Player(pygame.sprite.Sprite):
 
         # movement
         self.direction = vector()
+        self.dynamic = True
         self.speed = 500
         self.gravity = 2000
         self.jump = False
@@ -66,8 +74,12 @@ class Player(pygame.sprite.Sprite):
         # collision
         self.collision_sprites = collision_sprites
         self.semi_collision_sprites = semi_collision_sprites
+        self.occupancy = occupancy
+        self.kinematic_bodies = kinematic_bodies
         self.on_surface = {'floor': False, 'left': False, 'right': False}
+        # nền di chuyển đang đỡ nhân vật
         self.platform = None
+        kinematic_bodies.add_actor(self)
 
         self.timers = {
             'wall jump': Timer(200),
@@ -245,21 +257,11 @@ class Player(pygame.sprite.Sprite):
         self.semi_collision()
         self.rect.center = self.hitbox_rect.center
 
-    def platform_move(self, dt):
-        """
-        Di chuyển nhân vật cùng với nền di chuyển nếu đang đứng trên đó.
-        Phương thức này kiểm tra xem nhân vật có đang đứng trên một nền di chuyển (`self.platform`) hay không.
-        Nếu có, vị trí của nhân vật (`self.hitbox_rect`) sẽ được cập nhật theo hướng di chuyển (`self.platform.direction`),
-            tốc độ (`self.platform.speed`) của nền di chuyển và khoảng thời gian (`dt`).
-            :param dt: Thời gian trôi qua
-        """
-        if self.platform:
-            self.hitbox_rect.topleft += self.platform.direction * self.platform.speed * dt
-
     def check_contact(self):
         """
         Kiểm tra xem nhân vật đang tiếp xúc với mặt phẳng nào (Dưới, trái phải)
-        Phương thức này kiểm tra xem nhân vật đang tiếp xúc với các sprite trong nhóm `collision_sprites` và `semi_collision_sprites`
+        Phương thức này kiểm tra xem nhân vật đang tiếp xúc với các tile (qua bản đồ chiếm chỗ `self.occupancy`) và các
+        sprite khác trong nhóm `collision_sprites` và `semi_collision_sprites`
         để cập nhật thông tin về việc tiếp xúc với mặt phẳng (dưới, trái, phải) trong từ điển `self.on_surface`.
         """
         # Kiểm tra có đang tiếp xúc với mặt phẳng nào hay không (Dưới, trái phải)
@@ -269,19 +271,37 @@ class Player(pygame.sprite.Sprite):
         left_rect = pygame.Rect(self.hitbox_rect.topleft + vector(-2, self.hitbox_rect.height / 4),
                                 (2, self.hitbox_rect.height / 2))
 
-        collide_rects = [sprite.rect for sprite in self.collision_sprites]
-        semi_collide_rect = [sprite.rect for sprite in self.semi_collision_sprites]
+        # Tile được kiểm tra trực tiếp trên bản đồ chiếm chỗ (vài ô quanh mỗi vùng kiểm tra),
+        # chỉ các vật cản khác (thùng, cửa, shell, nền di chuyển...) mới cần lấy từ lưới của nhóm va chạm
+        area = self.hitbox_rect.inflate(4, 4)
+        solids = self.nearby(self.collision_sprites, area)
+        semis = self.nearby(self.semi_collision_sprites, area)
+        collide_rects = [sprite.rect for sprite in solids if not hasattr(sprite, 'tile')]
+        semi_collide_rect = [sprite.rect for sprite in semis if not hasattr(sprite, 'tile')]
+        solid_in_rect = self.occupancy.solid_in_rect
+        one_way = self.occupancy.ONE_WAY
         # collision
         # Kiểm tra đụng độ cho toàn bộ sprite trong list trên
-        self.on_surface['floor'] = True if floor_rect.collidelist(collide_rects) >= 0 or floor_rect.collidelist(semi_collide_rect) >= 0 and self.direction.y >= 0 else False
-        self.on_surface['right'] = True if right_rect.collidelist(collide_rects) >= 0 else False
-        self.on_surface['left'] = True if left_rect.collidelist(collide_rects) >= 0 else False
+        self.on_surface['floor'] = True if solid_in_rect(floor_rect) or floor_rect.collidelist(collide_rects) >= 0 or (solid_in_rect(floor_rect, one_way) or floor_rect.collidelist(semi_collide_rect) >= 0) and self.direction.y >= 0 else False
+        self.on_surface['right'] = True if solid_in_rect(right_rect) or right_rect.collidelist(collide_rects) >= 0 else False
+        self.on_surface['left'] = True if solid_in_rect(left_rect) or left_rect.collidelist(collide_rects) >= 0 else False
 
-        self.platform = None
-        sprites = self.collision_sprites.sprites() + self.semi_collision_sprites.sprites()
-        for sprite in [sprite for sprite in sprites if hasattr(sprite, 'moving')]:
-            if sprite.rect.colliderect(floor_rect):
-                self.platform = sprite
+        # Nền di chuyển dưới chân, nhân vật sẽ được dời theo nền này sau khi các sprite được cập nhật
+        self.platform = self.kinematic_bodies.support(floor_rect)
+
+    def nearby(self, group, rect=None):
+        """
+        Lấy các sprite của một nhóm va chạm có thể chạm vào nhân vật (broadphase)
+        Vùng truy vấn mặc định là vùng nhân vật quét qua trong frame (`old_rect` hợp `hitbox_rect`), được nới thêm để
+            bao cả các vật di chuyển đã dịch chuyển trong frame này nhưng chưa được cập nhật lại ô lưới
+        Chi phí chỉ phụ thuộc vào số sprite quanh nhân vật, không phụ thuộc vào kích thước level
+            :param group: Nhóm sprite (`SpatialGroup`)
+            :param rect: Vùng cần truy vấn, mặc định là vùng quét của nhân vật
+            :return: Các sprite theo đúng thứ tự trong nhóm
+        """
+        if rect is None:
+            rect = self.hitbox_rect.union(self.old_rect)
+        return group.nearby(rect.inflate(TILE_SIZE, TILE_SIZE), ordered=True)
 
     def collision(self, axis):
         """
@@ -291,7 +311,7 @@ class Player(pygame.sprite.Sprite):
         Nếu va chạm xảy ra, vị trí của nhân vật sẽ được điều chỉnh để tránh va chạm
             :param axis: Trục va chạm ("horizontal" hoặc "vertical")
         """
-        for sprite in self.collision_sprites:
+        for sprite in self.nearby(self.collision_sprites):
             if sprite.rect.colliderect(self.hitbox_rect):
                 if axis == "horizontal":
                     # left
@@ -323,7 +343,7 @@ class Player(pygame.sprite.Sprite):
         # Khi ấn xuống ở platform, timer sẽ kích hoạt và làm cho platform không hoạt động nữa trong 1 khoảng thời gian
         # và hoạt động lại sau một khoản thời gian của timer(khi mà timer của platform đó không hoạt động
         if not self.timers['platform skip'].active:
-            for sprite in self.semi_collision_sprites:
+            for sprite in self.nearby(self.semi_collision_sprites):
                 if sprite.rect.colliderect(self.hitbox_rect):
                     if self.hitbox_rect.bottom >= sprite.rect.top and int(self.old_rect.bottom) <= int(sprite.old_rect.top):
                         self.hitbox_rect.bottom = sprite.rect.top
@@ -345,7 +365,7 @@ class Player(pygame.sprite.Sprite):
         Phương thức này cập nhật khung hình hoạt ảnh hiện tại của nhân vật dựa trên trạng thái hoạt ảnh (`self.state`),
             chỉ số khung hình (`self.frame_index`), tốc độ hoạt ảnh (`ANIMATION_SPEED`), và khoảng thời gian (`dt`).
         Phương thức cũng điều chỉnh hướng hiển thị của hình ảnh hoạt ảnh theo hướng quay của
-            nhân vật (`self.facing_right`)
+            nhân vật (`self.facing_right`) bằng bộ khung hình đã lật sẵn (`self.flipped_frames`)
             :param dt: Thời gian trôi qua
         """
         # làm animatrion cho các player
@@ -356,9 +376,9 @@ class Player(pygame.sprite.Sprite):
         # Cập nhật image bằng cách chọn 1 frame mới thông qua frames index ( int vì sau phép tính trên sẽ thành dạng float
         # ép kiểu int lại, chia lấy dư cho số lượng frames vì frame_index sẽ tăng mãi mãi và ta lặp lại hoạt ảnh bằng cách chia lấy du
         # khi đó frames được lấy ra chỉ nằm trong khoảng từ 0 đến index của frames cuối
-        self.image = self.frames[self.state][int(self.frame_index % len(self.frames[self.state]))]
-        # Đổi chiều nhân vật khi quay trái phải
-        self.image = self.image if self.facing_right else pygame.transform.flip(self.image, True, False)
+        # Đổi chiều nhân vật khi quay trái phải bằng cách chọn bộ khung hình đã lật sẵn
+        frames = self.frames if self.facing_right else self.flipped_frames
+        self.image = frames[self.state][int(self.frame_index % len(frames[self.state]))]
 
         if self.attacking and self.frame_index > len(self.frames[self.state]):
             self.attacking = False
@@ -402,14 +422,12 @@ class Player(pygame.sprite.Sprite):
         Tạo hiệu ứng nhận sát thương cho nhân vật
         Phương thức này sử dụng hàm sin để tạo hiệu ứng nhấp nháy hình ảnh của nhân vật khi bị nhận sát thương.
         Hiệu ứng này chỉ được thực hiện khi bộ hẹn giờ `self.timers['hit']` đang hoạt động
+        Bóng trắng của mỗi khung hình được tạo sẵn và lưu lại (`silhouette`) nên không phải tạo mask mỗi frame
         """
         # khi bị nhận sát thương thì sẽ có hiệu ứng nhận diện
         # Dùng sin để tạo hiệu ứng flicker liên tục
         if self.timers['hit'].active and sin(pygame.time.get_ticks() * 100) >= 0:
-            white_mask = pygame.mask.from_surface(self.image)
-            white_surf = white_mask.to_surface()
-            white_surf.set_colorkey('black')
-            self.image = white_surf
+            self.image = silhouette(self.image)
 
     def update(self, dt):
         """
@@ -419,7 +437,6 @@ class Player(pygame.sprite.Sprite):
             Cập nhật các bộ hẹn giờ
             Kiểm tra input từ người chơi
             Di chuyển nhân vật
-            Di chuyển cùng nền di chuyển
             Kiểm tra tiếp xúc với mặt phẳng
             Xác định trạng thái hoạt ảnh
             Cập nhật hình ảnh hoạt ảnh
@@ -431,7 +448,6 @@ class Player(pygame.sprite.Sprite):
 
         self.input()
         self.move(dt)
-        self.platform_move(dt)
         self.check_contact()
 
         self.get_state()
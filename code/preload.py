@@ -0,0 +1,125 @@
+from settings import *
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+
+class LevelPreloader:
+    """
+    Chuẩn bị trước màn chơi khi người chơi đứng ở một nút của overworld, để frame chuyển sang màn chơi không phải
+        đọc bản đồ và tạo toàn bộ màn chơi
+    Bản đồ được đọc trong một luồng nền (không tạo bề mặt, không dùng các bộ nhớ đệm của luồng chính). Trong lúc đó
+        và sau khi đọc xong, các bước còn lại (tải tài nguyên, tạo màn chơi, các bước thiết lập của `Level.build`) được
+        chạy dần trong luồng chính qua các frame của overworld (`update`), mỗi frame không quá PRELOAD_FRAME_BUDGET giây
+    Tài nguyên của màn chơi được giữ (`AssetManager.acquire`) từ khi yêu cầu cho đến khi màn chơi được lấy hoặc bị bỏ
+    Chỉ giữ một màn chơi được chuẩn bị: chọn nút khác thì màn chơi cũ bị bỏ (nếu chưa bắt đầu đọc thì được hủy)
+    * Phương thức
+    `request(level)`: Bắt đầu chuẩn bị màn chơi (gọi nhiều lần với cùng màn chơi không có tác dụng)
+    `prepare()`: Các bước chuẩn bị trong luồng chính (generator)
+    `update(deadline)`: Chạy tiếp các bước chuẩn bị cho đến `deadline`, gọi mỗi frame
+    `ready()`: Kiểm tra màn chơi được chuẩn bị đã tạo xong chưa
+    `take(level)`: Lấy màn chơi đã chuẩn bị, chạy nốt các bước còn lại nếu chưa xong
+    `cancel()`: Bỏ màn chơi đang được chuẩn bị
+    """
+    def __init__(self, read, create, assets=None, budget=PRELOAD_FRAME_BUDGET):
+        """
+        Hàm khởi tạo
+            :param read: Hàm đọc dữ liệu bản đồ từ chỉ số màn chơi, được gọi trong luồng nền
+            :param create: Hàm tạo màn chơi `create(level, compiled, build=False)` từ chỉ số màn chơi và dữ liệu bản đồ,
+                được gọi trong luồng chính
+            :param assets: Đối tượng AssetManager, tài nguyên của 'level' được giữ trong lúc chuẩn bị (có thể bỏ qua)
+            :param budget: Thời gian tối đa (giây) mỗi lần `update` dùng để chuẩn bị màn chơi
+        """
+        self.read = read
+        self.create = create
+        self.assets = assets
+        self.budget = budget
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='level-preload')
+        self.level = None
+        self.future = None
+        # Các bước chuẩn bị còn lại (`prepare`) và màn chơi đang được thiết lập dần (sau khi đọc xong bản đồ)
+        self.steps = None
+        self.prepared = None
+
+    def request(self, level):
+        """
+        Bắt đầu chuẩn bị màn chơi: đọc bản đồ trong luồng nền và giữ tài nguyên của màn chơi
+            :param level: Chỉ số màn chơi
+        """
+        if self.level == level:
+            return
+        self.cancel()
+        self.level = level
+        self.future = self.executor.submit(self.read, level)
+        if self.assets:
+            self.assets.acquire('level')
+        self.steps = self.prepare()
+
+    def prepare(self):
+        """
+        Các bước chuẩn bị màn chơi trong luồng chính (generator), mỗi bước đủ ngắn để chia ra nhiều frame:
+            Tải từng tài nguyên của màn chơi (nếu chưa có trong bộ nhớ đệm)
+            Chờ luồng nền đọc xong bản đồ
+            Tạo màn chơi (chưa thiết lập) từ bản đồ đã đọc
+            Chạy từng bước thiết lập của màn chơi (`Level.build`)
+        """
+        if self.assets:
+            for group, key in self.assets.entries('level'):
+                self.assets.get(group, key)
+                yield
+        while not self.future.done():
+            yield
+        self.prepared = self.create(self.level, self.future.result(), build=False)
+        yield
+        # deadline đã qua: mỗi lần gọi chỉ chạy một bước
+        while not self.prepared.build(0):
+            yield
+
+    def update(self, deadline=None):
+        """
+        Chạy tiếp các bước chuẩn bị màn chơi trong luồng chính cho đến `deadline`
+        Không làm gì nếu không có màn chơi nào được yêu cầu hoặc màn chơi đã được chuẩn bị xong
+            :param deadline: Thời điểm (theo `perf_counter`) phải dừng, mặc định là sau `budget` giây kể từ lúc gọi
+        """
+        if self.steps is None:
+            return
+        if deadline is None:
+            deadline = perf_counter() + self.budget
+        for _ in self.steps:
+            if perf_counter() >= deadline:
+                return
+
+    def ready(self):
+        """
+        Kiểm tra màn chơi được chuẩn bị đã tạo và thiết lập xong chưa
+            :return: True nếu đã xong
+        """
+        return self.prepared is not None and self.prepared.built
+
+    def take(self, level):
+        """
+        Lấy màn chơi đã chuẩn bị. Các bước chưa chạy (kể cả việc đọc bản đồ) được chạy nốt ngay
+        Tài nguyên được giữ trong lúc chuẩn bị được trả lại, nên phải gọi sau khi màn chơi mới đã giữ tài nguyên của nó
+            :param level: Chỉ số màn chơi cần lấy
+            :return: Đối tượng Level, hoặc None nếu màn chơi này không được chuẩn bị
+        """
+        if self.level != level:
+            self.cancel()
+            return None
+        self.future.result()
+        for _ in self.steps:
+            pass
+        prepared = self.prepared
+        self.cancel()
+        return prepared
+
+    def cancel(self):
+        """
+        Bỏ màn chơi đang được chuẩn bị và trả lại tài nguyên đã giữ
+        Nếu luồng nền đang đọc thì kết quả bị bỏ qua khi đọc xong
+        """
+        if self.level is None:
+            return
+        self.future.cancel()
+        if self.assets:
+            self.assets.release('level')
+        self.level = self.future = self.steps = self.prepared = None
@@ -0,0 +1,109 @@
+from settings import *
+from collections import OrderedDict
+from collections.abc import Mapping
+from os.path import dirname
+from tilemap import LEVEL_DIR, level_files, read_map, TileMap
+
+
+class LevelRegistry(Mapping):
+    """
+    Danh sách bản đồ màn chơi, dùng thay cho từ điển `tmx_maps` được tải sẵn
+    Các màn chơi được tìm trong thư mục data/levels (chỉ lấy đường dẫn), bản đồ của một màn chơi chỉ được tải khi
+        được truy cập. Các bản đồ được dùng gần đây nhất được giữ trong bộ nhớ (LRU), giới hạn bởi số bản đồ và tổng
+        bộ nhớ ước lượng, nên bộ nhớ không tăng theo số màn chơi
+    Dữ liệu bản đồ có thể được đọc trong luồng nền (`read`), bản đồ chỉ được tạo và đưa vào bộ nhớ đệm trong luồng chính
+    * Phương thức
+    `read(level)`: Đọc dữ liệu bản đồ của màn chơi, không dùng bộ nhớ đệm nên có thể gọi trong luồng nền
+    `add(level, compiled)`: Tạo bản đồ từ dữ liệu đã đọc và đưa vào bộ nhớ đệm
+    `loaded(level)`: Kiểm tra bản đồ của màn chơi có đang được giữ trong bộ nhớ không
+    `stats()`: Thống kê số lần truy cập có sẵn (hit), phải tải (miss), số bản đồ bị loại bỏ và bộ nhớ đang dùng
+    """
+    def __init__(self, directory=LEVEL_DIR, capacity=LEVEL_CACHE_SIZE, budget=LEVEL_CACHE_BUDGET, reader=read_map):
+        """
+        Hàm khởi tạo
+            :param directory: Thư mục chứa các file TMX của màn chơi
+            :param capacity: Số bản đồ tối đa được giữ trong bộ nhớ
+            :param budget: Tổng bộ nhớ tối đa (byte) của các bản đồ được giữ, bản đồ đang dùng luôn được giữ
+            :param reader: Hàm đọc dữ liệu bản đồ đã biên dịch từ đường dẫn file
+        """
+        self.paths = level_files(directory)
+        self.capacity = capacity
+        self.budget = budget
+        self.reader = reader
+        # chỉ số màn chơi -> bản đồ, theo thứ tự từ lâu nhất đến gần đây nhất được dùng
+        self.maps = OrderedDict()
+        # chỉ số màn chơi -> bộ nhớ ước lượng của bản đồ
+        self.sizes = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def __getitem__(self, level):
+        if not 0 <= level < len(self.paths):
+            raise KeyError(level)
+        if level in self.maps:
+            self.hits += 1
+            self.maps.move_to_end(level)
+            return self.maps[level]
+        return self.add(level, self.read(level))
+
+    def __iter__(self):
+        return iter(range(len(self.paths)))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def read(self, level):
+        """
+        Đọc dữ liệu bản đồ của màn chơi (không tạo bề mặt, không thay đổi bộ nhớ đệm)
+            :param level: Chỉ số màn chơi
+            :return: Từ điển dữ liệu bản đồ đã biên dịch
+        """
+        return self.reader(self.paths[level])
+
+    def add(self, level, compiled):
+        """
+        Tạo bản đồ từ dữ liệu đã đọc và đưa vào bộ nhớ đệm, chỉ gọi trong luồng chính
+        Nếu bản đồ đã có trong bộ nhớ đệm thì dùng lại bản đồ đó
+            :param level: Chỉ số màn chơi
+            :param compiled: Dữ liệu bản đồ trả về bởi `read`
+            :return: Đối tượng TileMap
+        """
+        if level in self.maps:
+            self.maps.move_to_end(level)
+            return self.maps[level]
+        self.misses += 1
+        tile_map = self.maps[level] = TileMap(compiled, dirname(self.paths[level]))
+        self.sizes[level] = tile_map.memory_size()
+        self.evict()
+        return tile_map
+
+    def loaded(self, level):
+        """
+        Kiểm tra bản đồ của màn chơi có đang được giữ trong bộ nhớ đệm không
+            :param level: Chỉ số màn chơi
+            :return: True nếu truy cập bản đồ không cần đọc lại
+        """
+        return level in self.maps
+
+    def memory(self):
+        """
+        Tổng bộ nhớ ước lượng của các bản đồ đang được giữ
+            :return: Số byte
+        """
+        return sum(self.sizes.values())
+
+    def evict(self):
+        """
+        Loại bỏ các bản đồ lâu nhất chưa được dùng cho đến khi không vượt quá số lượng và bộ nhớ cho phép
+        """
+        while len(self.maps) > 1 and (len(self.maps) > self.capacity or self.memory() > self.budget):
+            level, _ = self.maps.popitem(last=False)
+            del self.sizes[level]
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Thống kê bộ nhớ đệm bản đồ
+            :return: Từ điển gồm hits, misses, evictions, loaded (số bản đồ đang giữ) và memory (byte)
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'loaded': len(self.maps), 'memory': self.memory()}
@@ -4,6 +4,29 @@ from pygame.math import Vector2 as vector
 WINDOW_WIDTH, WINDOW_HEIGHT = 1280, 640
 TILE_SIZE = 64
 ANIMATION_SPEED = 6
+# Số tile mỗi chiều của một chunk nền tĩnh được vẽ sẵn
+CHUNK_SIZE = 8
+# Vẽ sprite của level theo lô bằng Surface.fblits thay vì blit từng sprite
+BATCHED_BLITS = True
+# Overworld chỉ cập nhật các vùng màn hình thay đổi (dirty rect) thay vì cả cửa sổ mỗi frame
+OVERWORLD_DIRTY_RECTS = False
+# Số vùng thay đổi tối đa trước khi chuyển sang cập nhật toàn màn hình
+DIRTY_RECT_LIMIT = 64
+# Tải ảnh từ texture atlas trong data/cache/atlas (tạo bằng `python code/atlas.py`) thay vì từng file
+USE_ATLAS = True
+# Tải ảnh đã giải mã sẵn từ data/cache/graphics.bundle (tạo bằng `python code/bundle.py`), được ưu tiên hơn atlas
+USE_BUNDLE = True
+# Số bản đồ màn chơi tối đa được giữ trong bộ nhớ và tổng bộ nhớ (byte) tối đa của chúng (xem registry.py)
+LEVEL_CACHE_SIZE = 3
+LEVEL_CACHE_BUDGET = 32 * 1024 * 1024
+# Chuẩn bị trước màn chơi khi người chơi đứng ở một nút trên overworld: đọc bản đồ trong luồng nền rồi tạo màn chơi
+# dần qua các frame của overworld (xem preload.py)
+PRELOAD_LEVELS = True
+# Thời gian tối đa (giây) mỗi frame overworld dùng để tạo trước màn chơi
+PRELOAD_FRAME_BUDGET = 0.004
+# Số sprite gây sát thương, enemy và item tối thiểu để kiểm tra va chạm của người chơi qua lưới không gian,
+# level có ít hơn thì duyệt cả nhóm nhanh hơn (xem `python code/benchmark.py entities`)
+ENTITY_GRID_THRESHOLD = 250
 
 # layers
 Z_LAYERS = {
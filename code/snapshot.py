@@ -0,0 +1,132 @@
+"""
+Lưu và khôi phục trạng thái của các đối tượng động trong màn chơi (nhân vật, enemy, vật di chuyển, item)
+Trạng thái của mỗi sprite là một tuple (sprite, các nhóm sprite, giá trị các thuộc tính trong STATE_ATTRIBUTES),
+    các giá trị được chuyển sang dạng gọn (rect và vector thành tuple, Timer thành (đang chạy, thời gian đã chạy))
+    và được ghi lại vào đúng đối tượng cũ khi khôi phục, nên không cần tạo lại sprite
+Trạng thái tại checkpoint chỉ lưu phần khác so với trạng thái ban đầu của màn chơi (`save_delta`)
+"""
+from settings import *
+from pygame.time import get_ticks
+from timer import Timer
+from player import Player
+from enemies import Tooth, Fly, Shell
+from sprites import MovingSprite, Spike, Item
+
+# Lớp -> các thuộc tính thay đổi trong khi chơi
+STATE_ATTRIBUTES = {
+    Player: ('rect', 'hitbox_rect', 'old_rect', 'direction', 'facing_right', 'state', 'frame_index', 'image', 'jump',
+             'jump_state', 'attacking', 'on_surface', 'platform', 'timers'),
+    Tooth: ('rect', 'direction', 'frame_index', 'image', 'hit_timer'),
+    Fly: ('rect', 'direction', 'frame_index', 'image', 'hit_timer'),
+    Shell: ('rect', 'old_rect', 'state', 'frame_index', 'image', 'shoot_timer', 'has_fired'),
+    MovingSprite: ('rect', 'old_rect', 'direction', 'reverse', 'frame_index', 'image'),
+    Spike: ('rect', 'angle', 'direction'),
+    Item: ('rect', 'frame_index', 'image'),
+}
+
+
+def state_attributes(sprite):
+    """
+    Lấy danh sách thuộc tính cần lưu của một sprite (theo lớp gần nhất có trong STATE_ATTRIBUTES)
+        :param sprite: Sprite cần kiểm tra
+        :return: Tuple tên các thuộc tính, hoặc None nếu sprite không có trạng thái cần lưu
+    """
+    for cls in type(sprite).__mro__:
+        if cls in STATE_ATTRIBUTES:
+            return STATE_ATTRIBUTES[cls]
+    return None
+
+
+def freeze(value):
+    """
+    Chuyển một giá trị sang dạng gọn, không bị thay đổi khi đối tượng gốc thay đổi
+        :param value: Giá trị của thuộc tính
+        :return: Giá trị đã chuyển
+    """
+    if isinstance(value, (pygame.FRect, pygame.Rect, vector)):
+        return tuple(value)
+    if isinstance(value, Timer):
+        return value.active, get_ticks() - value.start_time if value.active else 0
+    if isinstance(value, dict):
+        return {key: freeze(item) for key, item in value.items()}
+    return value
+
+
+def thaw(current, frozen):
+    """
+    Ghi giá trị đã lưu vào giá trị hiện tại của thuộc tính, tại chỗ nếu có thể
+    Timer đang chạy được khôi phục với đúng thời gian đã chạy tính đến lúc lưu
+        :param current: Giá trị hiện tại của thuộc tính
+        :param frozen: Giá trị đã lưu bởi `freeze`
+        :return: Giá trị cần gán cho thuộc tính
+    """
+    if isinstance(current, (pygame.FRect, pygame.Rect, vector)):
+        current.update(frozen)
+        return current
+    if isinstance(current, Timer):
+        current.active, elapsed = frozen
+        current.start_time = get_ticks() - elapsed if current.active else 0
+        return current
+    if isinstance(current, dict):
+        for key, item in frozen.items():
+            current[key] = thaw(current.get(key), item)
+        return current
+    return frozen
+
+
+def save_sprite(sprite):
+    """
+    Lưu trạng thái của một sprite
+        :param sprite: Sprite có lớp nằm trong STATE_ATTRIBUTES
+        :return: Tuple (sprite, các nhóm sprite, giá trị các thuộc tính)
+    """
+    values = tuple(freeze(getattr(sprite, name)) for name in state_attributes(sprite))
+    return sprite, tuple(sprite.groups()), values
+
+
+def load_sprite(entry):
+    """
+    Khôi phục trạng thái của một sprite, đưa sprite trở lại các nhóm nếu đã bị xóa (ví dụ item đã được nhặt)
+        :param entry: Tuple được tạo bởi `save_sprite`
+    """
+    sprite, groups, values = entry
+    for name, value in zip(state_attributes(sprite), values):
+        setattr(sprite, name, thaw(getattr(sprite, name), value))
+    missing = [group for group in groups if sprite not in group]
+    if missing:
+        sprite.add(missing)
+
+
+def save_delta(base):
+    """
+    Lưu trạng thái hiện tại của các sprite trong `base`, chỉ giữ các thuộc tính đã thay đổi so với `base`
+    Chỉ các sprite có trong `base` được kiểm tra nên chi phí không phụ thuộc vào số sprite tĩnh của màn chơi
+        :param base: Trạng thái gốc được tạo bởi `save_sprite` cho từng sprite (ví dụ trạng thái ban đầu của màn chơi)
+        :return: Tuple (các tuple (sprite, các thuộc tính đã thay đổi dạng (tên, giá trị)), các sprite đã bị xóa)
+    """
+    changed, removed = [], []
+    for sprite, groups, values in base:
+        if not sprite.alive():
+            removed.append(sprite)
+            continue
+        changes = []
+        for name, value in zip(state_attributes(sprite), values):
+            current = freeze(getattr(sprite, name))
+            if current != value:
+                changes.append((name, current))
+        if changes:
+            changed.append((sprite, tuple(changes)))
+    return tuple(changed), tuple(removed)
+
+
+def load_delta(delta):
+    """
+    Áp dụng trạng thái được lưu bởi `save_delta` (sau khi đã khôi phục trạng thái gốc)
+        :param delta: Tuple được trả về bởi `save_delta`
+    """
+    changed, removed = delta
+    for sprite in removed:
+        sprite.kill()
+    for sprite, changes in changed:
+        for name, value in changes:
+            setattr(sprite, name, thaw(getattr(sprite, name), value))
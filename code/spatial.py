@@ -0,0 +1,188 @@
+from settings import *
+
+
+class SpatialHash:
+    """
+    Chỉ mục không gian dạng lưới đều (uniform grid), mỗi ô có kích thước `cell_size` (mặc định TILE_SIZE)
+    Mỗi phần tử được lưu vào tất cả các ô mà rect của nó chạm tới, nhờ đó truy vấn một vùng chỉ cần duyệt các ô
+        nằm trong vùng đó thay vì toàn bộ phần tử
+    * Phương thức
+    `insert(item, rect)`: Thêm phần tử vào lưới
+    `remove(item)`: Xóa phần tử khỏi lưới
+    `move(item, rect)`: Cập nhật lại ô của phần tử, chỉ thay đổi lưới khi phần tử đã sang ô khác
+    `query(rect)`: Lấy tập hợp các phần tử nằm trong các ô mà `rect` chạm tới
+    """
+    def __init__(self, cell_size=TILE_SIZE):
+        """
+        Hàm khởi tạo
+            :param cell_size: Kích thước (pixel) của một ô lưới
+        """
+        self.cell_size = cell_size
+        # (cột, hàng) -> tập hợp phần tử nằm trong ô đó
+        self.cells = {}
+        # phần tử -> khoảng ô (cột đầu, hàng đầu, cột cuối, hàng cuối) mà phần tử đang chiếm
+        self.item_cells = {}
+
+    def __len__(self):
+        return len(self.item_cells)
+
+    def __contains__(self, item):
+        return item in self.item_cells
+
+    def cell_range(self, rect):
+        """
+        Tính khoảng ô lưới mà một rect chạm tới
+            :param rect: Rect hoặc FRect cần tính
+            :return: Tuple (cột đầu, hàng đầu, cột cuối, hàng cuối), cột/hàng cuối được tính cả
+        """
+        size = self.cell_size
+        left, top = int(rect.left // size), int(rect.top // size)
+        # rect có chiều rộng/cao bằng 0 vẫn nằm trong một ô
+        right = max(left, int(-(-rect.right // size)) - 1)
+        bottom = max(top, int(-(-rect.bottom // size)) - 1)
+        return left, top, right, bottom
+
+    def insert(self, item, rect):
+        """
+        Thêm phần tử vào tất cả các ô mà `rect` chạm tới
+            :param item: Phần tử cần thêm (thường là sprite)
+            :param rect: Rect của phần tử
+        """
+        if item in self.item_cells:
+            self.remove(item)
+        span = self.cell_range(rect)
+        self.item_cells[item] = span
+        cells = self.cells
+        for col in range(span[0], span[2] + 1):
+            for row in range(span[1], span[3] + 1):
+                cell = cells.get((col, row))
+                if cell is None:
+                    cells[(col, row)] = {item}
+                else:
+                    cell.add(item)
+
+    def remove(self, item):
+        """
+        Xóa phần tử khỏi các ô mà nó đang chiếm. Ô rỗng sẽ bị xóa để lưới không phình to theo thời gian
+            :param item: Phần tử cần xóa
+        """
+        span = self.item_cells.pop(item, None)
+        if span is None:
+            return
+        cells = self.cells
+        for col in range(span[0], span[2] + 1):
+            for row in range(span[1], span[3] + 1):
+                cell = cells[(col, row)]
+                cell.discard(item)
+                if not cell:
+                    del cells[(col, row)]
+
+    def move(self, item, rect):
+        """
+        Cập nhật vị trí của phần tử trong lưới
+        Phần lớn thời gian sprite di chuyển vẫn nằm trong cùng các ô cũ nên chỉ cần so sánh khoảng ô,
+            lưới chỉ được sửa khi khoảng ô thay đổi
+            :param item: Phần tử đã di chuyển
+            :param rect: Rect mới của phần tử
+        """
+        if self.item_cells.get(item) != self.cell_range(rect):
+            self.insert(item, rect)
+
+    def query(self, rect):
+        """
+        Lấy các phần tử nằm trong các ô mà `rect` chạm tới
+        Kết quả là tập ứng viên: phần tử có thể chỉ nằm chung ô chứ chưa chắc đã giao với `rect`
+            :param rect: Vùng cần truy vấn
+            :return: Tập hợp (set) các phần tử
+        """
+        left, top, right, bottom = self.cell_range(rect)
+        cells = self.cells
+        result = set()
+        for col in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                cell = cells.get((col, row))
+                if cell:
+                    result.update(cell)
+        return result
+
+
+class OccupancyGrid:
+    """
+    Bản đồ chiếm chỗ của các lớp tile (Terrain, Platforms): mỗi ô lưới là một byte trong `bytearray`
+        (EMPTY: trống, SOLID: vật cản, ONE_WAY: nền chỉ chặn từ phía trên)
+    Dùng cho các phép kiểm tra tiếp xúc nhỏ (chân nhân vật, mép của enemy): chỉ cần đọc vài ô tương ứng với vùng
+        kiểm tra, không cần duyệt danh sách rect của toàn bộ level
+    Ô nằm ngoài bản đồ được coi là trống
+    * Phương thức
+    `add(col, row, kind)`: Thêm một loại cho ô (một ô có thể vừa là SOLID vừa là ONE_WAY)
+    `kind_at(col, row)`: Lấy loại của một ô
+    `is_solid_at(x, y, kinds)`: Kiểm tra một điểm (pixel) có nằm trong ô thuộc loại `kinds` hay không
+    `solid_in_rect(rect, kinds)`: Kiểm tra một vùng có chạm ô thuộc loại `kinds` hay không
+    """
+    EMPTY, SOLID, ONE_WAY = 0, 1, 2
+
+    def __init__(self, width, height, cell_size=TILE_SIZE):
+        """
+        Hàm khởi tạo
+            :param width: Số cột của bản đồ
+            :param height: Số hàng của bản đồ
+            :param cell_size: Kích thước (pixel) của một ô
+        """
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.cells = bytearray(width * height)
+
+    def add(self, col, row, kind):
+        """
+        Thêm một loại cho ô. Các loại là cờ bit nên tile của nhiều lớp ở cùng một ô không ghi đè lên nhau
+            :param col: Cột của ô
+            :param row: Hàng của ô
+            :param kind: SOLID hoặc ONE_WAY
+        """
+        self.cells[row * self.width + col] |= kind
+
+    def kind_at(self, col, row):
+        """
+        Lấy loại của một ô
+            :param col: Cột của ô
+            :param row: Hàng của ô
+            :return: Các cờ SOLID / ONE_WAY của ô (EMPTY nếu ô trống hoặc nằm ngoài bản đồ)
+        """
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return self.cells[row * self.width + col]
+        return self.EMPTY
+
+    def is_solid_at(self, x, y, kinds=SOLID):
+        """
+        Kiểm tra một điểm có nằm trong ô thuộc loại `kinds` hay không
+            :param x: Tọa độ x (pixel)
+            :param y: Tọa độ y (pixel)
+            :param kinds: Các loại ô cần kiểm tra (ví dụ SOLID | ONE_WAY)
+            :return: True nếu điểm nằm trong một ô thuộc loại đó
+        """
+        size = self.cell_size
+        return bool(self.kind_at(int(x // size), int(y // size)) & kinds)
+
+    def solid_in_rect(self, rect, kinds=SOLID):
+        """
+        Kiểm tra một vùng có chạm ô thuộc loại `kinds` hay không
+        Cho kết quả giống `colliderect` với rect của các tile: cạnh phải/dưới không được tính, vùng có chiều rộng
+            hoặc cao bằng 0 không chạm ô nào, vùng có kích thước âm được đổi chiều như trong pygame
+            :param rect: Vùng cần kiểm tra (Rect hoặc FRect)
+            :param kinds: Các loại ô cần kiểm tra (ví dụ SOLID | ONE_WAY)
+            :return: True nếu vùng chạm ít nhất một ô thuộc loại đó
+        """
+        left, right = sorted((rect.left, rect.left + rect.width))
+        top, bottom = sorted((rect.top, rect.top + rect.height))
+        if left == right or top == bottom:
+            return False
+        size, width, cells = self.cell_size, self.width, self.cells
+        first_col, last_col = max(0, int(left // size)), min(width - 1, int(-(-right // size)) - 1)
+        first_row, last_row = max(0, int(top // size)), min(self.height - 1, int(-(-bottom // size)) - 1)
+        for row in range(first_row, last_row + 1):
+            offset = row * width
+            for col in range(first_col, last_col + 1):
+                if cells[offset + col] & kinds:
+                    return True
+        return False
@@ -1,5 +1,6 @@
 from settings import *
-from math import sin, cos, radians
+from math import sin, cos, radians, ceil, floor
+from support import tile_surface, flip_surface
 from random import randint, choice
 
 class Sprite(pygame.sprite.Sprite):
@@ -24,6 +25,62 @@ class Sprite(pygame.sprite.Sprite):
         self.old_rect = self.rect.copy()
         self.z = z
 
+class TiledWater:
+    """
+    Lớp nước phủ kín một vùng hình chữ nhật, thay cho việc tạo một AnimatedSprite cho mỗi ô nước
+    Mỗi khung hình hoạt hình được lặp sẵn thành một mẫu (pattern) lớn hơn màn hình một ô, nên mỗi frame chỉ cần
+        một lần blit mẫu tại vị trí camera (lệch theo ô) và cắt theo vùng nước
+    * Phương thức
+    `update(dt)`: Chuyển sang khung hình tiếp theo theo thời gian trôi qua
+    `draw(surface, offset)`: Vẽ phần nước nằm trong màn hình
+    """
+    def __init__(self, rect, frames, animation_speed=ANIMATION_SPEED):
+        """
+        Hàm khởi tạo
+            :param rect: Vùng (pixel, theo tọa độ thế giới) được phủ nước, các ô được căn theo góc trên trái
+            :param frames: Danh sách các khung hình của một ô nước
+            :param animation_speed: Tốc độ hoạt hình. Mặc định là ANIMATION_SPEED
+        """
+        self.rect = pygame.Rect(rect)
+        self.tile_width, self.tile_height = frames[0].get_size()
+        cols = ceil(WINDOW_WIDTH / self.tile_width) + 1
+        rows = ceil(WINDOW_HEIGHT / self.tile_height) + 1
+        self.patterns = [tile_surface(frame, cols, rows) for frame in frames]
+        self.animation_speed = animation_speed
+        self.frame_index = 0
+        self.image = self.patterns[0]
+
+    def update(self, dt):
+        """
+        Hàm cập nhật
+        Chuyển sang khung hình tiếp theo giống `AnimatedSprite.animate`
+            :param dt: Thời gian trôi qua
+        """
+        self.frame_index += self.animation_speed * dt
+        self.image = self.patterns[int(self.frame_index % len(self.patterns))]
+
+    def draw(self, surface, offset):
+        """
+        Vẽ phần nước nằm trong màn hình bằng một lần blit
+            :param surface: Bề mặt cần vẽ lên
+            :param offset: Độ lệch camera (vector)
+            :return: Tuple (mẫu đã vẽ, vị trí trên màn hình), hoặc None nếu nước nằm ngoài màn hình
+        """
+        area = self.rect.move(offset).clip(surface.get_rect())
+        if not area:
+            return None
+        # Vị trí của ô nước đầu tiên chạm vào vùng được vẽ
+        left, top = self.rect.left + offset.x, self.rect.top + offset.y
+        x = left + floor((area.left - left) / self.tile_width) * self.tile_width
+        y = top + floor((area.top - top) / self.tile_height) * self.tile_height
+
+        clip = surface.get_clip()
+        surface.set_clip(area)
+        surface.blit(self.image, (x, y))
+        surface.set_clip(clip)
+        return self.image, (int(x), int(y))
+
+
 class AnimatedSprite(Sprite):
     """
     AnimatedSprite cung cấp chức năng bổ sung để tự động thay đổi hình ảnh của sprite theo thời gian, tạo hiệu ứng hoạt hình
@@ -204,6 +261,8 @@ class MovingSprite(AnimatedSprite):
 
         # Movement
         self.moving = True
+        # sprite di chuyển, cần cập nhật lại ô lưới trong SpatialGroup mỗi frame
+        self.dynamic = True
         self.speed = speed
         self.direction = vector(1, 0) if move_dir == 'x' else vector(0, 1)
         self.move_dir = move_dir
@@ -262,7 +321,7 @@ class MovingSprite(AnimatedSprite):
 
         self.animate(dt)
         if self.flip:
-            self.image = pygame.transform.flip(self.image, self.reverse['x'], self.reverse['y'])
+            self.image = flip_surface(self.image, self.reverse['x'], self.reverse['y'])
 
 class Spike(Sprite):
     """
@@ -292,6 +351,7 @@ class Spike(Sprite):
         self.end_angle = end_angle
         self.angle = self.start_angle
         self.direction = 1
+        self.dynamic = True
         self.full_circle = True if self.end_angle == -1 else False
 
         # trigonometry
@@ -342,6 +402,7 @@ class Cloud(Sprite):
         super().__init__(pos, surf, groups, z)
         self.speed = randint(50, 120)
         self.direction = -1
+        self.dynamic = True
         self.rect.midbottom = pos
 
     def update(self, dt):
@@ -419,6 +480,7 @@ class Icon(pygame.sprite.Sprite):
         self.icon = True
         self.path = None
         self.direction = vector()
+        self.dynamic = True
         self.speed = 500
 
         # image
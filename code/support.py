@@ -1,6 +1,67 @@
+import os
+import hashlib
 from settings import *
 from os import walk
-from os.path import join
+from os.path import join, exists
+
+# Nguồn ảnh (Bundle trong bundle.py hoặc Atlas trong atlas.py) được các hàm import_* dùng thay cho việc đọc từng
+# file ảnh, None để đọc trực tiếp từ ổ đĩa
+image_source = None
+
+
+def use_image_source(source):
+    """
+    Chọn nguồn ảnh cho các hàm import_*
+        :param source: Đối tượng Bundle hoặc Atlas, hoặc None để đọc từng file ảnh
+    """
+    global image_source
+    image_source = source
+
+
+def file_hash(path):
+    """
+    Tính mã băm nội dung của một file
+        :param path: Đường dẫn file
+        :return: Chuỗi sha1
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def is_fresh(sources):
+    """
+    Kiểm tra dữ liệu đã tạo sẵn (bản đồ đã biên dịch, atlas, bundle) còn khớp với các file nguồn hay không
+    Thời gian sửa giống nhau thì coi như không đổi, nếu khác thì so sánh mã băm nội dung
+        :param sources: Từ điển đường dẫn -> (thời gian sửa, mã băm) lúc biên dịch
+        :return: True nếu không file nào thay đổi
+    """
+    for path, (mtime, digest) in sources.items():
+        if not exists(path):
+            return False
+        if os.stat(path).st_mtime_ns != mtime and file_hash(path) != digest:
+            return False
+    return True
+
+
+def walk_images(path):
+    """
+    Duyệt thư mục ảnh giống `os.walk`, dùng index của nguồn ảnh nếu thư mục có trong nguồn ảnh
+        :param path: Đường dẫn thư mục
+        :return: Generator các tuple (đường dẫn thư mục, danh sách thư mục con, danh sách tên file)
+    """
+    if image_source and path in image_source:
+        return image_source.walk(path)
+    return walk(path)
+
+
+def load_image(full_path):
+    """
+    Tải một ảnh với kênh alpha, lấy từ nguồn ảnh nếu ảnh có trong nguồn ảnh
+        :param full_path: Đường dẫn file ảnh
+        :return: Bề mặt ảnh
+    """
+    surf = image_source.image(full_path) if image_source else None
+    return surf if surf else pygame.image.load(full_path).convert_alpha()
 
 
 def import_image(*path, alpha=True, format='png'):
@@ -12,7 +73,7 @@ def import_image(*path, alpha=True, format='png'):
         :return: Bề mặt ảnh được tải và chuyển đổi
     """
     full_path = join(*path) + f'.{format}'
-    return pygame.image.load(full_path).convert_alpha() if alpha else pygame.image.load(full_path).convert()
+    return load_image(full_path) if alpha else pygame.image.load(full_path).convert()
 
 
 def import_folder(*path):
@@ -22,10 +83,10 @@ def import_folder(*path):
         :return: Danh sách các bề mặt ảnh được tải và chuyển đổi
     """
     frames = []
-    for folder_path, subfolders, image_names in walk(join(*path)):
+    for folder_path, subfolders, image_names in walk_images(join(*path)):
         for image_name in sorted(image_names, key=lambda name: int(name.split('.')[0])):
             full_path = join(folder_path, image_name)
-            frames.append(pygame.image.load(full_path).convert_alpha())
+            frames.append(load_image(full_path))
     return frames
 
 
@@ -36,10 +97,10 @@ def import_folder_dict(*path):
         :return: Từ điển chứa tên ảnh làm khóa và bề mặt ảnh tương ứng làm giá trị
     """
     frame_dict = {}
-    for folder_path, _, image_names in walk(join(*path)):
+    for folder_path, _, image_names in walk_images(join(*path)):
         for image_name in image_names:
             full_path = join(folder_path, image_name)
-            surface = pygame.image.load(full_path).convert_alpha()
+            surface = load_image(full_path)
             frame_dict[image_name.split('.')[0]] = surface
     return frame_dict
 
@@ -51,8 +112,151 @@ def import_sub_folders(*path):
         :return: Từ điển chứa tên thư mục con làm khóa và danh sách ảnh được tải từ mỗi thư mục con làm giá trị
     """
     frame_dict = {}
-    for _, sub_folders, __ in walk(join(*path)):
+    for _, sub_folders, __ in walk_images(join(*path)):
         if sub_folders:
             for sub_folder in sub_folders:
                 frame_dict[sub_folder] = import_folder(*path, sub_folder)
     return frame_dict
+
+
+# (id bề mặt gốc, lật ngang, lật dọc) -> (bề mặt gốc, bề mặt đã lật)
+# Giữ lại bề mặt gốc để id không bị dùng lại cho một bề mặt khác
+flipped_surfaces = {}
+# (id danh sách/từ điển khung hình gốc, lật ngang, lật dọc) -> (khung hình gốc, khung hình đã lật)
+flipped_frames = {}
+
+
+def flip_surface(surf, flip_x=True, flip_y=False):
+    """
+    Lật một bề mặt, kết quả được lưu lại để mỗi bề mặt chỉ bị lật một lần cho mỗi cách lật
+        :param surf: Bề mặt cần lật
+        :param flip_x: Lật theo chiều ngang
+        :param flip_y: Lật theo chiều dọc
+        :return: Bề mặt đã lật (chính `surf` nếu không lật chiều nào)
+    """
+    if not flip_x and not flip_y:
+        return surf
+    key = (id(surf), flip_x, flip_y)
+    entry = flipped_surfaces.get(key)
+    if entry is None:
+        entry = flipped_surfaces[key] = (surf, pygame.transform.flip(surf, flip_x, flip_y))
+    return entry[1]
+
+
+def flip_frames(frames, flip_x=True, flip_y=False):
+    """
+    Lật tất cả các khung hình của một danh sách, hoặc của một từ điển trạng thái -> danh sách khung hình
+    Kết quả được lưu lại, cùng một bộ khung hình luôn trả về cùng một bộ khung hình đã lật
+        :param frames: Danh sách khung hình hoặc từ điển các danh sách khung hình
+        :param flip_x: Lật theo chiều ngang
+        :param flip_y: Lật theo chiều dọc
+        :return: Bộ khung hình đã lật, cùng kiểu với `frames`
+    """
+    if not flip_x and not flip_y:
+        return frames
+    key = (id(frames), flip_x, flip_y)
+    entry = flipped_frames.get(key)
+    if entry is None:
+        if isinstance(frames, dict):
+            flipped = {state: flip_frames(surfs, flip_x, flip_y) for state, surfs in frames.items()}
+        else:
+            flipped = [flip_surface(surf, flip_x, flip_y) for surf in frames]
+        entry = flipped_frames[key] = (frames, flipped)
+    return entry[1]
+
+
+def forget_frames(frames):
+    """
+    Xóa khỏi bộ nhớ đệm các khung hình đã lật và bóng trắng được tạo ra từ `frames`, dùng khi giải phóng tài nguyên
+        :param frames: Bề mặt, danh sách khung hình hoặc từ điển các danh sách khung hình
+    """
+    if isinstance(frames, dict):
+        for surfs in frames.values():
+            forget_frames(surfs)
+    elif isinstance(frames, list):
+        for surf in frames:
+            forget_frames(surf)
+    else:
+        silhouettes.pop(id(frames), None)
+    for flip_x, flip_y in ((True, False), (False, True), (True, True)):
+        for cache in (flipped_surfaces, flipped_frames):
+            entry = cache.pop((id(frames), flip_x, flip_y), None)
+            if entry:
+                forget_frames(entry[1])
+
+
+# id bề mặt gốc -> (bề mặt gốc, bóng trắng)
+silhouettes = {}
+
+
+def silhouette(surf):
+    """
+    Tạo bóng trắng (silhouette) của một bề mặt, dùng cho hiệu ứng nhấp nháy khi nhận sát thương
+    Kết quả được lưu lại nên mỗi bề mặt chỉ phải tạo mask một lần
+        :param surf: Bề mặt gốc
+        :return: Bề mặt trắng có cùng hình dạng với `surf`, phần còn lại trong suốt (colorkey đen)
+    """
+    entry = silhouettes.get(id(surf))
+    if entry is None:
+        white_surf = pygame.mask.from_surface(surf).to_surface()
+        white_surf.set_colorkey('black')
+        entry = silhouettes[id(surf)] = (surf, white_surf)
+    return entry[1]
+
+
+def silhouette_frames(frames):
+    """
+    Tạo sẵn bóng trắng cho tất cả các khung hình của một danh sách, hoặc của một từ điển trạng thái -> danh sách
+        :param frames: Danh sách khung hình hoặc từ điển các danh sách khung hình
+        :return: Bộ bóng trắng, cùng kiểu với `frames`
+    """
+    if isinstance(frames, dict):
+        return {state: silhouette_frames(surfs) for state, surfs in frames.items()}
+    return [silhouette(surf) for surf in frames]
+
+
+def bake_chunks(tiles, chunk_size=CHUNK_SIZE):
+    """
+    Vẽ sẵn (bake) các tile tĩnh vào các bề mặt chunk, mỗi chunk gồm `chunk_size` x `chunk_size` tile
+    Thay vì vẽ từng tile mỗi frame, mỗi chunk chỉ cần một lần blit. Chunk không có tile nào sẽ không được tạo,
+        chunk ở rìa level chỉ lớn vừa đủ chứa các tile của nó
+        :param tiles: Danh sách các tuple (x, y, surf) với x, y là tọa độ theo ô (tile) và theo thứ tự vẽ
+        :param chunk_size: Số tile mỗi chiều của một chunk
+        :return: Từ điển với vị trí góc trên trái (pixel) của chunk làm khóa và bề mặt chunk làm giá trị
+    """
+    return dict(iter_chunks(tiles, chunk_size))
+
+
+def iter_chunks(tiles, chunk_size=CHUNK_SIZE):
+    """
+    Giống `bake_chunks` nhưng trả về từng chunk ngay khi vẽ xong, để việc vẽ có thể được chia ra nhiều frame
+        :param tiles: Danh sách các tuple (x, y, surf) với x, y là tọa độ theo ô (tile) và theo thứ tự vẽ
+        :param chunk_size: Số tile mỗi chiều của một chunk
+        :return: Generator các tuple (vị trí góc trên trái (pixel) của chunk, bề mặt chunk)
+    """
+    chunk_tiles = {}
+    for x, y, surf in tiles:
+        chunk_tiles.setdefault((x // chunk_size, y // chunk_size), []).append((x, y, surf))
+
+    chunk_px = chunk_size * TILE_SIZE
+    for (col, row), chunk in chunk_tiles.items():
+        left, top = col * chunk_px, row * chunk_px
+        width = max(x * TILE_SIZE + surf.get_width() for x, y, surf in chunk) - left
+        height = max(y * TILE_SIZE + surf.get_height() for x, y, surf in chunk) - top
+        chunk_surf = pygame.Surface((width, height), pygame.SRCALPHA)
+        chunk_surf.fblits([(surf, (x * TILE_SIZE - left, y * TILE_SIZE - top)) for x, y, surf in chunk])
+        yield (left, top), chunk_surf.convert_alpha()
+
+
+def tile_surface(surf, cols, rows):
+    """
+    Tạo một bề mặt bằng cách lặp lại `surf` thành lưới `cols` x `rows`
+        :param surf: Bề mặt cần lặp lại
+        :param cols: Số lần lặp theo chiều ngang
+        :param rows: Số lần lặp theo chiều dọc
+        :return: Bề mặt đã được lặp lại
+    """
+    width, height = surf.get_size()
+    result = pygame.Surface((width * cols, height * rows), pygame.SRCALPHA)
+    result.fblits([(surf, (col * width, row * height)) for col in range(cols) for row in range(rows)])
+    return result.convert_alpha()
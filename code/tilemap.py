@@ -0,0 +1,366 @@
+"""
+Biên dịch (compile) bản đồ Tiled (TMX) sang định dạng nhị phân gọn để không phải phân tích XML mỗi lần chạy game
+Bản đồ đã biên dịch gồm mảng gid của từng tile layer, bảng object kèm properties và mô tả ảnh (file tileset, vùng cắt,
+    cách lật) của từng gid. File được lưu trong data/cache/maps và chỉ được biên dịch lại khi file TMX hoặc TSX thay đổi
+    (so sánh thời gian sửa, nếu khác thì so sánh mã băm nội dung)
+`TileMap` có cùng giao diện với bản đồ của pytmx mà Level và Overworld sử dụng: `width`, `height`,
+    `get_layer_by_name(name)`, `.tiles()` của tile layer và các object với `x`, `y`, `width`, `height`, `name`,
+    `properties`, `image`, `points`
+Biên dịch trước tất cả bản đồ:
+    python code/tilemap.py
+"""
+import os
+import pickle
+from array import array
+from collections import namedtuple
+from weakref import WeakValueDictionary
+from settings import *
+from os import makedirs, listdir
+from os.path import join, dirname, exists, relpath, normpath, splitext
+from xml.etree import ElementTree
+from pytmx import TiledMap, TiledTileLayer, TiledObjectGroup, TileFlags
+from pytmx.util_pygame import handle_transformation, smart_convert
+from support import load_image, file_hash, is_fresh
+
+MAP_CACHE_DIR = join('.', 'data', 'cache', 'maps')
+MAP_VERSION = 1
+LEVEL_DIR = join('.', 'data', 'levels')
+OVERWORLD_MAP = join('.', 'data', 'overworld', 'overworld.tmx')
+
+Point = namedtuple('Point', 'x y')
+
+# (file ảnh tileset, colorkey, pixelalpha, vùng cắt, cách lật) -> bề mặt tile, dùng chung cho mọi bản đồ
+# Tile tự bị xóa khỏi bộ nhớ đệm khi không còn bản đồ nào giữ nó
+tile_cache = WeakValueDictionary()
+
+
+def level_files(directory=LEVEL_DIR):
+    """
+    Tìm các bản đồ màn chơi trong thư mục, sắp xếp theo số thứ tự trong tên file (1.tmx, 2.tmx, ..., 10.tmx)
+        :param directory: Thư mục chứa các file TMX của màn chơi
+        :return: Danh sách đường dẫn, vị trí trong danh sách là chỉ số màn chơi
+    """
+    def order(name):
+        stem = splitext(name)[0]
+        return (0, int(stem), '') if stem.isdigit() else (1, 0, stem)
+
+    return [join(directory, name) for name in sorted(listdir(directory), key=order) if name.endswith('.tmx')]
+
+
+def map_files():
+    """
+    Liệt kê tất cả bản đồ của game: các màn chơi và overworld
+        :return: Danh sách đường dẫn file TMX
+    """
+    return level_files() + [OVERWORLD_MAP]
+
+
+def source_files(path):
+    """
+    Liệt kê các file nguồn của một bản đồ: file TMX và các file TSX được tham chiếu
+        :param path: Đường dẫn file TMX
+        :return: Danh sách đường dẫn
+    """
+    files = [path]
+    for tileset in ElementTree.parse(path).getroot().iter('tileset'):
+        source = tileset.get('source')
+        if source:
+            files.append(normpath(join(dirname(path), source)))
+    return files
+
+
+def record_image(filename, colorkey, **kwargs):
+    """
+    Hàm tải ảnh dùng cho pytmx khi biên dịch: không tải ảnh mà chỉ ghi lại cách tạo ảnh của từng gid
+        :param filename: Đường dẫn ảnh tileset
+        :param colorkey: Màu trong suốt của tileset (nếu có)
+        :return: Hàm trả về mô tả ảnh (file, colorkey, pixelalpha, vùng cắt, cách lật)
+    """
+    pixelalpha = kwargs.get('pixelalpha', True)
+
+    def describe(rect=None, flags=None):
+        return filename, colorkey, pixelalpha, tuple(rect) if rect else None, tuple(flags) if flags else None
+
+    return describe
+
+
+def compile_map(path):
+    """
+    Phân tích một file TMX bằng pytmx và chuyển thành dữ liệu gọn có thể lưu bằng pickle
+        :param path: Đường dẫn file TMX
+        :return: Từ điển chứa dữ liệu bản đồ đã biên dịch
+    """
+    tiled_map = TiledMap(path, image_loader=record_image)
+    map_dir = dirname(path)
+
+    images = []
+    for image in tiled_map.images:
+        if image:
+            filename, colorkey, pixelalpha, rect, flags = image
+            image = (relpath(filename, map_dir), colorkey, pixelalpha, rect, flags)
+        images.append(image)
+
+    layers = []
+    for layer in tiled_map.layers:
+        compiled = {'name': layer.name, 'properties': dict(layer.properties), 'data': None, 'objects': None}
+        if isinstance(layer, TiledTileLayer):
+            compiled['width'] = layer.width
+            compiled['data'] = array('H', (gid for row in layer.data for gid in row))
+        elif isinstance(layer, TiledObjectGroup):
+            compiled['objects'] = [{
+                'id': obj.id,
+                'name': obj.name,
+                'type': obj.type,
+                'x': obj.x,
+                'y': obj.y,
+                'width': obj.width,
+                'height': obj.height,
+                'gid': obj.gid,
+                'properties': dict(obj.properties),
+                'points': [tuple(point) for point in obj.points] if hasattr(obj, 'points') else None,
+            } for obj in layer]
+        layers.append(compiled)
+
+    return {
+        'version': MAP_VERSION,
+        'sources': {source: (os.stat(source).st_mtime_ns, file_hash(source)) for source in source_files(path)},
+        'width': tiled_map.width,
+        'height': tiled_map.height,
+        'tilewidth': tiled_map.tilewidth,
+        'tileheight': tiled_map.tileheight,
+        'properties': dict(tiled_map.properties),
+        'images': images,
+        'layers': layers,
+    }
+
+
+def cache_path(path, cache_dir=MAP_CACHE_DIR):
+    """
+    Đường dẫn file đã biên dịch của một bản đồ
+        :param path: Đường dẫn file TMX
+        :param cache_dir: Thư mục lưu bản đồ đã biên dịch
+        :return: Đường dẫn file .map
+    """
+    return join(cache_dir, normpath(path).replace(os.sep, '__') + '.map')
+
+
+def read_compiled(path):
+    """
+    Đọc bản đồ đã biên dịch
+        :param path: Đường dẫn file .map
+        :return: Từ điển dữ liệu bản đồ, hoặc None nếu chưa có hoặc được tạo bởi phiên bản khác
+    """
+    if not exists(path):
+        return None
+    with open(path, 'rb') as file:
+        compiled = pickle.load(file)
+    return compiled if compiled.get('version') == MAP_VERSION else None
+
+
+def build(path, cache_dir=MAP_CACHE_DIR):
+    """
+    Biên dịch bản đồ và lưu vào thư mục cache
+        :param path: Đường dẫn file TMX
+        :param cache_dir: Thư mục lưu bản đồ đã biên dịch
+        :return: Từ điển dữ liệu bản đồ đã biên dịch
+    """
+    compiled = compile_map(path)
+    makedirs(cache_dir, exist_ok=True)
+    with open(cache_path(path, cache_dir), 'wb') as file:
+        pickle.dump(compiled, file, pickle.HIGHEST_PROTOCOL)
+    return compiled
+
+
+def read_map(path, cache_dir=MAP_CACHE_DIR):
+    """
+    Đọc dữ liệu bản đồ, dùng bản đã biên dịch nếu các file nguồn không thay đổi, nếu không thì biên dịch lại
+    Không tạo bề mặt nào nên có thể gọi trong luồng nền
+        :param path: Đường dẫn file TMX
+        :param cache_dir: Thư mục lưu bản đồ đã biên dịch
+        :return: Từ điển dữ liệu bản đồ đã biên dịch
+    """
+    compiled = read_compiled(cache_path(path, cache_dir))
+    if compiled is None or not is_fresh(compiled['sources']):
+        compiled = build(path, cache_dir)
+    return compiled
+
+
+def load_map(path, cache_dir=MAP_CACHE_DIR):
+    """
+    Tải bản đồ (đọc dữ liệu bằng `read_map` rồi tạo ảnh của các tile)
+        :param path: Đường dẫn file TMX
+        :param cache_dir: Thư mục lưu bản đồ đã biên dịch
+        :return: Đối tượng TileMap
+    """
+    return TileMap(read_map(path, cache_dir), dirname(path))
+
+
+class TileLayer:
+    """
+    Tile layer của bản đồ đã biên dịch
+    * Phương thức
+    `tiles()`: Duyệt các ô có tile, trả về (x, y, bề mặt) giống pytmx
+    """
+    def __init__(self, tile_map, name, properties, width, data):
+        """
+        Hàm khởi tạo
+            :param tile_map: Bản đồ chứa layer
+            :param name: Tên layer
+            :param properties: Các thuộc tính của layer
+            :param width: Số ô theo chiều ngang
+            :param data: Mảng gid của tất cả các ô, theo từng hàng
+        """
+        self.tile_map = tile_map
+        self.name = name
+        self.properties = properties
+        self.width = width
+        self.data = data
+
+    def __iter__(self):
+        width = self.width
+        for index, gid in enumerate(self.data):
+            yield index % width, index // width, gid
+
+    def tiles(self):
+        """
+        Duyệt các ô có tile
+            :return: Generator các tuple (x, y, bề mặt) với x, y là tọa độ theo ô
+        """
+        images = self.tile_map.images
+        for x, y, gid in self:
+            if gid:
+                yield x, y, images[gid]
+
+
+class ObjectLayer(list):
+    """
+    Object layer của bản đồ đã biên dịch, là danh sách các MapObject
+    """
+    def __init__(self, name, properties, objects):
+        """
+        Hàm khởi tạo
+            :param name: Tên layer
+            :param properties: Các thuộc tính của layer
+            :param objects: Danh sách các MapObject
+        """
+        super().__init__(objects)
+        self.name = name
+        self.properties = properties
+
+
+class MapObject:
+    """
+    Object của bản đồ đã biên dịch với các thuộc tính giống object của pytmx
+    """
+    def __init__(self, tile_map, id, name, type, x, y, width, height, gid, properties, points):
+        """
+        Hàm khởi tạo
+            :param tile_map: Bản đồ chứa object
+            Các tham số còn lại là thuộc tính của object trong Tiled
+        """
+        self.id = id
+        self.name = name
+        self.type = type
+        self.x, self.y = x, y
+        self.width, self.height = width, height
+        self.gid = gid
+        self.properties = properties
+        if points is not None:
+            self.points = [Point(*point) for point in points]
+        self.image = tile_map.images[gid] if gid else None
+
+
+class TileMap:
+    """
+    Bản đồ đã biên dịch, thay cho bản đồ được tải bằng `pytmx.util_pygame.load_pygame`
+    Ảnh của các gid được cắt từ ảnh tileset (mỗi file chỉ tải một lần, qua nguồn ảnh của support.py nếu có)
+        và chỉ các gid thực sự được dùng trong bản đồ mới được tạo
+    Các bản đồ dùng chung tileset (cùng file TSX) dùng chung bề mặt tile qua `tile_cache`
+    * Phương thức
+    `get_layer_by_name(name)`: Lấy layer theo tên
+    `memory_size()`: Ước lượng bộ nhớ mà bản đồ chiếm
+    """
+    def __init__(self, compiled, map_dir):
+        """
+        Hàm khởi tạo
+            :param compiled: Dữ liệu bản đồ đã biên dịch
+            :param map_dir: Thư mục chứa file TMX (đường dẫn ảnh được lưu tương đối với thư mục này)
+        """
+        self.width, self.height = compiled['width'], compiled['height']
+        self.tilewidth, self.tileheight = compiled['tilewidth'], compiled['tileheight']
+        self.properties = compiled['properties']
+
+        used = set()
+        for layer in compiled['layers']:
+            if layer['data'] is not None:
+                used.update(layer['data'])
+            if layer['objects'] is not None:
+                used.update(obj['gid'] for obj in layer['objects'])
+        self.images = [None] * len(compiled['images'])
+        tilesets = {}
+        for gid in used:
+            if gid and compiled['images'][gid]:
+                self.images[gid] = self.create_image(compiled['images'][gid], map_dir, tilesets)
+
+        self.layers = []
+        for layer in compiled['layers']:
+            if layer['data'] is not None:
+                self.layers.append(TileLayer(self, layer['name'], layer['properties'], layer['width'], layer['data']))
+            elif layer['objects'] is not None:
+                objects = [MapObject(self, **obj) for obj in layer['objects']]
+                self.layers.append(ObjectLayer(layer['name'], layer['properties'], objects))
+        self.layernames = {layer.name: layer for layer in self.layers}
+
+    @staticmethod
+    def create_image(description, map_dir, tilesets):
+        """
+        Tạo ảnh của một gid giống cách pytmx tạo: cắt vùng từ ảnh tileset, lật/xoay rồi chuyển định dạng
+        Tile đã được bản đồ khác tạo thì được dùng lại từ `tile_cache`
+            :param description: Mô tả ảnh (file, colorkey, pixelalpha, vùng cắt, cách lật)
+            :param map_dir: Thư mục chứa file TMX
+            :param tilesets: Từ điển đường dẫn -> ảnh tileset đã tải
+            :return: Bề mặt của gid
+        """
+        filename, colorkey, pixelalpha, rect, flags = description
+        filename = normpath(join(map_dir, filename))
+        key = (filename, colorkey, pixelalpha, rect, flags)
+        tile = tile_cache.get(key)
+        if tile is not None:
+            return tile
+
+        if filename not in tilesets:
+            tilesets[filename] = load_image(filename)
+        image = tilesets[filename]
+        tile = image.subsurface(rect) if rect else image.copy()
+        if flags:
+            tile = handle_transformation(tile, TileFlags(*flags))
+        if colorkey:
+            colorkey = pygame.Color(f'#{colorkey}')
+        tile = tile_cache[key] = smart_convert(tile, colorkey, pixelalpha)
+        return tile
+
+    def get_layer_by_name(self, name):
+        """
+        Lấy layer theo tên
+            :param name: Tên layer
+            :return: TileLayer hoặc ObjectLayer
+        """
+        return self.layernames[name]
+
+    def memory_size(self):
+        """
+        Ước lượng bộ nhớ mà bản đồ chiếm: các bề mặt tile (kể cả tile dùng chung với bản đồ khác) và mảng gid
+            :return: Số byte
+        """
+        surfaces = {id(image): image for image in self.images if image}.values()
+        size = sum(image.get_pitch() * image.get_height() for image in surfaces)
+        for layer in self.layers:
+            if isinstance(layer, TileLayer):
+                size += layer.data.itemsize * len(layer.data)
+        return size
+
+
+if __name__ == '__main__':
+    for path in map_files():
+        compiled = build(path)
+        print(f'compiled {path}: {len(compiled["layers"])} layers -> {cache_path(path)}')
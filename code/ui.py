@@ -35,6 +35,9 @@ class UI:
         self.coin_timer = Timer(1000)
         self.coin_surf = frames['coin']
 
+        # Vùng màn hình mà UI đã vẽ ở frame gần nhất, dùng cho chế độ dirty rect
+        self.rect = pygame.Rect()
+
     def create_hearts(self, amount):
         """
         Hàm tạo và hiển trị trái tim
@@ -58,6 +61,7 @@ class UI:
         Hàm hiển thị số lượng xu hiện tại
         Hiển thị số lượng xu hiện tại và biểu tượng xu trên màn hình
         Phương thức này hiển thị số lượng xu đã thu thập được dưới dạng văn bản và biểu tượng xu trên bề mặt hiển thị UI
+            :return: Vùng màn hình chứa chữ và biểu tượng xu
         """
         # Hiển thị chữ
         text_surf = self.font.render(str(self.coin_amount), False, 'white')
@@ -67,6 +71,7 @@ class UI:
         # Hiển thị hình đồng xu
         coin_rect = self.coin_surf.get_frect(center=text_rect.midbottom).move(0, 10)
         self.display_surface.blit(self.coin_surf, coin_rect)
+        return text_rect.union(coin_rect)
 
     def show_coins(self, amount):
         """
@@ -86,11 +91,13 @@ class UI:
             Cập nhật trạng thái của các sprite UI (ví dụ như hoạt ảnh) dựa trên thời gian trôi qua `dt`
             Vẽ tất cả các sprite UI lên bề mặt hiển thị chính
             Hiển thị số lượng xu hiện tại và biểu tượng xu
+        Vùng màn hình đã vẽ được lưu vào `rect`
             :param dt: Thời gian trôi qua
         """
         self.sprites.update(dt)
         self.sprites.draw(self.display_surface)
-        self.display_text()
+        text_rect = self.display_text()
+        self.rect = pygame.Rect(text_rect).unionall([sprite.rect for sprite in self.sprites]).inflate(2, 2)
 
 
 class Heart(AnimatedSprite):